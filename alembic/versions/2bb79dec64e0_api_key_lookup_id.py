@@ -0,0 +1,37 @@
+"""api key lookup id
+
+Revision ID: 2bb79dec64e0
+Revises: 052d31179dc3
+Create Date: 2026-10-17 09:12:41.532118
+
+Existing keys keep a NULL lookup_id and key_digest. They are still accepted
+through the bcrypt fallback in Oauth2.find_api_key, which fills in key_digest on
+first use; after that they are served by the indexed digest lookup.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2bb79dec64e0'
+down_revision: Union[str, Sequence[str], None] = '052d31179dc3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('api_keys', sa.Column('lookup_id', sa.String(), nullable=True))
+    op.add_column('api_keys', sa.Column('key_digest', sa.String(), nullable=True))
+    op.create_index(op.f('ix_api_keys_lookup_id'), 'api_keys', ['lookup_id'], unique=True)
+    op.create_index(op.f('ix_api_keys_key_digest'), 'api_keys', ['key_digest'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_api_keys_key_digest'), table_name='api_keys')
+    op.drop_index(op.f('ix_api_keys_lookup_id'), table_name='api_keys')
+    op.drop_column('api_keys', 'key_digest')
+    op.drop_column('api_keys', 'lookup_id')
@@ -0,0 +1,47 @@
+"""deferred ledger materialization
+
+Revision ID: 9f3b6d21c8a4
+Revises: e5a90c3f7b12
+Create Date: 2026-10-17 15:22:54.107836
+
+Existing ledger entries were applied to balances when they were posted, so
+they are marked materialized.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f3b6d21c8a4'
+down_revision: Union[str, Sequence[str], None] = 'e5a90c3f7b12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ledger_transactions', sa.Column('materialized', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+    op.create_index(
+        'ix_ledger_unmaterialized_credit', 'ledger_transactions', ['credit_account_id'],
+        unique=False, postgresql_where=sa.text('materialized = false')
+    )
+    op.create_index(
+        'ix_ledger_unmaterialized_debit', 'ledger_transactions', ['debit_account_id'],
+        unique=False, postgresql_where=sa.text('materialized = false')
+    )
+    op.create_table('ledger_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_entry_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ledger_checkpoints')
+    op.drop_index('ix_ledger_unmaterialized_debit', table_name='ledger_transactions', postgresql_where=sa.text('materialized = false'))
+    op.drop_index('ix_ledger_unmaterialized_credit', table_name='ledger_transactions', postgresql_where=sa.text('materialized = false'))
+    op.drop_column('ledger_transactions', 'materialized')
@@ -0,0 +1,28 @@
+"""ledger history keyset index
+
+Revision ID: a3d58f0b6e21
+Revises: b92d6e4f1c08
+Create Date: 2026-10-18 01:05:37.842193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d58f0b6e21'
+down_revision: Union[str, Sequence[str], None] = 'b92d6e4f1c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_ledger_merchant_created_id', 'ledger_transactions', ['merchant_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ledger_merchant_created_id', table_name='ledger_transactions')
@@ -0,0 +1,30 @@
+"""settlement run error
+
+Revision ID: a3f81c6d2e94
+Revises: d4b7e2a91c53
+Create Date: 2026-10-18 09:41:12.286531
+
+Adds settlement_runs.error, set with status 'failed' when a shard task of
+the run fails for good and its chord never reaches finish_settlement_run_task.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f81c6d2e94'
+down_revision: Union[str, Sequence[str], None] = 'd4b7e2a91c53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('settlement_runs', sa.Column('error', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('settlement_runs', 'error')
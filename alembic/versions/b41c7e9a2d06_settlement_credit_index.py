@@ -0,0 +1,28 @@
+"""settlement credit index
+
+Revision ID: b41c7e9a2d06
+Revises: 9f3b6d21c8a4
+Create Date: 2026-10-17 16:48:11.530217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c7e9a2d06'
+down_revision: Union[str, Sequence[str], None] = '9f3b6d21c8a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_ledger_credit_account_created', 'ledger_transactions', ['credit_account_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ledger_credit_account_created', table_name='ledger_transactions')
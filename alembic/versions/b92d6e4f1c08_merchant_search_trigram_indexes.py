@@ -0,0 +1,37 @@
+"""merchant search trigram indexes
+
+Revision ID: b92d6e4f1c08
+Revises: e7b14c9f3a52
+Create Date: 2026-10-17 23:48:19.274051
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b92d6e4f1c08'
+down_revision: Union[str, Sequence[str], None] = 'e7b14c9f3a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_users_email_trgm', 'users', 'email'),
+    ('ix_users_name_trgm', 'users', 'name'),
+    ('ix_merchant_accounts_merchant_id_trgm', 'merchant_accounts', 'merchant_id'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,39 @@
+"""notification counters
+
+Revision ID: c5e92b4d7a13
+Revises: a8d3f5c71e20
+Create Date: 2026-10-17 22:31:06.842117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e92b4d7a13'
+down_revision: Union[str, Sequence[str], None] = 'a8d3f5c71e20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notification_counters',
+    sa.Column('merchant_id', sa.String(), nullable=False),
+    sa.Column('unread', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['merchant_id'], ['merchant_accounts.merchant_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('merchant_id')
+    )
+    op.execute("""
+        INSERT INTO notification_counters (merchant_id, unread)
+        SELECT merchant_id, count(*) FROM notifications
+        WHERE merchant_id IS NOT NULL AND NOT is_read
+        GROUP BY merchant_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('notification_counters')
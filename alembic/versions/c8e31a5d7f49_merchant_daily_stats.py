@@ -0,0 +1,41 @@
+"""merchant daily stats
+
+Revision ID: c8e31a5d7f49
+Revises: f1c7a2e94b36
+Create Date: 2026-10-18 03:02:44.617209
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e31a5d7f49'
+down_revision: Union[str, Sequence[str], None] = 'f1c7a2e94b36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTS = ['charge_count', 'failed_charge_count', 'payout_count', 'refund_count']
+AMOUNTS = ['gross_volume', 'fees', 'net_volume', 'payout_volume', 'refund_volume']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('merchant_daily_stats',
+    sa.Column('merchant_id', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    *[sa.Column(name, sa.Integer(), server_default='0', nullable=False) for name in COUNTS],
+    *[sa.Column(name, sa.Numeric(precision=19, scale=4), server_default='0', nullable=False) for name in AMOUNTS],
+    sa.ForeignKeyConstraint(['merchant_id'], ['merchant_accounts.merchant_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('merchant_id', 'day', 'currency')
+    )
+    op.create_index('ix_merchant_daily_stats_day', 'merchant_daily_stats', ['day'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_merchant_daily_stats_day', table_name='merchant_daily_stats')
+    op.drop_table('merchant_daily_stats')
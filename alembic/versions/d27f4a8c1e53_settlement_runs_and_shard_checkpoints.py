@@ -0,0 +1,52 @@
+"""settlement runs and shard checkpoints
+
+Revision ID: d27f4a8c1e53
+Revises: b41c7e9a2d06
+Create Date: 2026-10-17 18:05:37.214590
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd27f4a8c1e53'
+down_revision: Union[str, Sequence[str], None] = 'b41c7e9a2d06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('settlement_runs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('run_date', sa.Date(), nullable=False),
+    sa.Column('as_of', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('shard_count', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('merchants_settled', sa.Integer(), nullable=False),
+    sa.Column('totals', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('run_date')
+    )
+    op.create_table('settlement_shard_checkpoints',
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('last_merchant_id', sa.Integer(), nullable=False),
+    sa.Column('merchants_settled', sa.Integer(), nullable=False),
+    sa.Column('totals', sa.String(), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['run_id'], ['settlement_runs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('run_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('settlement_shard_checkpoints')
+    op.drop_table('settlement_runs')
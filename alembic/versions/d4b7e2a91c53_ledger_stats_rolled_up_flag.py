@@ -0,0 +1,38 @@
+"""ledger stats rolled up flag
+
+Revision ID: d4b7e2a91c53
+Revises: c8e31a5d7f49
+Create Date: 2026-10-18 04:12:37.508164
+
+Adds ledger_transactions.stats_rolled_up, which MerchantStatsService.rollup
+sets on the entries it folds into merchant_daily_stats. Existing entries are
+marked as rolled up, since scripts/backfill_merchant_stats.py covers history;
+entries posted from now on start unset. The column is added with a constant
+default, so existing rows are not rewritten.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4b7e2a91c53'
+down_revision: Union[str, Sequence[str], None] = 'c8e31a5d7f49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ledger_transactions', sa.Column('stats_rolled_up', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+    op.alter_column('ledger_transactions', 'stats_rolled_up', server_default=sa.text('false'))
+    op.create_index('ix_ledger_stats_pending', 'ledger_transactions', ['id'], unique=False,
+                    postgresql_where=sa.text('stats_rolled_up = false'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ledger_stats_pending', table_name='ledger_transactions',
+                  postgresql_where=sa.text('stats_rolled_up = false'))
+    op.drop_column('ledger_transactions', 'stats_rolled_up')
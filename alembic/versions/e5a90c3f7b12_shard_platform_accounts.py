@@ -0,0 +1,54 @@
+"""shard platform accounts
+
+Revision ID: e5a90c3f7b12
+Revises: 7c41e2a9d5b3
+Create Date: 2026-10-17 13:41:09.318274
+
+Existing platform accounts become shard 0. Further shards are created on first
+use by PlatformAccountService.get_account.
+
+Platform accounts used to be created on first use without a unique
+constraint (merchant_id is NULL, so the old one never applied), so a
+(account_type, currency) can already have several rows. Those are numbered
+as shards 0..n-1 in id order before the unique index is built: balances and
+ledger entries stay where they are, the logical balance is still their sum,
+and rollup_shards folds them into shard 0.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a90c3f7b12'
+down_revision: Union[str, Sequence[str], None] = '7c41e2a9d5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('accounts', sa.Column('shard', sa.Integer(), server_default='0', nullable=False))
+    op.drop_constraint('_merchant_account_type_currency_uc', 'accounts', type_='unique')
+    op.create_unique_constraint('_merchant_account_type_currency_uc', 'accounts', ['merchant_id', 'account_type', 'currency', 'shard'])
+    op.execute("""
+        UPDATE accounts SET shard = numbered.shard
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY account_type, currency ORDER BY id) - 1 AS shard
+            FROM accounts WHERE merchant_id IS NULL
+        ) numbered
+        WHERE accounts.id = numbered.id AND numbered.shard > 0
+    """)
+    op.create_index(
+        'uq_platform_account_shard', 'accounts', ['account_type', 'currency', 'shard'],
+        unique=True, postgresql_where=sa.text('merchant_id IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_platform_account_shard', table_name='accounts', postgresql_where=sa.text('merchant_id IS NULL'))
+    op.drop_constraint('_merchant_account_type_currency_uc', 'accounts', type_='unique')
+    op.create_unique_constraint('_merchant_account_type_currency_uc', 'accounts', ['merchant_id', 'account_type', 'currency'])
+    op.drop_column('accounts', 'shard')
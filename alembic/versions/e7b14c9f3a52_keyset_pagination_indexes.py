@@ -0,0 +1,41 @@
+"""keyset pagination indexes
+
+Revision ID: e7b14c9f3a52
+Revises: c5e92b4d7a13
+Create Date: 2026-10-17 23:12:40.518304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b14c9f3a52'
+down_revision: Union[str, Sequence[str], None] = 'c5e92b4d7a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_charges_created_id', 'charges', ['created_at', 'id']),
+    ('ix_charges_user_created_id', 'charges', ['user_id', 'created_at', 'id']),
+    ('ix_merchant_accounts_created_id', 'merchant_accounts', ['created_at', 'id']),
+    ('ix_payouts_created_id', 'payouts', ['created_at', 'id']),
+    ('ix_payouts_merchant_created_id', 'payouts', ['merchant_id', 'created_at', 'id']),
+    ('ix_audit_logs_created_id', 'audit_logs', ['created_at', 'id']),
+    ('ix_audit_logs_user_created_id', 'audit_logs', ['user_id', 'created_at', 'id']),
+    ('ix_notifications_merchant_created_id', 'notifications', ['merchant_id', 'created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
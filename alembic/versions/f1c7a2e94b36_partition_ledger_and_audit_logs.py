@@ -0,0 +1,91 @@
+"""partition ledger and audit logs by month
+
+Revision ID: f1c7a2e94b36
+Revises: a3d58f0b6e21
+Create Date: 2026-10-18 02:21:06.193478
+
+Rebuilds ledger_transactions and audit_logs as tables range-partitioned by
+month on created_at, copying their rows. The primary keys become
+(id, created_at), since a partitioned table's unique keys must include the
+partition key. Secondary indexes and foreign keys are recreated under their
+existing names. Partitions run from the oldest row's month to MONTHS_AHEAD
+months from now, plus a default partition. After that PartitionService
+creates new months and archives old ones. The copy rewrites both tables, so
+run this in a maintenance window.
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a2e94b36'
+down_revision: Union[str, Sequence[str], None] = 'a3d58f0b6e21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['ledger_transactions', 'audit_logs']
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _definitions(table: str) -> tuple[list[str], list[tuple[str, str]], str]:
+    """The table's secondary index DDL, its foreign keys and its id sequence."""
+    conn = op.get_bind()
+    indexes = conn.execute(sa.text(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table AND indexname <> :pkey"
+    ), {"table": table, "pkey": f"{table}_pkey"}).scalars().all()
+    foreign_keys = conn.execute(sa.text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'f'"
+    ), {"table": table}).all()
+    sequence = conn.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+    return indexes, foreign_keys, sequence
+
+
+def _rebuild(table: str, partitioned: bool) -> None:
+    indexes, foreign_keys, sequence = _definitions(table)
+    old = f"{table}_old"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    if partitioned:
+        op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)")
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        first = op.get_bind().execute(sa.text(f"SELECT min(created_at) FROM {old}")).scalar()
+        month = min(first.astimezone(timezone.utc).date().replace(day=1), this_month) if first else this_month
+        while month <= _add_months(this_month, MONTHS_AHEAD):
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{_add_months(month, 1)} 00:00:00+00')"
+            )
+            month = _add_months(month, 1)
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    else:
+        op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {old}")
+
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({'id, created_at' if partitioned else 'id'})")
+    for definition in indexes:
+        op.execute(definition)
+    for name, definition in foreign_keys:
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    op.execute(f"ANALYZE {table}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        _rebuild(table, partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Rows in partitions already archived and dropped are not restored.
+    for table in reversed(TABLES):
+        _rebuild(table, partitioned=False)
@@ -0,0 +1,34 @@
+"""webhook retry schedule
+
+Revision ID: f6a2c8d4b197
+Revises: d27f4a8c1e53
+Create Date: 2026-10-17 20:12:48.661402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a2c8d4b197'
+down_revision: Union[str, Sequence[str], None] = 'd27f4a8c1e53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('webhook_deliveries', sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_webhook_deliveries_pending', 'webhook_deliveries', ['id'], unique=False, postgresql_where=sa.text("status = 'pending'"))
+    op.create_index('ix_webhook_deliveries_retry_due', 'webhook_deliveries', ['next_attempt_at'], unique=False, postgresql_where=sa.text("status = 'retrying'"))
+    op.create_index('ix_webhook_deliveries_sending', 'webhook_deliveries', ['last_attempt_at'], unique=False, postgresql_where=sa.text("status = 'sending'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_webhook_deliveries_sending', table_name='webhook_deliveries', postgresql_where=sa.text("status = 'sending'"))
+    op.drop_index('ix_webhook_deliveries_retry_due', table_name='webhook_deliveries', postgresql_where=sa.text("status = 'retrying'"))
+    op.drop_index('ix_webhook_deliveries_pending', table_name='webhook_deliveries', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_column('webhook_deliveries', 'next_attempt_at')
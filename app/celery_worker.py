@@ -23,6 +23,34 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.settle_pending_funds_task",
         'schedule': crontab(hour=0, minute=5),
     },
+    "flush_api_key_usage": {
+        "task": "app.tasks.flush_api_key_usage_task",
+        "schedule": float(os.getenv("API_KEY_USAGE_FLUSH_SECONDS", "30")),
+    },
+    "rollup_platform_account_shards": {
+        "task": "app.tasks.rollup_platform_account_shards_task",
+        "schedule": crontab(minute=30),
+    },
+    "retry_webhook_deliveries": {
+        "task": "app.tasks.retry_webhook_deliveries_task",
+        "schedule": float(os.getenv("WEBHOOK_RETRY_SWEEP_SECONDS", "10")),
+    },
+    "relay_outbox": {
+        "task": "app.tasks.relay_outbox_task",
+        "schedule": float(os.getenv("OUTBOX_RELAY_SECONDS", "1")),
+    },
+    "materialize_ledger_balances": {
+        "task": "app.tasks.materialize_ledger_balances_task",
+        "schedule": float(os.getenv("LEDGER_MATERIALIZE_SECONDS", "5")),
+    },
+    "rollup_merchant_stats": {
+        "task": "app.tasks.rollup_merchant_stats_task",
+        "schedule": float(os.getenv("STATS_ROLLUP_SECONDS", "60")),
+    },
+    "maintain_partitions": {
+        "task": "app.tasks.maintain_partitions_task",
+        "schedule": crontab(hour=1, minute=15),
+    },
 }
 
 
@@ -4,6 +4,7 @@ import enum
 from sqlalchemy.orm import relationship, foreign
 from ..utilities.db_con import Base
 from sqlalchemy import (
+    DDL,
     ForeignKey,
     Integer,
     String,
@@ -14,9 +15,33 @@ from sqlalchemy import (
     UniqueConstraint,
     Enum as SAEnum,
     DateTime,
+    Date,
+    Index,
+    event,
+    text,
 )
 from sqlalchemy.sql import func
 
+# Trigram indexes (admin merchant search) need pg_trgm. They are skipped on SQLite, and on
+# PostgreSQL servers without the extension installed, where search still works unindexed.
+event.listen(Base.metadata, "before_create", DDL("""
+    DO $$ BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'pg_trgm is not available, trigram indexes are skipped';
+    END $$
+""").execute_if(dialect="postgresql"))
+
+
+def _has_trigrams(ddl, target, bind, **kw) -> bool:
+    return bind.dialect.name == "postgresql" and bool(
+        bind.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").scalar()
+    )
+
+
+def _trigram_index(name: str, column: str) -> Index:
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}).ddl_if(callable_=_has_trigrams)
+
 
 class BusinessType(enum.Enum):
     Starter = "Starter"
@@ -55,6 +80,11 @@ class User(Base):
     verified_info = relationship("UserVerified", back_populates="user", uselist=False)
     merchant_info = relationship("MerchantAccount", back_populates="user_info", uselist=False)
 
+    __table_args__ = (
+        _trigram_index('ix_users_email_trgm', 'email'),
+        _trigram_index('ix_users_name_trgm', 'name'),
+    )
+
 
 class UserVerified(Base):
     __tablename__ = "user_verified"
@@ -90,7 +120,11 @@ class Charge(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     user = relationship("User", back_populates="charges")
     __table_args__ = (
-        UniqueConstraint('user_id', 'idempotency_key', name='_user_idempotency_uc'),)
+        UniqueConstraint('user_id', 'idempotency_key', name='_user_idempotency_uc'),
+        # Keyset pagination: newest first by (created_at, id), overall and per user.
+        Index('ix_charges_created_id', 'created_at', 'id'),
+        Index('ix_charges_user_created_id', 'user_id', 'created_at', 'id'),
+    )
 
 
 class RefreshToken(Base):
@@ -181,6 +215,11 @@ class MerchantAccount(Base):
 
     payout_info = relationship("Payout", back_populates="merchant")
 
+    __table_args__ = (
+        Index('ix_merchant_accounts_created_id', 'created_at', 'id'),
+        _trigram_index('ix_merchant_accounts_merchant_id_trgm', 'merchant_id'),
+    )
+
 
 class TransactionLimit(Base):
     __tablename__ = "transaction_limits"
@@ -221,6 +260,8 @@ class APIKey(Base):
     name = Column(String, nullable=False)
     api_key = Column(String, nullable=False, unique=True)
     key_prefix = Column(String, nullable=False)
+    lookup_id = Column(String, nullable=True, unique=True, index=True)
+    key_digest = Column(String, nullable=True, unique=True, index=True)
     key_type = Column(String, nullable=False)
     environment = Column(String, nullable=False, default="test")
 
@@ -231,6 +272,14 @@ class APIKey(Base):
     revoke_reason = Column(String, nullable=True)
 
 
+class APIKeyUsageDaily(Base):
+    __tablename__ = "api_key_usage_daily"
+
+    api_key_id = Column(Integer, ForeignKey("api_keys.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    request_count = Column(Integer, nullable=False, default=0)
+
+
 class WebhookEndpoint(Base):
     __tablename__ = "webhook_endpoints"
 
@@ -415,6 +464,11 @@ class Payout(Base):
     merchant = relationship("MerchantAccount", back_populates="payout_info")
     failure_reason = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index('ix_payouts_created_id', 'created_at', 'id'),
+        Index('ix_payouts_merchant_created_id', 'merchant_id', 'created_at', 'id'),
+    )
+
 
 class AuditLog(Base):
     """Audit trail for security-critical operations"""
@@ -435,6 +489,13 @@ class AuditLog(Base):
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    # On PostgreSQL the table is range-partitioned by month on created_at and its
+    # primary key is (id, created_at); see migration f1c7a2e94b36 and PartitionService.
+    __table_args__ = (
+        Index('ix_audit_logs_created_id', 'created_at', 'id'),
+        Index('ix_audit_logs_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
 
 class LedgerTransaction(Base):
     __tablename__ = "ledger_transactions"
@@ -455,6 +516,69 @@ class LedgerTransaction(Base):
     credit_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     description = Column(String, nullable=True)
+    materialized = Column(Boolean, nullable=False, default=True, server_default=text("true"))
+    stats_rolled_up = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+
+    # On PostgreSQL the table is range-partitioned by month on created_at and its
+    # primary key is (id, created_at); see migration f1c7a2e94b36 and PartitionService.
+    __table_args__ = (
+        Index(
+            'ix_ledger_unmaterialized_credit', 'credit_account_id',
+            postgresql_where=text('materialized = false'),
+            sqlite_where=text('materialized = 0'),
+        ),
+        Index(
+            'ix_ledger_unmaterialized_debit', 'debit_account_id',
+            postgresql_where=text('materialized = false'),
+            sqlite_where=text('materialized = 0'),
+        ),
+        Index(
+            'ix_ledger_stats_pending', 'id',
+            postgresql_where=text('stats_rolled_up = false'),
+            sqlite_where=text('stats_rolled_up = 0'),
+        ),
+        Index('ix_ledger_credit_account_created', 'credit_account_id', 'created_at'),
+        Index('ix_ledger_merchant_created_id', 'merchant_id', 'created_at', 'id'),
+    )
+
+
+class LedgerCheckpoint(Base):
+    __tablename__ = "ledger_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_entry_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class SettlementRun(Base):
+    """One nightly settlement, fanned out over `shard_count` shard tasks."""
+    __tablename__ = "settlement_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_date = Column(Date, nullable=False, unique=True)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+    shard_count = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="running")
+    merchants_settled = Column(Integer, nullable=False, default=0)
+    totals = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class SettlementShardCheckpoint(Base):
+    """Progress of one shard of a settlement run, committed with every settled chunk."""
+    __tablename__ = "settlement_shard_checkpoints"
+
+    run_id = Column(Integer, ForeignKey("settlement_runs.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    last_merchant_id = Column(Integer, nullable=False, default=0)
+    merchants_settled = Column(Integer, nullable=False, default=0)
+    totals = Column(String, nullable=True)
+    completed = Column(Boolean, nullable=False, default=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
 
 class Account(Base):
@@ -466,12 +590,19 @@ class Account(Base):
     account_type = Column(SAEnum(AccountType, name="account_type_enum"), nullable=False)
     currency = Column(String(3), nullable=False, default="NGN")
     balance = Column(Numeric(19, 4), nullable=False, default=0.0000)
+    shard = Column(Integer, nullable=False, default=0, server_default="0")
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     __table_args__ = (
-        UniqueConstraint('merchant_id', 'account_type', 'currency', name='_merchant_account_type_currency_uc'),
+        UniqueConstraint('merchant_id', 'account_type', 'currency', 'shard', name='_merchant_account_type_currency_uc'),
+        Index(
+            'uq_platform_account_shard', 'account_type', 'currency', 'shard',
+            unique=True,
+            postgresql_where=text('merchant_id IS NULL'),
+            sqlite_where=text('merchant_id IS NULL'),
+        ),
     )
 
 
@@ -503,9 +634,65 @@ class WebhookDelivery(Base):
     response_body = Column(String, nullable=True)
     attempts = Column(Integer, nullable=False, default=0)
     last_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    # Each delivery state gets its own partial index, so a large retry or
+    # dead-letter backlog never slows down claiming fresh deliveries.
+    __table_args__ = (
+        Index(
+            'ix_webhook_deliveries_pending', 'id',
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+        Index(
+            'ix_webhook_deliveries_retry_due', 'next_attempt_at',
+            postgresql_where=text("status = 'retrying'"),
+            sqlite_where=text("status = 'retrying'"),
+        ),
+        Index(
+            'ix_webhook_deliveries_sending', 'last_attempt_at',
+            postgresql_where=text("status = 'sending'"),
+            sqlite_where=text("status = 'sending'"),
+        ),
+    )
+
+
+class NotificationCounter(Base):
+    """Unread notifications per merchant, kept in step by NotificationService."""
+    __tablename__ = "notification_counters"
+
+    merchant_id = Column(String, ForeignKey("merchant_accounts.merchant_id", ondelete="CASCADE"), primary_key=True)
+    unread = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class OutboxEvent(Base):
+    """
+    A domain event written in the same transaction as the change it describes.
+
+    `payload` is JSON with optional "webhook", "notification" and "audit"
+    sections; the outbox relay fans them out and sets published_at.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)
+    merchant_id = Column(String, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(String, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    published_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            'ix_outbox_events_unpublished', 'id',
+            postgresql_where=text("published_at IS NULL"),
+            sqlite_where=text("published_at IS NULL"),
+        ),
+    )
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -521,3 +708,33 @@ class Notification(Base):
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_notifications_merchant_created_id', 'merchant_id', 'created_at', 'id'),
+    )
+
+
+class MerchantDailyStats(Base):
+    """
+    Per-merchant, per-day (UTC) and per-currency totals, maintained by
+    MerchantStatsService from the ledger so analytics never scan it.
+    """
+    __tablename__ = "merchant_daily_stats"
+
+    merchant_id = Column(String, ForeignKey("merchant_accounts.merchant_id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+
+    charge_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_charge_count = Column(Integer, nullable=False, default=0, server_default="0")
+    gross_volume = Column(Numeric(19, 4), nullable=False, default=0, server_default="0")
+    fees = Column(Numeric(19, 4), nullable=False, default=0, server_default="0")
+    net_volume = Column(Numeric(19, 4), nullable=False, default=0, server_default="0")
+    payout_count = Column(Integer, nullable=False, default=0, server_default="0")
+    payout_volume = Column(Numeric(19, 4), nullable=False, default=0, server_default="0")
+    refund_count = Column(Integer, nullable=False, default=0, server_default="0")
+    refund_volume = Column(Numeric(19, 4), nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index('ix_merchant_daily_stats_day', 'day'),
+    )
@@ -1,4 +1,5 @@
-from typing import Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal, Optional
 
 from fastapi import Depends, APIRouter, HTTPException, status, Request, Query
 from sqlalchemy.orm import Session
@@ -6,15 +7,18 @@ from pydantic import BaseModel
 
 from ..models import db_models
 from ..services.admin_service import AdminService
-from ..schemas import admin as admin_schema
+from ..services.merchant_stats_service import MerchantStatsService
+from ..schemas import admin as admin_schema, analytics
 from ..utilities import Oauth2 as au
 from ..utilities.db_con import get_db
 from ..utilities.exceptions import (
+    InvalidCursorError,
     MerchantAccountNotFoundError,
     PermissionDeniedError,
     VerificationError,
 )
 from ..utilities.logger import log_user_action, log_security_event, setup_logger
+from ..utilities import balance_cache, principal_cache
 
 router = APIRouter(prefix="/api/v1/admin", tags=["Admin"])
 logger = setup_logger(__name__)
@@ -40,6 +44,8 @@ async def get_all_merchants(
     current_user: db_models.User = Depends(au.get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     search: Optional[str] = None
 ):
     ip_address = request.client.host if request.client else "unknown"
@@ -48,7 +54,7 @@ async def get_all_merchants(
     try:
         AdminService.verify_admin(current_user)
 
-        result = AdminService.get_all_merchants(db=db, skip=skip, limit=limit, search=search)
+        result = AdminService.get_all_merchants(db=db, skip=skip, limit=limit, search=search, cursor=cursor, include_total=include_total)
 
         log_user_action(
             db=db,
@@ -73,6 +79,8 @@ async def get_all_merchants(
             severity="WARNING"
         )
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching merchants list for admin {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve merchants")
@@ -336,6 +344,8 @@ async def get_all_transactions(
     current_user: db_models.User = Depends(au.get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     merchant_id: Optional[str] = None
 ):
     ip_address = request.client.host if request.client else "unknown"
@@ -344,7 +354,7 @@ async def get_all_transactions(
     try:
         AdminService.verify_admin(current_user)
 
-        result = AdminService.get_all_transactions(db=db, skip=skip, limit=limit, merchant_id=merchant_id)
+        result = AdminService.get_all_transactions(db=db, skip=skip, limit=limit, merchant_id=merchant_id, cursor=cursor, include_total=include_total)
 
         log_user_action(
             db=db,
@@ -369,6 +379,8 @@ async def get_all_transactions(
             severity="WARNING"
         )
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching transactions for admin {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve transactions")
@@ -381,6 +393,8 @@ async def get_audit_logs(
     current_user: db_models.User = Depends(au.get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     user_id: Optional[int] = None,
     action: Optional[str] = None
 ):
@@ -390,7 +404,7 @@ async def get_audit_logs(
     try:
         AdminService.verify_admin(current_user)
 
-        result = AdminService.get_audit_logs(db=db, skip=skip, limit=limit, user_id=user_id, action=action)
+        result = AdminService.get_audit_logs(db=db, skip=skip, limit=limit, user_id=user_id, action=action, cursor=cursor, include_total=include_total)
 
         log_user_action(
             db=db,
@@ -415,6 +429,8 @@ async def get_audit_logs(
             severity="WARNING"
         )
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching audit logs for admin {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve audit logs")
@@ -435,7 +451,7 @@ async def sync_merchant_balances(
 
         from ..services.balance_service import BalanceService
 
-        BalanceService.sync_balances_from_charges(db=db, merchant_id=merchant_id)
+        drift = BalanceService.recalculate_merchant_balance(db, merchant_id)
 
         log_user_action(
             db=db,
@@ -446,22 +462,59 @@ async def sync_merchant_balances(
             merchant_id=merchant_id,
             ip_address=ip_address,
             user_agent=request.headers.get("user-agent") if request else None,
-            extra_data={"merchant_id": merchant_id}
+            extra_data={"merchant_id": merchant_id, "accounts_corrected": len(drift)}
         )
         db.commit()
 
-        logger.info(f"Admin {current_user.id} synced balances for merchant {merchant_id}")
-        return {"message": "Balances synced successfully", "merchant_id": merchant_id}
+        logger.info(f"Admin {current_user.id} synced balances for merchant {merchant_id} ({len(drift)} accounts corrected)")
+        return {"message": "Balances synced successfully", "merchant_id": merchant_id, "drift": drift}
 
     except PermissionDeniedError as e:
         logger.warning(f"Non-admin user {current_user.id} attempted to sync balances for merchant {merchant_id}")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except MerchantAccountNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
         db.rollback()
         logger.error(f"Error syncing balances for merchant {merchant_id} by admin {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to sync balances")
 
 
+@router.get('/analytics', response_model=analytics.AnalyticsRes, status_code=status.HTTP_200_OK)
+async def get_platform_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Literal["day", "week", "month"] = "day",
+    merchant_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(au.get_current_user)
+):
+    """Platform-wide (or one merchant's) stats per period for `start`..`end`, default the last 30 days."""
+    try:
+        AdminService.verify_admin(current_user)
+    except PermissionDeniedError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    try:
+        return MerchantStatsService.series(db, start, end, granularity, merchant_id=merchant_id)
+    except Exception as e:
+        logger.error(f"Error getting platform analytics for admin {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get analytics")
+
+
+@router.get('/cache/balances', status_code=status.HTTP_200_OK)
+async def get_balance_cache_stats(current_user: db_models.User = Depends(au.get_current_user)):
+    """Hit rate of the dashboard balance cache in this API process."""
+    try:
+        AdminService.verify_admin(current_user)
+        return balance_cache.stats()
+    except PermissionDeniedError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+
+
 @router.post('/users/{user_id}/promote', status_code=status.HTTP_200_OK)
 async def promote_user_to_admin(
     user_id: int,
@@ -483,6 +536,7 @@ async def promote_user_to_admin(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User is already an admin")
 
         target_user.is_superadmin = True
+        principal_cache.invalidate_on_commit(db, user_id=target_user.id)
         db.commit()
 
         log_user_action(
@@ -524,13 +578,15 @@ async def admin_list_payouts(
     current_user: db_models.User = Depends(au.get_current_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     merchant_id: Optional[str] = None
 ):
     ip_address = request.client.host if request.client else "unknown"
     logger.info(f"Admin {current_user.id} requesting payouts from IP: {ip_address}")
     try:
         AdminService.verify_admin(current_user)
-        result = AdminService.get_all_payouts(db=db, skip=skip, limit=limit, merchant_id=merchant_id)
+        result = AdminService.get_all_payouts(db=db, skip=skip, limit=limit, merchant_id=merchant_id, cursor=cursor, include_total=include_total)
 
         log_user_action(
             db=db,
@@ -546,6 +602,8 @@ async def admin_list_payouts(
         return result
     except PermissionDeniedError as e:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching admin payouts: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve payouts")
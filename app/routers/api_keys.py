@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import List
 
-from fastapi import Depends, APIRouter, HTTPException, status, Request
+from fastapi import Depends, APIRouter, HTTPException, status, Request, Query
 from sqlalchemy.orm import Session
 
 from ..models import db_models
@@ -211,6 +211,48 @@ async def get_api_key(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
 
+@router.get('/{key_id}/usage', response_model=api_key_schema.APIKeyUsageRes, status_code=status.HTTP_200_OK)
+async def get_api_key_usage(
+        key_id: int,
+        request: Request,
+        days: int = Query(30, ge=1, le=90),
+        db: Session = Depends(get_db),
+        current_user: db_models.User = Depends(au.get_current_user)
+):
+    ip_address = request.client.host if request and request.client else "unknown"
+    logger.info(f"User {current_user.id} getting usage for API key {key_id} from {ip_address}")
+
+    try:
+        if not current_user.verified_info:
+            logger.warning(f"Unverified user {current_user.id} attempted to access API key usage from {ip_address}")
+            log_security_event(
+                "UNVERIFIED_API_KEY_ACCESS_ATTEMPT",
+                {"user_id": current_user.id, "email": current_user.email, "ip_address": ip_address},
+                severity="WARNING"
+            )
+            raise VerificationError('Please verify your account first')
+
+        if not current_user.merchant_info:
+            logger.warning(f"User {current_user.id} without merchant account attempted to access API key usage")
+            raise MerchantAccountNotFoundError("Please create a merchant account first")
+
+        usage = MerchantService.get_api_key_usage(db=db, user_id=current_user.id, key_id=key_id, days=days)
+
+        logger.info(f"User {current_user.id} retrieved {days} days of usage for API key {key_id}")
+        return usage
+
+    except VerificationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except (MerchantAccountNotFoundError, ResourceNotFoundError) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except DatabaseError as e:
+        logger.error(f"Database error getting usage for API key {key_id} for user {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve API key usage")
+    except Exception as e:
+        logger.error(f"Unexpected error getting usage for API key {key_id} for user {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+
 @router.put('/{key_id}', response_model=api_key_schema.APIKeyRes, status_code=status.HTTP_200_OK)
 async def update_api_key(
         key_id: int,
@@ -8,8 +8,10 @@ from ..services.payment_service import ChargeService
 from ..utilities.db_con import get_db
 from ..utilities import Oauth2 as au
 from ..models import db_models
-from ..utilities.exceptions import ChargeCreationError
+from ..utilities import idempotency
+from ..utilities.exceptions import ChargeCreationError, IdempotencyKeyReusedError, IdempotencyRequestInProgressError, InvalidCursorError
 from ..utilities.logger import setup_logger, log_user_action, log_security_event
+from ..utilities.pagination import keyset_page
 
 router = APIRouter(prefix="/v1/charges", tags=["Charges"])
 logger = setup_logger(__name__)
@@ -29,9 +31,22 @@ async def create_new_charge(
 
     final_idempotency_key = idempotency_key or x_idempotency_key or charge_data.idempotency_key
 
+    claim = None
     if final_idempotency_key:
         charge_data.idempotency_key = final_idempotency_key
         logger.info(f"Using idempotency key: {final_idempotency_key} for charge creation")
+        try:
+            claim, replay = await idempotency.acquire(
+                current_user.id, final_idempotency_key, idempotency.request_fingerprint(charge_data)
+            )
+        except IdempotencyKeyReusedError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except IdempotencyRequestInProgressError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers={"Retry-After": "1"})
+        if replay is not None:
+            response.headers["Location"] = f"/v1/charges/{replay['id']}"
+            response.headers["Idempotent-Replayed"] = "true"
+            return replay
 
     try:
         new_charge = ChargeService.create_charge(db=db, user=current_user, charge_data=charge_data)
@@ -58,9 +73,16 @@ async def create_new_charge(
 
         response.headers["Location"] = f"/v1/charges/{new_charge.id}"
 
+        charge_response = charge_schema.ChargeResponse.model_validate(new_charge)
+        if claim:
+            claim.complete(charge_response.model_dump(mode="json"))
+            claim = None
+
         logger.info(f"Charge {new_charge.id} created successfully for user {current_user.id}")
-        return new_charge
+        return charge_response
 
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     except ChargeCreationError as e:
         logger.error(f"Failed to create charge for user {current_user.id}: {str(e)}", exc_info=True)
         log_security_event(
@@ -87,16 +109,124 @@ async def create_new_charge(
             severity="ERROR"
         )
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An internal server error occurred.")
+    finally:
+        if claim:
+            claim.release()
+
+
+def _claim_batch_keys(user_id: int, charges: list[charge_schema.ChargeCreate]):
+    """
+    Run the keyed items of a batch through the idempotency store at once
+    (idempotency.acquire_many). Returns the claims to complete, by item index,
+    and the results already settled by the store: replays of earlier
+    responses, and keys that were reused or are still in flight.
+    """
+    first = {}
+    for index, item in enumerate(charges):
+        if item.idempotency_key and item.idempotency_key not in first:
+            first[item.idempotency_key] = index  # repeats within the batch are matched by ChargeService
+    claimed, replays, errors = idempotency.acquire_many(
+        user_id, {key: idempotency.request_fingerprint(charges[index]) for key, index in first.items()}
+    )
+
+    claims = {first[key]: claim for key, claim in claimed.items()}
+    settled = {}
+    for key, replay in replays.items():
+        settled[first[key]] = {"index": first[key], "idempotency_key": key, "status": "duplicate", "charge": replay, "error": None}
+    for key, e in errors.items():
+        settled[first[key]] = {"index": first[key], "idempotency_key": key, "status": "rejected", "charge": None, "error": str(e)}
+    return claims, settled
+
+
+@router.post("/batch", response_model=charge_schema.ChargeBatchResponse, status_code=status.HTTP_201_CREATED)
+async def create_charge_batch(
+    batch: charge_schema.ChargeBatchCreate,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(au.get_current_user_or_api_key)
+):
+    ip_address = request.client.host if request and request.client else "unknown"
+    logger.info(f"User {current_user.id} ({current_user.email}) submitted a batch of {len(batch.charges)} charges from {ip_address}")
+
+    claims = {}
+    try:
+        claims, settled = _claim_batch_keys(current_user.id, batch.charges)
+        pending = [index for index in range(len(batch.charges)) if index not in settled]
+        results = ChargeService.create_charges_batch(
+            db=db, user=current_user, charges=[batch.charges[index] for index in pending]
+        ) if pending else []
+        for result in results:
+            result["index"] = pending[result["index"]]
+        results = sorted(results + list(settled.values()), key=lambda r: r["index"])
+        created = sum(1 for r in results if r["status"] == "created")
+        rejected = sum(1 for r in results if r["status"] == "rejected")
+        duplicates = len(results) - created - rejected
+
+        merchant_id = current_user.merchant_info.merchant_id if current_user.merchant_info else None
+        log_user_action(
+            db=db,
+            user_id=current_user.id,
+            action="CHARGE_BATCH_CREATED",
+            resource_type="CHARGE",
+            merchant_id=merchant_id,
+            ip_address=ip_address,
+            user_agent=request.headers.get("user-agent") if request else None,
+            extra_data={
+                "submitted": len(results),
+                "created": created,
+                "duplicates": duplicates,
+                "rejected": rejected,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+        )
+        db.commit()
+
+        idempotency.complete_many([
+            (claims.pop(result["index"]), charge_schema.ChargeResponse.model_validate(result["charge"]).model_dump(mode="json"))
+            for result in results if result["index"] in claims and result["charge"] is not None
+        ])
+
+        logger.info(f"Charge batch for user {current_user.id}: {created} created, {duplicates} duplicates, {rejected} rejected")
+        return {"created": created, "duplicates": duplicates, "rejected": rejected, "results": results}
+
+    except ChargeCreationError as e:
+        logger.error(f"Failed to create charge batch for user {current_user.id}: {str(e)}", exc_info=True)
+        log_security_event(
+            "CHARGE_BATCH_CREATION_FAILED",
+            {
+                "user_id": current_user.id,
+                "email": current_user.email,
+                "error": str(e),
+                "ip_address": ip_address
+            },
+            severity="WARNING"
+        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.critical(f"Unexpected error in charge batch endpoint for user {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An internal server error occurred.")
+    finally:
+        for claim in claims.values():
+            claim.release()
 
 
 @router.get("/", response_model=list[charge_schema.ChargeResponse])
 async def list_charges(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: db_models.User = Depends(au.get_current_user)
 ):
-    charges = db.query(db_models.Charge).filter_by(user_id=current_user.id).order_by(db_models.Charge.created_at.desc()).offset(skip).limit(limit).all()
+    """Newest charges first. Follow the X-Next-Cursor response header, passed back as `cursor`, for the next page."""
+    query = db.query(db_models.Charge).filter_by(user_id=current_user.id)
+    try:
+        charges, next_cursor = keyset_page(query, db_models.Charge, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return charges
 
 
@@ -1,15 +1,21 @@
-from datetime import datetime, timezone
-from typing import List
-
-from fastapi import Depends, APIRouter, HTTPException, status, Request
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Literal, Optional, Union
+
+from fastapi import Depends, APIRouter, HTTPException, status, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from ..models import db_models
-from ..schemas import merchant as mer, ledger
-from ..services.merchant_service import  MerchantService
+from ..schemas import analytics, merchant as mer, ledger
+from ..services.merchant_service import BALANCE_HISTORY_COLUMNS, MerchantService
+from ..services.merchant_stats_service import MerchantStatsService
 from ..utilities import Oauth2 as au
-from ..utilities.db_con import get_db
-from ..utilities.exceptions import VerificationError, DatabaseError
+from ..utilities.config import settings
+from ..utilities.db_con import SessionLocal, get_db
+from ..utilities.exceptions import InvalidCursorError, VerificationError, DatabaseError
 from ..utilities.logger import log_user_action, log_security_event, setup_logger
 
 logger = setup_logger(__name__)
@@ -216,8 +222,27 @@ async def get_merchant_balance(request: Request, db: Session = Depends(get_db),
         logger.error(f"Error retrieving merchant balance for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve merchant balance")
 
-@router.get('/balance/history', response_model=List[ledger.BalanceHistory], status_code=status.HTTP_200_OK)
-async def get_merchant_balance_history(request: Request, db: Session = Depends(get_db), current_user: db_models.User = Depends(au.get_current_user)):
+@router.get(
+    '/balance/history',
+    response_model=Union[List[ledger.BalanceHistory], List[ledger.BalanceHistoryBucket]],
+    status_code=status.HTTP_200_OK,
+)
+async def get_merchant_balance_history(
+        request: Request,
+        response: Response,
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        format: Literal["json", "ndjson", "csv"] = "json",
+        granularity: Optional[Literal["day", "week", "month"]] = None,
+        db: Session = Depends(get_db),
+        current_user: db_models.User = Depends(au.get_current_user)
+):
+    """
+    Ledger entries newest first, a page at a time: follow the X-Next-Cursor
+    response header, passed back as `cursor`, for the next page.
+    `format=ndjson|csv` streams the whole history instead, and
+    `granularity=day|week|month` returns per-period totals for charts.
+    """
     ip_address = request.client.host if request and request.client else "unknown"
     logger.info(f"Retrieving balance history for user:{current_user.id} ({current_user.name}) from {ip_address}")
     merchant = current_user.merchant_info
@@ -225,31 +250,97 @@ async def get_merchant_balance_history(request: Request, db: Session = Depends(g
         logger.warning(f"User {current_user.id} attempted to get balance history but is not verified with a merchant account.")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Merchant account not found. Please create one first.")
+    merchant_id = merchant.merchant_id
     try:
-        balance_history = MerchantService.get_merchant_balance_history(db=db, merchant_id=merchant.merchant_id)
+        extra_data = {"format": format, "granularity": granularity}
+        if granularity:
+            result = MerchantService.get_merchant_balance_history_buckets(db=db, merchant_id=merchant_id, granularity=granularity)
+            extra_data["bucket_count"] = len(result)
+        elif format == "json":
+            result, next_cursor = MerchantService.get_merchant_balance_history(
+                db=db, merchant_id=merchant_id, limit=limit, cursor=cursor
+            )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            extra_data["transaction_count"] = len(result)
 
         log_user_action(
             db=db,
             user_id=current_user.id,
             action="BALANCE_HISTORY_VIEWED",
             resource_type="MERCHANT",
-            resource_id=merchant.merchant_id,
-            merchant_id=merchant.merchant_id,
+            resource_id=merchant_id,
+            merchant_id=merchant_id,
             ip_address=ip_address,
             user_agent=request.headers.get("user-agent") if request else None,
-            extra_data={"transaction_count": len(balance_history) if balance_history else 0}
+            extra_data=extra_data
         )
         db.commit()
-
-        if not balance_history:
-            logger.info(f'Could not find any balance for {merchant.merchant_id}')
-            return []
-        return balance_history
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         db.rollback()
-        logger.error(f'Unexpected error occurred while getting balance history for {merchant.merchant_id}: {e}', exc_info=True)
+        logger.error(f'Unexpected error occurred while getting balance history for {merchant_id}: {e}', exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get balance history")
 
+    if granularity or format == "json":
+        return result
+    # The export reads through its own session for as long as the client takes to download it.
+    db.close()
+    return StreamingResponse(
+        _export_balance_history(merchant_id, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="balance-history-{merchant_id}.{format}"'},
+    )
+
+
+def _export_balance_history(merchant_id: str, format: str):
+    """Encode the streamed history as CSV or NDJSON, one chunk per fetched batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(BALANCE_HISTORY_COLUMNS)
+    batch_size = settings.BALANCE_HISTORY_STREAM_BATCH_SIZE
+    rows = MerchantService.iter_merchant_balance_history(SessionLocal, merchant_id, batch_size)
+    for count, (charge_id, transaction_type, amount, currency, created_at) in enumerate(rows, 1):
+        if format == "csv":
+            writer.writerow((charge_id, transaction_type.value, amount, currency, created_at.isoformat()))
+        else:
+            buffer.write(json.dumps({
+                "charge_id": charge_id, "transaction_type": transaction_type.value, "amount": float(amount),
+                "currency": currency, "created_at": created_at.isoformat(),
+            }) + "\n")
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@router.get('/analytics', response_model=analytics.AnalyticsRes, status_code=status.HTTP_200_OK)
+async def get_merchant_analytics(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        granularity: Literal["day", "week", "month"] = "day",
+        db: Session = Depends(get_db),
+        current_user: db_models.User = Depends(au.get_current_user)
+):
+    """Volume, fees, payouts and refunds per period for `start`..`end` (default: the last 30 days)."""
+    merchant = current_user.merchant_info
+    if not merchant:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Merchant account not found. Please create one first.")
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    try:
+        return MerchantStatsService.series(db, start, end, granularity, merchant_id=merchant.merchant_id)
+    except Exception as e:
+        logger.error(f"Error getting analytics for merchant {merchant.merchant_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get analytics")
+
 
 @router.get('/limits', response_model=mer.TransactionLimitsRes, status_code=status.HTTP_200_OK)
 async def get_my_limits(
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from ..utilities.db_con import get_db
 from ..utilities import Oauth2 as au
+from ..utilities import event_stream
+from ..utilities.exceptions import InvalidCursorError
 from ..models import db_models
 from ..services.notification_service import NotificationService
 from typing import List
@@ -10,11 +13,16 @@ from ..schemas import admin as admin_schemas
 router = APIRouter(prefix="/api/v1/notifications", tags=["Notifications"])
 
 @router.get("/", response_model=List[admin_schemas.NotificationResponse])
-async def list_notifications(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: db_models.User = Depends(au.get_current_user_or_api_key)):
+async def list_notifications(response: Response, skip: int = 0, limit: int = 50, cursor: str | None = None, db: Session = Depends(get_db), current_user: db_models.User = Depends(au.get_current_user_or_api_key)):
     merchant_id = current_user.merchant_info.merchant_id if hasattr(current_user, 'merchant_info') and current_user.merchant_info else None
     if not merchant_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No merchant account")
-    notes = NotificationService.list_notifications(db=db, merchant_id=merchant_id, limit=limit, skip=skip)
+    try:
+        notes, next_cursor = NotificationService.list_notifications(db=db, merchant_id=merchant_id, limit=limit, skip=skip, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return notes
 
 @router.get('/unread_count')
@@ -40,3 +48,26 @@ async def mark_all_read(db: Session = Depends(get_db), current_user: db_models.U
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No merchant account")
     NotificationService.mark_all_read(db=db, merchant_id=merchant_id)
     return {"message": "ok"}
+
+@router.get('/stream')
+async def stream_events(
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(au.get_current_user_or_api_key),
+    last_event_id: str | None = Header(default=None),
+):
+    """
+    Server-sent events for the merchant: new notifications and charge and payout
+    status changes. Reconnecting clients send Last-Event-ID to resume where they left off.
+    """
+    merchant_id = current_user.merchant_info.merchant_id if hasattr(current_user, 'merchant_info') and current_user.merchant_info else None
+    if not merchant_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No merchant account")
+    if not event_stream.available():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Event stream is not available")
+    # The stream can stay open for hours; don't hold a database connection for it.
+    db.close()
+    return StreamingResponse(
+        event_stream.hub.stream(merchant_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
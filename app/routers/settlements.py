@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.services.payout_service import PayoutService
 from app.utilities.db_con import get_db
 from app.utilities import Oauth2 as au
 from app.models import db_models
 from app.utilities.logger import setup_logger
-from app.utilities.exceptions import MerchantAccountNotFoundError, DatabaseError
+from app.utilities.exceptions import InvalidCursorError, MerchantAccountNotFoundError, DatabaseError
 from app.schemas import payout as payout_schema
 
 router = APIRouter(prefix="/api/v1/settlements", tags=["Settlements"])
@@ -15,12 +15,24 @@ logger = setup_logger(__name__)
 
 
 @router.get("/", response_model=List[payout_schema.SettlementReportRes])
-async def list_settlements(request: Request, db: Session = Depends(get_db), current_user: db_models.User = Depends(au.get_current_user)):
+async def list_settlements(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(au.get_current_user),
+):
+    """Settlement reports newest first; pass the X-Next-Cursor response header back as `cursor` for the next page."""
     try:
-        reports = PayoutService.list_settlement_reports(db=db, user_id=current_user.id)
+        reports, next_cursor = PayoutService.list_settlement_reports(db=db, user_id=current_user.id, limit=limit, cursor=cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return reports
     except MerchantAccountNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Merchant account not found")
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.exception("Error listing settlement reports")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
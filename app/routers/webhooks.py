@@ -59,8 +59,7 @@ async def test_webhook(webhook_id: int, db: Session = Depends(get_db), current_u
     wh = WebhookService.get_webhook(db=db, merchant_id=current_user.merchant_info.merchant_id, webhook_id=webhook_id)
     payload = {"event": "webhook.test", "merchant_id": current_user.merchant_info.merchant_id}
     delivery = WebhookService.record_delivery(db=db, webhook_id=wh.id, event="webhook.test", payload=payload)
-    from app.celery_worker import celery_app
-    celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery.id,))
+    WebhookService.dispatch_deliveries([delivery.id])
     return {"ok": True, "delivery_id": delivery.id}
 
 
@@ -72,8 +71,7 @@ async def list_deliveries(webhook_id: int, db: Session = Depends(get_db), curren
 
 @router.post("/{webhook_id}/deliveries/{delivery_id}/retry")
 async def retry_delivery(webhook_id: int, delivery_id: int, db: Session = Depends(get_db), current_user: db_models.User = Depends(au.get_current_user)):
-    _ = WebhookService.get_delivery(db=db, webhook_id=webhook_id, delivery_id=delivery_id)
-    from app.celery_worker import celery_app
-    celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery_id,))
+    delivery = WebhookService.get_delivery(db=db, webhook_id=webhook_id, delivery_id=delivery_id)
+    WebhookService.requeue_delivery(db=db, delivery=delivery)
     return {"ok": True}
 
@@ -33,8 +33,10 @@ class MerchantAccountAdmin(BaseModel):
 
 
 class MerchantsListResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    is_estimate: bool = False
     merchants: List[MerchantAccountAdmin]
+    next_cursor: Optional[str] = None
 
 
 class AuditLogResponse(BaseModel):
@@ -54,8 +56,10 @@ class AuditLogResponse(BaseModel):
 
 
 class AuditLogsListResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    is_estimate: bool = False
     logs: List[AuditLogResponse]
+    next_cursor: Optional[str] = None
 
 
 class ChargeAdmin(BaseModel):
@@ -72,8 +76,10 @@ class ChargeAdmin(BaseModel):
 
 
 class TransactionsListResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    is_estimate: bool = False
     transactions: List[ChargeAdmin]
+    next_cursor: Optional[str] = None
 
 
 class UserVerifiedInfoResponse(BaseModel):
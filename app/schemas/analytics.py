@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+from datetime import date
+from decimal import Decimal
+from typing import List
+
+
+class StatsTotals(BaseModel):
+    charge_count: int
+    failed_charge_count: int
+    gross_volume: Decimal
+    fees: Decimal
+    net_volume: Decimal
+    payout_count: int
+    payout_volume: Decimal
+    refund_count: int
+    refund_volume: Decimal
+
+
+class StatsBucket(StatsTotals):
+    period: date
+    currency: str
+
+
+class CurrencyTotals(StatsTotals):
+    currency: str
+
+
+class AnalyticsRes(BaseModel):
+    """Merchant stats per day, week or month, read from the daily rollups."""
+    start: date
+    end: date
+    granularity: str
+    series: List[StatsBucket]
+    totals: List[CurrencyTotals]
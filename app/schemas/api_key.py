@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, HttpUrl, ConfigDict
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional, Literal, List
 
 
@@ -31,6 +31,20 @@ class APIKeyFullRes(APIKeyRes):
     api_key: str
 
 
+class APIKeyUsageDay(BaseModel):
+    """Request count for one UTC day."""
+    day: date
+    request_count: int
+
+
+class APIKeyUsageRes(BaseModel):
+    """Per-day request histogram for an API key."""
+    key_id: int
+    last_used_at: Optional[datetime]
+    total_requests: int
+    days: List[APIKeyUsageDay]
+
+
 class APIKeyUpdate(BaseModel):
     """Schema for updating an API key (name only)."""
     name: str = Field(..., description="New friendly name for the API key")
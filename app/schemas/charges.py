@@ -2,6 +2,7 @@
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime
 from decimal import Decimal
+from typing import Literal
 
 class ChargeCreate(BaseModel):
     amount: Decimal = Field(..., gt=0, decimal_places=2)
@@ -19,3 +20,21 @@ class ChargeResponse(BaseModel):
     status: str
     description: str
     created_at: datetime
+
+MAX_BATCH_CHARGES = 500
+
+class ChargeBatchCreate(BaseModel):
+    charges: list[ChargeCreate] = Field(..., min_length=1, max_length=MAX_BATCH_CHARGES)
+
+class ChargeBatchItemResult(BaseModel):
+    index: int
+    idempotency_key: str | None = None
+    status: Literal["created", "duplicate", "rejected"]
+    charge: ChargeResponse | None = None
+    error: str | None = None
+
+class ChargeBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    rejected: int = 0
+    results: list[ChargeBatchItemResult]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 
@@ -11,3 +11,12 @@ class BalanceHistory(BaseModel):
     amount: float
     currency: str
     created_at: datetime
+
+
+class BalanceHistoryBucket(BaseModel):
+    """Ledger entries of one type and currency in a day, week or month."""
+    period: date
+    transaction_type: str
+    currency: str
+    count: int
+    amount: float
@@ -43,6 +43,7 @@ class WebhookDeliveryRes(BaseModel):
     response_body: Optional[str]
     attempts: int
     last_attempt_at: Optional[datetime]
+    next_attempt_at: Optional[datetime] = None
     created_at: datetime
 
     class Config:
@@ -1,7 +1,6 @@
 from datetime import datetime
 from typing import Optional
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, or_
 
 from ..models import db_models
 from ..utilities.exceptions import (
@@ -9,7 +8,11 @@ from ..utilities.exceptions import (
     PermissionDeniedError,
     VerificationError,
 )
+from ..utilities.config import settings
 from ..utilities.logger import setup_logger
+from ..utilities import principal_cache, row_counts
+from ..utilities.pagination import keyset_page
+from .merchant_search_service import MerchantSearchService
 
 logger = setup_logger(__name__)
 
@@ -23,28 +26,28 @@ class AdminService:
         return True
 
     @staticmethod
-    def get_all_merchants(db: Session, skip: int = 0, limit: int = 100, search: Optional[str] = None):
+    def get_all_merchants(db: Session, skip: int = 0, limit: int = 100, search: Optional[str] = None,
+                          cursor: Optional[str] = None, include_total: bool = True):
         try:
-            logger.info(f'Fetching merchants list (skip={skip}, limit={limit}, search={search})')
+            logger.info(f'Fetching merchants list (skip={skip}, limit={limit}, search={search}, cursor={cursor})')
 
-            query = db.query(db_models.MerchantAccount).options(
-                joinedload(db_models.MerchantAccount.user_info)
-            )
-
-            if search:
-                query = query.join(db_models.User).filter(
-                    or_(
-                        db_models.User.email.ilike(f'%{search}%'),
-                        db_models.User.name.ilike(f'%{search}%'),
-                        db_models.MerchantAccount.merchant_id.ilike(f'%{search}%')
-                    )
+            if search and search.strip():
+                # Ranked by relevance, so search results page by offset rather than cursor.
+                # Only a bounded candidate set is ranked, so there is no total to count.
+                query = MerchantSearchService.search_query(
+                    db, search, candidates=max(settings.MERCHANT_SEARCH_CANDIDATES, skip + limit)
                 )
-
-            total = query.count()
-            merchants = query.order_by(desc(db_models.MerchantAccount.created_at)).offset(skip).limit(limit).all()
+                total, is_estimate = None, False
+                merchants, next_cursor = query.offset(skip).limit(limit).all(), None
+            else:
+                query = db.query(db_models.MerchantAccount).options(
+                    joinedload(db_models.MerchantAccount.user_info)
+                )
+                total, is_estimate = row_counts.count(db, query) if include_total else (None, False)
+                merchants, next_cursor = keyset_page(query, db_models.MerchantAccount, limit, cursor, skip)
 
             logger.info(f'Retrieved {len(merchants)} merchants (total: {total})')
-            return {"total": total, "merchants": merchants}
+            return {"total": total, "is_estimate": is_estimate, "merchants": merchants, "next_cursor": next_cursor}
 
         except Exception as e:
             logger.error(f'Error fetching merchants list: {e}', exc_info=True)
@@ -97,6 +100,7 @@ class AdminService:
 
             old_status = merchant.account_status.value
             merchant.account_status = db_models.AccountStatus[status]
+            principal_cache.invalidate_on_commit(db, user_id=merchant.user_id)
             db.commit()
 
             logger.info(f'Merchant {merchant_id} status updated from {old_status} to {status} by admin {admin_user.id}')
@@ -160,6 +164,7 @@ class AdminService:
                 merchant.kyc_status = db_models.KYCStatus.verified
                 merchant.kyc_verified_at = datetime.now()
                 merchant.verification_status = db_models.VerificationStatus.verified
+                principal_cache.invalidate_on_commit(db, user_id=user_id)
                 logger.info(f'Updated merchant {merchant.merchant_id} KYC and verification status to verified')
 
             db.commit()
@@ -189,6 +194,7 @@ class AdminService:
             if merchant:
                 merchant.kyc_status = db_models.KYCStatus.failed
                 merchant.verification_status = db_models.VerificationStatus.rejected
+                principal_cache.invalidate_on_commit(db, user_id=user_id)
                 logger.info(f'Updated merchant {merchant.merchant_id} KYC status to failed')
 
             db.commit()
@@ -201,9 +207,10 @@ class AdminService:
             raise
 
     @staticmethod
-    def get_all_transactions(db: Session, skip: int = 0, limit: int = 100, merchant_id: Optional[str] = None):
+    def get_all_transactions(db: Session, skip: int = 0, limit: int = 100, merchant_id: Optional[str] = None,
+                             cursor: Optional[str] = None, include_total: bool = True):
         try:
-            logger.info(f'Admin fetching transactions (skip={skip}, limit={limit}, merchant_id={merchant_id})')
+            logger.info(f'Admin fetching transactions (skip={skip}, limit={limit}, merchant_id={merchant_id}, cursor={cursor})')
 
             query = db.query(db_models.Charge).options(joinedload(db_models.Charge.user))
 
@@ -214,40 +221,42 @@ class AdminService:
                 if user:
                     query = query.filter(db_models.Charge.user_id == user.id)
 
-            total = query.count()
-            transactions = query.order_by(desc(db_models.Charge.created_at)).offset(skip).limit(limit).all()
+            total, is_estimate = row_counts.count(db, query) if include_total else (None, False)
+            transactions, next_cursor = keyset_page(query, db_models.Charge, limit, cursor, skip)
 
             logger.info(f'Retrieved {len(transactions)} transactions (total: {total})')
-            return {"total": total, "transactions": transactions}
+            return {"total": total, "is_estimate": is_estimate, "transactions": transactions, "next_cursor": next_cursor}
 
         except Exception as e:
             logger.error(f'Error fetching transactions: {e}', exc_info=True)
             raise
 
     @staticmethod
-    def get_all_payouts(db: Session, skip: int = 0, limit: int = 100, merchant_id: Optional[str] = None):
+    def get_all_payouts(db: Session, skip: int = 0, limit: int = 100, merchant_id: Optional[str] = None,
+                        cursor: Optional[str] = None, include_total: bool = True):
         try:
-            logger.info(f'Admin fetching payouts (skip={skip}, limit={limit}, merchant_id={merchant_id})')
+            logger.info(f'Admin fetching payouts (skip={skip}, limit={limit}, merchant_id={merchant_id}, cursor={cursor})')
 
             query = db.query(db_models.Payout)
 
             if merchant_id:
                 query = query.filter(db_models.Payout.merchant_id == merchant_id)
 
-            total = query.count()
-            payouts = query.order_by(desc(db_models.Payout.created_at)).offset(skip).limit(limit).all()
+            total, is_estimate = row_counts.count(db, query) if include_total else (None, False)
+            payouts, next_cursor = keyset_page(query, db_models.Payout, limit, cursor, skip)
 
             logger.info(f'Retrieved {len(payouts)} payouts (total: {total})')
-            return {"total": total, "payouts": payouts}
+            return {"total": total, "is_estimate": is_estimate, "payouts": payouts, "next_cursor": next_cursor}
 
         except Exception as e:
             logger.error(f'Error fetching payouts: {e}', exc_info=True)
             raise
 
     @staticmethod
-    def get_audit_logs(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[int] = None, action: Optional[str] = None):
+    def get_audit_logs(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[int] = None, action: Optional[str] = None,
+                       cursor: Optional[str] = None, include_total: bool = True):
         try:
-            logger.info(f'Admin fetching audit logs (skip={skip}, limit={limit}, user_id={user_id}, action={action})')
+            logger.info(f'Admin fetching audit logs (skip={skip}, limit={limit}, user_id={user_id}, action={action}, cursor={cursor})')
 
             query = db.query(db_models.AuditLog)
 
@@ -256,11 +265,11 @@ class AdminService:
             if action:
                 query = query.filter(db_models.AuditLog.action.ilike(f'%{action}%'))
 
-            total = query.count()
-            logs = query.order_by(desc(db_models.AuditLog.created_at)).offset(skip).limit(limit).all()
+            total, is_estimate = row_counts.count(db, query) if include_total else (None, False)
+            logs, next_cursor = keyset_page(query, db_models.AuditLog, limit, cursor, skip)
 
             logger.info(f'Retrieved {len(logs)} audit logs (total: {total})')
-            return {"total": total, "logs": logs}
+            return {"total": total, "is_estimate": is_estimate, "logs": logs, "next_cursor": next_cursor}
 
         except Exception as e:
             logger.error(f'Error fetching audit logs: {e}', exc_info=True)
@@ -1,79 +1,107 @@
-from decimal import Decimal
+from sqlalchemy import and_, case, func, or_, select, update
 from sqlalchemy.orm import Session
 from ..models import db_models
 from ..models.db_models import AccountType
+from ..utilities import balance_cache
+from ..utilities.config import settings
+from ..utilities.exceptions import MerchantAccountNotFoundError
 from ..utilities.logger import setup_logger
+from .ledger_service import MERCHANT_BALANCE_FIELDS
 
 logger = setup_logger(__name__)
 
 
 class BalanceService:
     @staticmethod
-    def recalculate_merchant_balance(db: Session, merchant_id: str):
+    def _drift_query(merchant_filter):
         """
-        Recalculate and update merchant balances based on ledger transactions
+        Stored vs ledger-derived balance of every merchant pending/available
+        account matching `merchant_filter` (a MerchantAccount condition), for
+        accounts where they differ. Computed by one grouped aggregate: each
+        account's materialized credits minus debits, FILTERed out of the
+        merchant's ledger entries.
         """
-        try:
-            logger.info(f"Recalculating balances for merchant {merchant_id}")
-
-            merchant_account = db.query(db_models.MerchantAccount).filter_by(
-                merchant_id=merchant_id
-            ).first()
-
-            if not merchant_account:
-                logger.error(f"Merchant account {merchant_id} not found")
-                return
-
-            pending_account = db.query(db_models.Account).filter_by(
-                merchant_id=merchant_id,
-                account_type=AccountType.MERCHANT_PENDING
-            ).first()
-
-            available_account = db.query(db_models.Account).filter_by(
-                merchant_id=merchant_id,
-                account_type=AccountType.MERCHANT_AVAILABLE
-            ).first()
-
-            if pending_account:
-                pending_credits = db.query(db_models.LedgerTransaction).filter(
-                    db_models.LedgerTransaction.merchant_id == merchant_id,
-                    db_models.LedgerTransaction.credit_account_id == pending_account.id
-                ).all()
-
-                pending_debits = db.query(db_models.LedgerTransaction).filter(
-                    db_models.LedgerTransaction.merchant_id == merchant_id,
-                    db_models.LedgerTransaction.debit_account_id == pending_account.id
-                ).all()
-
-                total_credits = sum(Decimal(str(t.amount)) for t in pending_credits)
-                total_debits = sum(Decimal(str(t.amount)) for t in pending_debits)
+        account, lt, merchant = db_models.Account, db_models.LedgerTransaction, db_models.MerchantAccount
+        credited = func.coalesce(func.sum(lt.amount).filter(lt.credit_account_id == account.id), 0)
+        debited = func.coalesce(func.sum(lt.amount).filter(lt.debit_account_id == account.id), 0)
+        recomputed = credited - debited
+        mirrored = case(
+            (account.account_type == AccountType.MERCHANT_PENDING, merchant.pending_balance),
+            else_=merchant.available_balance,
+        )
+        return select(
+            account.merchant_id,
+            account.id.label("account_id"),
+            account.account_type,
+            account.balance.label("stored"),
+            mirrored.label("mirrored"),
+            recomputed.label("recomputed"),
+        ).join(
+            merchant, (merchant.merchant_id == account.merchant_id) & (merchant.currency == account.currency)
+        ).outerjoin(
+            lt, and_(
+                lt.merchant_id == account.merchant_id,
+                lt.materialized == True,
+                or_(lt.credit_account_id == account.id, lt.debit_account_id == account.id),
+            )
+        ).where(
+            merchant_filter,
+            account.account_type.in_(tuple(MERCHANT_BALANCE_FIELDS)),
+        ).group_by(
+            account.merchant_id, account.id, account.account_type, account.balance,
+            merchant.pending_balance, merchant.available_balance,
+        ).having(
+            or_(account.balance != recomputed, mirrored != recomputed)
+        ).order_by(account.id)
 
-                pending_account.balance = total_credits - total_debits
-                merchant_account.pending_balance = pending_account.balance
-
-                logger.info(f"Merchant {merchant_id} pending balance recalculated: {pending_account.balance}")
-
-            if available_account:
-                available_credits = db.query(db_models.LedgerTransaction).filter(
-                    db_models.LedgerTransaction.merchant_id == merchant_id,
-                    db_models.LedgerTransaction.credit_account_id == available_account.id
-                ).all()
-
-                available_debits = db.query(db_models.LedgerTransaction).filter(
-                    db_models.LedgerTransaction.merchant_id == merchant_id,
-                    db_models.LedgerTransaction.debit_account_id == available_account.id
-                ).all()
-
-                total_credits = sum(Decimal(str(t.amount)) for t in available_credits)
-                total_debits = sum(Decimal(str(t.amount)) for t in available_debits)
-
-                available_account.balance = total_credits - total_debits
-                merchant_account.available_balance = available_account.balance
+    @staticmethod
+    def _recalculate(db: Session, merchant_filter, apply: bool) -> list[dict]:
+        """Report (and with `apply`, correct) drift for the matching merchants in the current transaction."""
+        if apply:
+            # Lock the balance rows in id order so postings and settlement wait for the correction.
+            db.query(db_models.Account.id).join(
+                db_models.MerchantAccount, db_models.MerchantAccount.merchant_id == db_models.Account.merchant_id
+            ).filter(
+                merchant_filter,
+                db_models.Account.account_type.in_(tuple(MERCHANT_BALANCE_FIELDS)),
+            ).order_by(db_models.Account.id).with_for_update(of=db_models.Account).all()
+
+        drift = [dict(row._mapping) for row in db.execute(BalanceService._drift_query(merchant_filter))]
+        if apply and drift:
+            db.execute(update(db_models.Account), [
+                {"id": row["account_id"], "balance": row["recomputed"]} for row in drift
+            ])
+            for row in drift:
+                db.query(db_models.MerchantAccount).filter_by(merchant_id=row["merchant_id"]).update(
+                    {MERCHANT_BALANCE_FIELDS[row["account_type"]]: row["recomputed"]}, synchronize_session=False
+                )
+            balance_cache.bump_on_commit(db, *{row["merchant_id"] for row in drift})
+        return drift
 
-                logger.info(f"Merchant {merchant_id} available balance recalculated: {available_account.balance}")
+    @staticmethod
+    def recalculate_merchant_balance(db: Session, merchant_id: str, apply: bool = True) -> list[dict]:
+        """
+        Recompute a merchant's pending and available balances from the ledger and
+        return the drift found: one dict per account whose stored balance, or
+        mirrored MerchantAccount balance, differed from the ledger.
+        Only materialized entries count; deferred ones are applied by LedgerService.materialize.
+        Raises MerchantAccountNotFoundError for an unknown merchant.
+        """
+        logger.info(f"Recalculating balances for merchant {merchant_id}")
+        if not db.query(db_models.MerchantAccount.id).filter_by(merchant_id=merchant_id).first():
+            logger.error(f"Merchant account {merchant_id} not found")
+            raise MerchantAccountNotFoundError(reason='No merchant with that id was found')
 
+        try:
+            drift = BalanceService._recalculate(db, db_models.MerchantAccount.merchant_id == merchant_id, apply)
             db.commit()
-            logger.info(f"Balance recalculation complete for merchant {merchant_id}")
+            for row in drift:
+                logger.warning(
+                    f"Merchant {merchant_id} {row['account_type'].value} drift: stored={row['stored']} "
+                    f"mirrored={row['mirrored']} ledger={row['recomputed']}"
+                )
+            logger.info(f"Balance recalculation complete for merchant {merchant_id} ({len(drift)} accounts drifted)")
+            return drift
 
         except Exception as e:
             db.rollback()
@@ -81,44 +109,27 @@ class BalanceService:
             raise
 
     @staticmethod
-    def sync_balances_from_charges(db: Session, merchant_id: str):
+    def recalculate_all(session_factory, apply: bool = False, chunk_size: int | None = None):
         """
-        Sync merchant balances based on actual charge statuses
+        Recompute every merchant's balances, BALANCE_RECOMPUTE_CHUNK_SIZE merchants
+        (by id range) per transaction, yielding drift rows as each chunk finishes.
         """
+        chunk_size = chunk_size or settings.BALANCE_RECOMPUTE_CHUNK_SIZE
+        merchant = db_models.MerchantAccount
+        db: Session = session_factory()
         try:
-            logger.info(f"Syncing balances from charges for merchant {merchant_id}")
-
-            merchant_account = db.query(db_models.MerchantAccount).filter_by(
-                merchant_id=merchant_id
-            ).with_for_update().first()
-
-            if not merchant_account:
-                logger.error(f"Merchant account {merchant_id} not found")
-                return
-
-            user = db.query(db_models.User).filter_by(id=merchant_account.user_id).first()
-            if not user:
-                logger.error(f"User not found for merchant {merchant_id}")
-                return
-
-            succeeded_charges = db.query(db_models.Charge).filter(
-                db_models.Charge.user_id == user.id,
-                db_models.Charge.status == 'succeeded'
-            ).all()
-
-            total_amount = sum(Decimal(str(c.amount)) for c in succeeded_charges)
-            fee_amount = total_amount * Decimal("0.02")
-            net_amount = total_amount - fee_amount
-
-            merchant_account.pending_balance = net_amount
-            merchant_account.available_balance = Decimal("0.00")
-
-            db.commit()
-
-            logger.info(f"Balance sync complete for merchant {merchant_id}: pending={net_amount}, available=0.00")
-
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error syncing balances for merchant {merchant_id}: {e}", exc_info=True)
-            raise
-
+            last_id = db.query(func.max(merchant.id)).scalar() or 0
+        finally:
+            db.close()
+
+        for low in range(0, last_id, chunk_size):
+            db = session_factory()
+            try:
+                drift = BalanceService._recalculate(db, (merchant.id > low) & (merchant.id <= low + chunk_size), apply)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            yield from drift
@@ -8,6 +8,7 @@ from app.schemas import kyc
 from ..models import db_models
 from ..utilities.exceptions import MerchantAccountNotFoundError, PermissionDeniedError, \
     VerificationError, KYCRequiredError
+from ..utilities import principal_cache
 from ..utilities.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -170,6 +171,7 @@ class KycService:
             merchant = db.query(db_models.MerchantAccount).filter_by(user_id=user.id).first()
             if merchant:
                 merchant.kyc_status = db_models.KYCStatus.pending
+                principal_cache.invalidate_on_commit(db, user_id=user.id)
                 logger.info(f'Updated merchant {merchant.merchant_id} KYC status to pending')
 
             db.commit()
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..models import db_models
+from ..models.db_models import AccountType
+from ..utilities import balance_cache
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# SYSTEM_HOLDING stands for money outside the platform; its balance is not tracked.
+UNTRACKED_ACCOUNT_TYPES = (AccountType.SYSTEM_HOLDING,)
+
+MERCHANT_BALANCE_FIELDS = {
+    AccountType.MERCHANT_PENDING: "pending_balance",
+    AccountType.MERCHANT_AVAILABLE: "available_balance",
+}
+
+CHECKPOINT_NAME = "account_balances"
+
+
+class LedgerService:
+    """
+    Posting engine for ledger entries.
+
+    Every entry credits `credit_account_id` and debits `debit_account_id` by
+    `amount`. In "immediate" posting mode (the default) the balances of the
+    accounts involved, and the mirrored MerchantAccount.pending_balance /
+    available_balance, are updated in the posting transaction. In "deferred"
+    mode the posting only appends entries with materialized=False and
+    `materialize` applies them later in batches, so ingestion takes no
+    balance-row locks. `get_balances` always returns the materialized balance
+    plus the un-applied tail, read in one statement.
+    """
+
+    @staticmethod
+    def deferred() -> bool:
+        return settings.LEDGER_POSTING_MODE == "deferred"
+
+    @staticmethod
+    def post(db: Session, entries: list[db_models.LedgerTransaction]) -> None:
+        """Append `entries` and, in immediate mode, apply them to balances."""
+        deferred = LedgerService.deferred()
+        for entry in entries:
+            entry.materialized = not deferred
+        db.add_all(entries)
+        if not deferred:
+            LedgerService._apply(db, entries)
+        balance_cache.bump_on_commit(db, *{entry.merchant_id for entry in entries})
+
+    @staticmethod
+    def _deltas(entries) -> dict[int, Decimal]:
+        deltas: defaultdict[int, Decimal] = defaultdict(Decimal)
+        for entry in entries:
+            amount = Decimal(entry.amount)
+            deltas[entry.credit_account_id] += amount
+            deltas[entry.debit_account_id] -= amount
+        return deltas
+
+    @staticmethod
+    def _apply(db: Session, entries) -> None:
+        deltas = LedgerService._deltas(entries)
+        accounts = db.query(db_models.Account).filter(
+            db_models.Account.id.in_(deltas.keys()),
+            db_models.Account.account_type.notin_(UNTRACKED_ACCOUNT_TYPES)
+        ).order_by(db_models.Account.id).with_for_update().all()
+
+        merchant_deltas: defaultdict[tuple[str, str], Decimal] = defaultdict(Decimal)
+        for account in accounts:
+            delta = deltas[account.id]
+            if not delta:
+                continue
+            account.balance += delta
+            field = MERCHANT_BALANCE_FIELDS.get(account.account_type)
+            if field and account.merchant_id:
+                merchant_deltas[(account.merchant_id, field)] += delta
+
+        if merchant_deltas:
+            merchants = db.query(db_models.MerchantAccount).filter(
+                db_models.MerchantAccount.merchant_id.in_({merchant_id for merchant_id, _ in merchant_deltas})
+            ).order_by(db_models.MerchantAccount.merchant_id).with_for_update().all()
+            for merchant in merchants:
+                for field in MERCHANT_BALANCE_FIELDS.values():
+                    delta = merchant_deltas.get((merchant.merchant_id, field))
+                    if delta:
+                        setattr(merchant, field, (getattr(merchant, field) or Decimal("0")) + delta)
+
+    @staticmethod
+    def live_balance(account=db_models.Account):
+        """SQL expression for `account`'s balance including un-materialized entries.
+
+        `account` may be an alias of Account, so the expression can be used
+        inside larger set-based statements.
+        """
+        lt = db_models.LedgerTransaction
+        credits = select(func.coalesce(func.sum(lt.amount), 0)).where(
+            lt.credit_account_id == account.id, lt.materialized == False
+        ).scalar_subquery()
+        debits = select(func.coalesce(func.sum(lt.amount), 0)).where(
+            lt.debit_account_id == account.id, lt.materialized == False
+        ).scalar_subquery()
+        return account.balance + credits - debits
+
+    @staticmethod
+    def get_balances(db: Session, account_ids) -> dict[int, Decimal]:
+        """Current balance per account: materialized balance plus un-applied entries."""
+        account_ids = list(account_ids)
+        if not account_ids:
+            return {}
+        rows = db.execute(
+            select(db_models.Account.id, LedgerService.live_balance())
+            .where(db_models.Account.id.in_(account_ids))
+        ).all()
+        return {account_id: Decimal(balance) for account_id, balance in rows}
+
+    @staticmethod
+    def get_balance(db: Session, account: db_models.Account) -> Decimal:
+        if not LedgerService.deferred():
+            return Decimal(account.balance)
+        return LedgerService.get_balances(db, [account.id])[account.id]
+
+    @staticmethod
+    def materialize(db: Session, batch_size: int | None = None) -> int:
+        """
+        Apply one batch of un-materialized entries to balances and commit.
+
+        The checkpoint row is locked for the whole batch, so concurrent
+        materializers queue instead of applying an entry twice. Entries are
+        found through the materialized flag rather than by id, so an entry that
+        commits after a higher id was already applied is still picked up; the
+        checkpoint's last_entry_id records the highest id applied so far.
+        Returns the number of entries applied.
+        """
+        batch_size = batch_size or settings.LEDGER_MATERIALIZE_BATCH_SIZE
+        checkpoint = db.query(db_models.LedgerCheckpoint).filter_by(name=CHECKPOINT_NAME).with_for_update().first()
+        if not checkpoint:
+            checkpoint = db_models.LedgerCheckpoint(name=CHECKPOINT_NAME, last_entry_id=0)
+            db.add(checkpoint)
+            db.flush()
+
+        lt = db_models.LedgerTransaction
+        entries = db.query(lt.id, lt.amount, lt.debit_account_id, lt.credit_account_id).filter(
+            lt.materialized == False
+        ).order_by(lt.id).limit(batch_size).all()
+        if not entries:
+            db.commit()
+            return 0
+
+        LedgerService._apply(db, entries)
+        entry_ids = [entry.id for entry in entries]
+        db.execute(
+            update(lt).where(lt.id.in_(entry_ids)).values(materialized=True)
+            .execution_options(synchronize_session=False)
+        )
+        checkpoint.last_entry_id = max(checkpoint.last_entry_id, entry_ids[-1])
+        checkpoint.updated_at = func.now()
+        db.commit()
+        logger.info(f"Materialized {len(entries)} ledger entries up to id {entry_ids[-1]}")
+        return len(entries)
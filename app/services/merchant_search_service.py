@@ -0,0 +1,75 @@
+from sqlalchemy import case, func, or_, select, union
+from sqlalchemy.orm import Query, Session, contains_eager
+
+from ..models import db_models
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# pg_trgm cannot index a substring shorter than a trigram; shorter terms match by prefix.
+MIN_SUBSTRING_LENGTH = 3
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class MerchantSearchService:
+    """
+    Admin console search over merchant id, owner email and owner name.
+
+    Each column has a pg_trgm GIN index, so `ILIKE '%term%'` is an index scan
+    rather than a sequential scan of users and merchant_accounts. Matches on
+    each table are separate branches of a UNION so each can use its indexes;
+    an OR across the join could use none of them. Results are ranked: an
+    exact match beats a prefix match beats a substring match, summed over the
+    columns, then newest first.
+
+    Only a bounded candidate set is ranked: exact email and merchant id
+    matches, which are unique-index lookups, plus at most
+    MERCHANT_SEARCH_CANDIDATES substring matches per table. Each substring
+    branch stops once it has its share, so a broad term costs about what a
+    narrow one does; beyond the candidates, a broad term's other matches are
+    not listed until the term is narrowed.
+
+    The query is plain SQL, so it runs unchanged (unindexed) on SQLite and on
+    PostgreSQL servers without pg_trgm.
+    """
+
+    @staticmethod
+    def search_query(db: Session, term: str, candidates: int | None = None) -> Query:
+        merchant, user = db_models.MerchantAccount, db_models.User
+        candidates = candidates or settings.MERCHANT_SEARCH_CANDIDATES
+        term = term.strip().lower()
+        escaped = _escape_like(term)
+        pattern = f"%{escaped}%" if len(term) >= MIN_SUBSTRING_LENGTH else f"{escaped}%"
+        columns = (user.email, user.name, merchant.merchant_id)
+
+        # One branch per table: PostgreSQL can BitmapOr the two users indexes,
+        # but not an index on users with one on merchant_accounts.
+        substring_matches = (
+            select(merchant.id).join(user, user.id == merchant.user_id).where(
+                or_(user.email.ilike(pattern, escape="\\"), user.name.ilike(pattern, escape="\\"))
+            ),
+            select(merchant.id).where(merchant.merchant_id.ilike(pattern, escape="\\")),
+        )
+        matches = union(
+            select(merchant.id).join(user, user.id == merchant.user_id).where(user.email == term),
+            select(merchant.id).where(merchant.merchant_id == term),
+            *(select(branch.limit(candidates).subquery().c.id) for branch in substring_matches),
+        )
+        rank = sum(
+            case(
+                (func.lower(column) == term, 3),
+                (func.lower(column).like(f"{escaped}%", escape="\\"), 2),
+                (func.lower(column).like(f"%{escaped}%", escape="\\"), 1),
+                else_=0,
+            )
+            for column in columns
+        )
+        return db.query(merchant).join(user, user.id == merchant.user_id).options(
+            contains_eager(merchant.user_info)
+        ).filter(merchant.id.in_(select(matches.subquery().c.id))).order_by(
+            rank.desc(), merchant.created_at.desc(), merchant.id.desc()
+        )
@@ -1,9 +1,9 @@
 import secrets
 from typing import List
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 
-from sqlalchemy import func
+from sqlalchemy import Date, cast, func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
@@ -13,15 +13,24 @@ from ..schemas import api_key as api_key_schema
 from ..utilities.exceptions import (
     UserCreationError,
     DatabaseError,
+    InvalidCursorError,
     MerchantAccountNotFoundError,
     MerchantCreationError,
     ResourceNotFoundError,
 )
+from ..utilities.config import settings
 from ..utilities.logger import setup_logger
-from ..utilities.utils import hash_password
+from ..utilities import balance_cache, principal_cache
+from ..utilities.pagination import keyset_page
+from ..utilities.utils import hash_password, generate_api_key, api_key_digest
+from .ledger_service import LedgerService
 
 logger = setup_logger(__name__)
 
+# The BalanceHistory fields, in the order the streaming exports write them.
+BALANCE_HISTORY_COLUMNS = ("charge_id", "transaction_type", "amount", "currency", "created_at")
+HISTORY_GRANULARITIES = ("day", "week", "month")
+
 class MerchantService:
     @staticmethod
     def create_merchant_account(db: Session, data: mer.MerchantAccountCreate, user_id: int) -> db_models.MerchantAccount:
@@ -40,6 +49,7 @@ class MerchantService:
                 settlement_schedule=data.settlement_schedule
             )
             db.add(new_merchant)
+            principal_cache.invalidate_on_commit(db, user_id=user_id)
             db.commit()
             new_limit = db_models.TransactionLimit(
                 merchant_id=mer_id
@@ -129,6 +139,7 @@ class MerchantService:
                 logger.info(f"No update data provided for user_id: {user_id}")
                 return db_merchant
             merchant_query.update(update_dict, synchronize_session=False)
+            principal_cache.invalidate_on_commit(db, user_id=user_id)
             db.flush()
             db.refresh(db_merchant)
 
@@ -147,20 +158,28 @@ class MerchantService:
     def get_merchant_balance(db: Session, user_id: int) -> mer.MerchantBalanceRes:
         try:
             logger.info(f"Getting a merchant account balance for user_id: {user_id}")
+            cached = balance_cache.get(user_id)
+            if cached is not None:
+                return mer.MerchantBalanceRes(**cached)
+
             merchant = db.query(db_models.MerchantAccount).filter(db_models.MerchantAccount.user_id == user_id).first()
             if not merchant:
                 logger.warning(f"Merchant account not found for user_id: {user_id}")
                 raise MerchantAccountNotFoundError(reason='No merchant with that id was found')
 
-            pending_sum = db.query(func.coalesce(func.sum(db_models.Account.balance), 0)).filter(
+            # Read before the balances, so a posting committed meanwhile invalidates what we cache.
+            version = balance_cache.current_version(merchant.merchant_id)
+            accounts = db.query(db_models.Account.id, db_models.Account.account_type).filter(
                 db_models.Account.merchant_id == merchant.merchant_id,
-                db_models.Account.account_type == db_models.AccountType.MERCHANT_PENDING
-            ).scalar()
-
-            available_sum = db.query(func.coalesce(func.sum(db_models.Account.balance), 0)).filter(
-                db_models.Account.merchant_id == merchant.merchant_id,
-                db_models.Account.account_type == db_models.AccountType.MERCHANT_AVAILABLE
-            ).scalar()
+                db_models.Account.account_type.in_([
+                    db_models.AccountType.MERCHANT_PENDING,
+                    db_models.AccountType.MERCHANT_AVAILABLE
+                ])
+            ).all()
+            # includes ledger entries not yet materialized in deferred posting mode
+            balances = LedgerService.get_balances(db, [account_id for account_id, _ in accounts])
+            pending_sum = sum((balances[a_id] for a_id, a_type in accounts if a_type == db_models.AccountType.MERCHANT_PENDING), Decimal("0"))
+            available_sum = sum((balances[a_id] for a_id, a_type in accounts if a_type == db_models.AccountType.MERCHANT_AVAILABLE), Decimal("0"))
 
             reserved_balance = merchant.reserved_balance if getattr(merchant, 'reserved_balance', None) is not None else Decimal("0.0000")
 
@@ -168,12 +187,14 @@ class MerchantService:
                 f"Balances for merchant {merchant.merchant_id}: pending={pending_sum}, available={available_sum}, reserved={reserved_balance}"
             )
 
-            return mer.MerchantBalanceRes(
+            balance = mer.MerchantBalanceRes(
                 available_balance=available_sum,
                 pending_balance=pending_sum,
                 reserved_balance=reserved_balance,
                 currency=merchant.currency,
             )
+            balance_cache.put(user_id, merchant.merchant_id, version, balance.model_dump(mode="json"))
+            return balance
         except MerchantAccountNotFoundError:
             raise
         except Exception as e:
@@ -181,24 +202,65 @@ class MerchantService:
             raise DatabaseError(f"Exception: {e} while getting a merchant account balance")
 
     @staticmethod
-    def get_merchant_balance_history(db: Session, merchant_id: str) -> List[db_models.LedgerTransaction]:
+    def get_merchant_balance_history(
+        db: Session, merchant_id: str, limit: int = 100, cursor: str | None = None
+    ) -> tuple[List[db_models.LedgerTransaction], str | None]:
+        """One page of the merchant's ledger entries, newest first, and the cursor for the next."""
         try:
             logger.info(f"Getting a merchant account balance history for mer_id: {merchant_id}")
+            query = db.query(db_models.LedgerTransaction).filter(db_models.LedgerTransaction.merchant_id == merchant_id)
+            return keyset_page(query, db_models.LedgerTransaction, limit, cursor)
 
-            balance_hist = db.query(db_models.LedgerTransaction).filter(
-                db_models.LedgerTransaction.merchant_id == merchant_id
-            ).order_by(db_models.LedgerTransaction.created_at.desc()).all()
-
-            if not balance_hist:
-                logger.warning(f"No balance history was found for mer_id: {merchant_id}'s account")
-                return []
-
-            return balance_hist
-
+        except InvalidCursorError:
+            raise
         except Exception as e:
             logger.error(f"Exception: {e} while getting a merchant account balance history")
             raise DatabaseError(f"Exception: {e} while getting a merchant account balance history")
 
+    @staticmethod
+    def iter_merchant_balance_history(session_factory, merchant_id: str, batch_size: int | None = None):
+        """
+        Yield the merchant's whole balance history, newest first, as BALANCE_HISTORY_COLUMNS
+        tuples, fetched from a server-side cursor `batch_size` rows at a time.
+        Opens its own session, so it can outlive the request's.
+        """
+        lt = db_models.LedgerTransaction
+        statement = select(*(getattr(lt, column) for column in BALANCE_HISTORY_COLUMNS)).where(
+            lt.merchant_id == merchant_id
+        ).order_by(lt.created_at.desc(), lt.id.desc())
+        db: Session = session_factory()
+        try:
+            yield from db.execute(statement.execution_options(yield_per=batch_size or settings.BALANCE_HISTORY_STREAM_BATCH_SIZE))
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_merchant_balance_history_buckets(db: Session, merchant_id: str, granularity: str) -> List[dict]:
+        """Count and total of the merchant's ledger entries per `granularity` period, type and currency."""
+        if granularity not in HISTORY_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(HISTORY_GRANULARITIES)}")
+        lt = db_models.LedgerTransaction
+        if db.get_bind().dialect.name == "postgresql":
+            period = cast(func.date_trunc(granularity, lt.created_at), Date)
+        else:
+            period = {
+                "day": func.date(lt.created_at),
+                "week": func.date(lt.created_at, "-6 days", "weekday 1"),
+                "month": func.date(lt.created_at, "start of month"),
+            }[granularity]
+        period = period.label("period")
+        rows = db.execute(
+            select(period, lt.transaction_type, lt.currency, func.count().label("count"), func.sum(lt.amount).label("amount"))
+            .where(lt.merchant_id == merchant_id)
+            .group_by(period, lt.transaction_type, lt.currency)
+            .order_by(period.desc(), lt.transaction_type, lt.currency)
+        ).all()
+        return [
+            {"period": row.period, "transaction_type": row.transaction_type.value, "currency": row.currency,
+             "count": row.count, "amount": row.amount}
+            for row in rows
+        ]
+
     @staticmethod
     def update_limits(db: Session, merchant_id: str, limits_data: mer.TransactionLimits):
         """Update transaction limits for a merchant."""
@@ -420,7 +482,7 @@ class MerchantService:
 
             prefix = f"{'pk' if key_data.key_type == 'publishable' else 'sk'}_{key_data.environment}_"
 
-            raw_key = prefix + secrets.token_urlsafe(32)
+            lookup_id, raw_key = generate_api_key(prefix)
 
             hashed_key = hash_password(raw_key)
 
@@ -429,6 +491,8 @@ class MerchantService:
                 name=key_data.name,
                 api_key=hashed_key,
                 key_prefix=prefix,
+                lookup_id=lookup_id,
+                key_digest=api_key_digest(raw_key),
                 key_type=key_data.key_type,
                 environment=key_data.environment,
                 is_active=True
@@ -537,6 +601,54 @@ class MerchantService:
             logger.error(f"Exception: {e} while getting API key {key_id} for user_id: {user_id}", exc_info=True)
             raise DatabaseError(f"Failed to retrieve API key: {str(e)}")
 
+    @staticmethod
+    def get_api_key_usage(db: Session, user_id: int, key_id: int, days: int = 30) -> dict:
+        """
+        Get the per-day request histogram for an API key.
+
+        Counts come from api_key_usage_daily, which is written in bulk by the
+        usage flush, so the most recent few seconds of traffic may be missing.
+
+        Args:
+            db: Database session
+            user_id: User ID to get merchant account for
+            key_id: API key ID
+            days: Number of UTC days to return, ending today
+
+        Returns:
+            Dict with key_id, last_used_at, total_requests and one entry per day
+
+        Raises:
+            MerchantAccountNotFoundError: If merchant account is not found
+            ResourceNotFoundError: If API key is not found
+            DatabaseError: If any database error occurs
+        """
+        api_key = MerchantService.get_api_key_by_id(db=db, user_id=user_id, key_id=key_id)
+        try:
+            today = datetime.now(timezone.utc).date()
+            start = today - timedelta(days=days - 1)
+            rows = db.query(
+                db_models.APIKeyUsageDaily.day,
+                db_models.APIKeyUsageDaily.request_count
+            ).filter(
+                db_models.APIKeyUsageDaily.api_key_id == api_key.id,
+                db_models.APIKeyUsageDaily.day >= start
+            ).all()
+            counts = {day: count for day, count in rows}
+            histogram = [
+                {"day": start + timedelta(days=i), "request_count": counts.get(start + timedelta(days=i), 0)}
+                for i in range(days)
+            ]
+            return {
+                "key_id": api_key.id,
+                "last_used_at": api_key.last_used_at,
+                "total_requests": sum(counts.values()),
+                "days": histogram,
+            }
+        except Exception as e:
+            logger.error(f"Exception: {e} while getting usage for API key {key_id}", exc_info=True)
+            raise DatabaseError(f"Failed to retrieve API key usage: {str(e)}")
+
     @staticmethod
     def update_api_key(db: Session, user_id: int, key_id: int, update_data: api_key_schema.APIKeyUpdate) -> db_models.APIKey:
         """
@@ -609,6 +721,7 @@ class MerchantService:
             api_key.revoke_reason = reason
 
             db.flush()
+            principal_cache.invalidate_on_commit(db, key_digest=api_key.key_digest)
             db.refresh(api_key)
 
             logger.info(f"Revoked API key {key_id} - Reason: {reason or 'Not specified'}")
@@ -660,6 +773,7 @@ class MerchantService:
             old_key.revoke_reason = f"Rolled to new key (ID: {new_key.id})"
 
             db.flush()
+            principal_cache.invalidate_on_commit(db, key_digest=old_key.key_digest)
 
             logger.info(f"Rolled API key {key_id} to new key {new_key.id}")
             return new_key, raw_key
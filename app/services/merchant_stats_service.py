@@ -0,0 +1,226 @@
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import Date, cast, func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+
+from ..models import db_models
+from ..models.db_models import TransactionType
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CHECKPOINT_NAME = "merchant_daily_stats"
+
+# In the column order of the selects passed to _upsert.
+STAT_FIELDS = (
+    "charge_count", "failed_charge_count", "gross_volume", "fees", "net_volume",
+    "payout_count", "payout_volume", "refund_count", "refund_volume",
+)
+COUNT_FIELDS = ("charge_count", "failed_charge_count", "payout_count", "refund_count")
+GRANULARITIES = ("day", "week", "month")
+
+
+def _utc_day(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.timezone("UTC", column), Date)
+    return func.date(column)
+
+
+def _period(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+class MerchantStatsService:
+    """
+    Maintains merchant_daily_stats, the per-merchant daily totals that
+    analytics read instead of charges and ledger_transactions.
+
+    Money columns come from the ledger. `rollup` folds in entries whose
+    stats_rolled_up flag is still unset and sets it in the same transaction,
+    the way LedgerService.materialize uses the materialized flag. An entry
+    whose transaction commits after higher ids were rolled up is still
+    picked up, however long that transaction ran. Failed charges have no
+    ledger entries, so the charge task counts them with
+    `record_failed_charge`. `backfill` recomputes a date range from both
+    sources.
+
+    For each merchant, day and currency:
+    - gross, fees and net are charge credits and their fees;
+    - payout_volume is the net outflow of payout-linked entries, so fees are
+      included and reversals of cancelled payouts are subtracted;
+    - payout_count counts PAYOUT entries.
+    """
+
+    @staticmethod
+    def _upsert(db: Session, select_stmt) -> None:
+        """Add the (merchant_id, day, currency, *STAT_FIELDS) rows of `select_stmt` to the stats."""
+        table = db_models.MerchantDailyStats.__table__
+        upsert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = upsert(table).from_select(["merchant_id", "day", "currency", *STAT_FIELDS], select_stmt)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.merchant_id, table.c.day, table.c.currency],
+            set_={field: table.c[field] + stmt.excluded[field] for field in STAT_FIELDS},
+        ))
+
+    @staticmethod
+    def _ledger_totals(db: Session, condition):
+        lt, debit = db_models.LedgerTransaction, aliased(db_models.Account)
+        is_charge = (lt.transaction_type == TransactionType.CHARGE) & lt.charge_id.isnot(None)
+        is_charge_fee = (lt.transaction_type == TransactionType.FEE) & lt.charge_id.isnot(None)
+        is_payout = lt.payout_id.isnot(None)
+        is_refund = lt.transaction_type == TransactionType.REFUND
+        outflow = func.sum(lt.amount).filter(is_payout, debit.merchant_id.isnot(None))
+        inflow = func.sum(lt.amount).filter(is_payout, debit.merchant_id.is_(None))
+        day = _utc_day(db, lt.created_at)
+
+        def total(aggregate):
+            return func.coalesce(aggregate, 0)
+
+        return select(
+            lt.merchant_id,
+            day,
+            lt.currency,
+            func.count().filter(is_charge),
+            literal(0),
+            total(func.sum(lt.amount).filter(is_charge | is_charge_fee)),
+            total(func.sum(lt.amount).filter(is_charge_fee)),
+            total(func.sum(lt.amount).filter(is_charge)),
+            func.count().filter(is_payout, lt.transaction_type == TransactionType.PAYOUT),
+            total(outflow) - total(inflow),
+            func.count().filter(is_refund),
+            total(func.sum(lt.amount).filter(is_refund)),
+        ).outerjoin(debit, debit.id == lt.debit_account_id).where(
+            condition, is_charge | is_charge_fee | is_payout | is_refund
+        ).group_by(lt.merchant_id, day, lt.currency)
+
+    @staticmethod
+    def _failed_charge_totals(db: Session, condition):
+        charge, merchant = db_models.Charge, db_models.MerchantAccount
+        day = _utc_day(db, charge.created_at)
+        zero = literal(0)
+        return select(
+            merchant.merchant_id, day, charge.currency,
+            zero, func.count(), zero, zero, zero, zero, zero, zero, zero,
+        ).join(merchant, merchant.user_id == charge.user_id).where(
+            condition, charge.status == "failed"
+        ).group_by(merchant.merchant_id, day, charge.currency)
+
+    @staticmethod
+    def _lock_checkpoint(db: Session) -> db_models.LedgerCheckpoint:
+        checkpoint = db.query(db_models.LedgerCheckpoint).filter_by(name=CHECKPOINT_NAME).with_for_update().first()
+        if not checkpoint:
+            checkpoint = db_models.LedgerCheckpoint(name=CHECKPOINT_NAME, last_entry_id=0)
+            db.add(checkpoint)
+            db.flush()
+        return checkpoint
+
+    @staticmethod
+    def rollup(db: Session, batch_size: int | None = None) -> int:
+        """
+        Fold the next batch of entries not yet rolled up into the stats and
+        commit; return the number of entries. The checkpoint row is locked for
+        the whole batch, so concurrent rollups and backfills queue.
+        """
+        checkpoint = MerchantStatsService._lock_checkpoint(db)
+        lt = db_models.LedgerTransaction
+        entry_ids = db.scalars(
+            select(lt.id).where(lt.stats_rolled_up == False).order_by(lt.id)
+            .limit(batch_size or settings.STATS_ROLLUP_BATCH_SIZE)
+        ).all()
+        if not entry_ids:
+            db.commit()
+            return 0
+
+        MerchantStatsService._upsert(db, MerchantStatsService._ledger_totals(db, lt.id.in_(entry_ids)))
+        db.execute(
+            update(lt).where(lt.id.in_(entry_ids)).values(stats_rolled_up=True)
+            .execution_options(synchronize_session=False)
+        )
+        checkpoint.last_entry_id = max(checkpoint.last_entry_id, entry_ids[-1])
+        checkpoint.updated_at = func.now()
+        db.commit()
+        logger.info(f"Rolled {len(entry_ids)} ledger entries into merchant stats up to id {entry_ids[-1]}")
+        return len(entry_ids)
+
+    @staticmethod
+    def backfill(db: Session, start: date, end: date) -> int:
+        """
+        Recompute the stats for days `start`..`end` (inclusive) from the
+        entries already rolled up, plus failed charges, and commit. Entries
+        not rolled up yet are left to `rollup`. Returns the rows written.
+        """
+        MerchantStatsService._lock_checkpoint(db)
+        stats = db_models.MerchantDailyStats
+        db.query(stats).filter(stats.day >= start, stats.day <= end).delete(synchronize_session=False)
+
+        since = datetime.combine(start, time(), timezone.utc)
+        until = datetime.combine(end + timedelta(days=1), time(), timezone.utc)
+        lt, charge = db_models.LedgerTransaction, db_models.Charge
+        MerchantStatsService._upsert(db, MerchantStatsService._ledger_totals(
+            db, (lt.stats_rolled_up == True) & (lt.created_at >= since) & (lt.created_at < until)
+        ))
+        MerchantStatsService._upsert(db, MerchantStatsService._failed_charge_totals(
+            db, (charge.created_at >= since) & (charge.created_at < until)
+        ))
+        rows = db.query(func.count()).select_from(stats).filter(stats.day >= start, stats.day <= end).scalar()
+        db.commit()
+        logger.info(f"Backfilled merchant stats for {start}..{end}: {rows} rows")
+        return rows
+
+    @staticmethod
+    def record_failed_charge(db: Session, charge: db_models.Charge, merchant_id: str | None = None) -> None:
+        """Count a charge that failed, in the caller's transaction."""
+        merchant_id = merchant_id or db.query(db_models.MerchantAccount.merchant_id).filter_by(user_id=charge.user_id).scalar()
+        if not merchant_id:
+            return
+        created_at = charge.created_at or datetime.now(timezone.utc)
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        row = {"merchant_id": merchant_id, "day": created_at.astimezone(timezone.utc).date(), "currency": charge.currency}
+        MerchantStatsService._upsert(db, select(
+            literal(row["merchant_id"]), literal(row["day"]), literal(row["currency"]),
+            *(literal(1 if field == "failed_charge_count" else 0) for field in STAT_FIELDS),
+        ))
+
+    @staticmethod
+    def series(db: Session, start: date, end: date, granularity: str = "day", merchant_id: str | None = None) -> dict:
+        """Stats for `start`..`end` per period and currency, with per-currency totals, read from the rollups only."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        stats = db_models.MerchantDailyStats
+        query = db.query(
+            stats.day, stats.currency, *(func.sum(getattr(stats, field)).label(field) for field in STAT_FIELDS)
+        ).filter(stats.day >= start, stats.day <= end)
+        if merchant_id:
+            query = query.filter(stats.merchant_id == merchant_id)
+        rows = query.group_by(stats.day, stats.currency).all()
+
+        def empty():
+            return {field: 0 if field in COUNT_FIELDS else Decimal("0") for field in STAT_FIELDS}
+
+        buckets: dict[tuple[date, str], dict] = {}
+        totals: dict[str, dict] = {}
+        for row in rows:
+            bucket = buckets.setdefault((_period(row.day, granularity), row.currency), empty())
+            total = totals.setdefault(row.currency, empty())
+            for field in STAT_FIELDS:
+                value = getattr(row, field) or 0
+                bucket[field] += value
+                total[field] += value
+        return {
+            "start": start,
+            "end": end,
+            "granularity": granularity,
+            "series": [
+                {"period": period, "currency": currency, **values}
+                for (period, currency), values in sorted(buckets.items())
+            ],
+            "totals": [{"currency": currency, **values} for currency, values in sorted(totals.items())],
+        }
@@ -1,5 +1,11 @@
+from collections import Counter
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from app.models import db_models
+from app.utilities import event_stream
+from app.utilities.pagination import keyset_page
 from app.utilities.logger import setup_logger
 from app.utilities.exceptions import ResourceNotFoundError
 from datetime import datetime, timezone
@@ -7,29 +13,46 @@ from datetime import datetime, timezone
 logger = setup_logger(__name__)
 
 class NotificationService:
+    """
+    Merchant notifications and their unread counters.
+
+    Every write that adds or reads notifications keeps the merchant's row in
+    notification_counters in step, in the same transaction, so the unread
+    badge is a primary-key lookup however long the history grows. New
+    notifications are also pushed to the merchant's event stream once the
+    transaction commits.
+    """
+
     @staticmethod
-    def list_notifications(db: Session, merchant_id: str, limit: int = 50, skip: int = 0):
-        return db.query(db_models.Notification).filter_by(merchant_id=merchant_id).order_by(db_models.Notification.created_at.desc()).offset(skip).limit(limit).all()
+    def list_notifications(db: Session, merchant_id: str, limit: int = 50, skip: int = 0, cursor: str | None = None):
+        """Return (notifications, cursor for the next page or None), newest first."""
+        query = db.query(db_models.Notification).filter_by(merchant_id=merchant_id)
+        return keyset_page(query, db_models.Notification, limit, cursor, skip)
 
     @staticmethod
     def get_unread_count(db: Session, merchant_id: str):
-        return db.query(db_models.Notification).filter_by(merchant_id=merchant_id, is_read=False).count()
+        unread = db.query(db_models.NotificationCounter.unread).filter_by(merchant_id=merchant_id).scalar()
+        return unread or 0
 
     @staticmethod
     def mark_read(db: Session, merchant_id: str, notification_id: int):
         n = db.query(db_models.Notification).filter_by(merchant_id=merchant_id, id=notification_id).first()
         if not n:
             raise ResourceNotFoundError('Notification')
-        n.is_read = True
-        n.updated_at = datetime.now(timezone.utc)
-        db.add(n)
+        flipped = db.execute(
+            update(db_models.Notification).where(
+                db_models.Notification.id == notification_id, db_models.Notification.is_read == False
+            ).values(is_read=True, updated_at=datetime.now(timezone.utc)).execution_options(synchronize_session=False)
+        ).rowcount
+        NotificationService._add_unread(db, {merchant_id: -flipped})
         db.commit()
         db.refresh(n)
         return n
 
     @staticmethod
     def mark_all_read(db: Session, merchant_id: str):
-        db.query(db_models.Notification).filter_by(merchant_id=merchant_id, is_read=False).update({'is_read': True})
+        flipped = db.query(db_models.Notification).filter_by(merchant_id=merchant_id, is_read=False).update({'is_read': True})
+        NotificationService._add_unread(db, {merchant_id: -flipped})
         db.commit()
         return True
 
@@ -44,7 +67,45 @@ class NotificationService:
             is_read=False
         )
         db.add(n)
+        NotificationService._add_unread(db, {merchant_id: 1})
+        NotificationService._publish(db, [{"merchant_id": merchant_id, "type": type, "message": message, "data": data}])
         db.commit()
-        db.refresh(n)
         logger.info(f"Notification created for merchant {merchant_id}: {type} - {message}")
         return n
+
+    @staticmethod
+    def bulk_create(db: Session, notifications: list[dict]) -> int:
+        """
+        Insert notifications (dicts of Notification columns) with one INSERT and
+        one counter upsert, in the caller's transaction. Returns the number inserted.
+        """
+        if not notifications:
+            return 0
+        db.execute(insert(db_models.Notification), [{"is_read": False, **n} for n in notifications])
+        NotificationService._add_unread(db, Counter(
+            n["merchant_id"] for n in notifications if n.get("merchant_id") and not n.get("is_read")
+        ))
+        NotificationService._publish(db, notifications)
+        return len(notifications)
+
+    @staticmethod
+    def _publish(db: Session, notifications: list[dict]) -> None:
+        for n in notifications:
+            event_stream.publish_on_commit(db, n.get("merchant_id"), "notification", {
+                "type": n["type"], "message": n["message"], "data": n.get("data"),
+            })
+
+    @staticmethod
+    def _add_unread(db: Session, deltas: dict[str, int]) -> None:
+        rows = [{"merchant_id": merchant_id, "unread": delta} for merchant_id, delta in sorted(deltas.items()) if merchant_id and delta]
+        if not rows:
+            return
+        table = db_models.NotificationCounter.__table__
+        dialect = db.get_bind().dialect.name
+        upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = upsert(table).values(rows)
+        # Rows are sorted by merchant so concurrent writers lock counters in the same order.
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.merchant_id],
+            set_={"unread": table.c.unread + stmt.excluded.unread},
+        ))
@@ -0,0 +1,155 @@
+"""
+Transactional outbox for domain events.
+
+Tasks that change money (charges, payouts) record what happened with
+`OutboxService.publish` in the same transaction as their ledger entries, so
+the change and its event commit or roll back together in one commit. The
+relay (`relay_outbox_task` on a beat schedule, or the dedicated
+`python -m app.services.outbox_service` process) drains unpublished events in
+id order, OUTBOX_BATCH_SIZE at a time, and fans each batch out in a single
+transaction: webhook deliveries for subscribed endpoints, merchant
+notifications and audit log rows are bulk inserted and the events are marked
+published. Webhook deliveries are dispatched only after that commit.
+
+Publication is at-least-once: a relay that dies before committing leaves its
+batch unpublished for the next run, and deliveries it committed but never
+dispatched are sent by the retry sweep (WebhookService.release_undispatched). Batches are claimed with SKIP LOCKED, so
+several relays can run at once without handing out the same event twice.
+"""
+import json
+import signal
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from ..models import db_models
+from ..utilities import webhook_subscriptions
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+from .notification_service import NotificationService
+from .webhook_service import WebhookService
+
+logger = setup_logger(__name__)
+
+
+class OutboxService:
+    @staticmethod
+    def publish(
+        db: Session,
+        event_type: str,
+        merchant_id: str | None,
+        user_id: int | None = None,
+        webhook: dict | None = None,
+        notification: dict | None = None,
+        audit: dict | None = None,
+    ) -> db_models.OutboxEvent:
+        """
+        Add an event to the current transaction; nothing is committed.
+
+        `webhook` is the payload sent to endpoints subscribed to `event_type`.
+        `notification` holds the merchant notification's message and data, and
+        `audit` the AuditLog action, resource_type, resource_id and extra_data.
+        """
+        sections = {"webhook": webhook, "notification": notification, "audit": audit}
+        event = db_models.OutboxEvent(
+            event_type=event_type,
+            merchant_id=merchant_id,
+            user_id=user_id,
+            payload=json.dumps({name: section for name, section in sections.items() if section is not None}),
+        )
+        db.add(event)
+        return event
+
+    @staticmethod
+    def relay(db: Session, batch_size: int | None = None) -> tuple[int, list[int]]:
+        """
+        Fan out one batch of unpublished events and mark it published.
+
+        Returns (number of events published, ids of the webhook deliveries
+        created); the deliveries are committed and are for the caller to dispatch.
+        """
+        outbox = db_models.OutboxEvent
+        events = db.query(outbox.id, outbox.event_type, outbox.merchant_id, outbox.user_id, outbox.payload).filter(
+            outbox.published_at.is_(None)
+        ).order_by(outbox.id).limit(batch_size or settings.OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True).all()
+        if not events:
+            db.commit()
+            return 0, []
+
+        payloads = {event.id: json.loads(event.payload) for event in events}
+        subscribed: dict[str, dict[str, list[int]]] = {}
+        for event_type in {event.event_type for event in events if "webhook" in payloads[event.id]}:
+            merchant_ids = [e.merchant_id for e in events if e.event_type == event_type and e.merchant_id]
+            subscribed[event_type] = webhook_subscriptions.subscribers(db, merchant_ids, event_type)
+
+        deliveries, notifications, audits = [], [], []
+        for event in events:
+            payload = payloads[event.id]
+            if "webhook" in payload:
+                body = json.dumps(payload["webhook"])
+                deliveries.extend(
+                    {"webhook_id": endpoint_id, "event": event.event_type, "payload": body, "status": "pending", "attempts": 0}
+                    for endpoint_id in subscribed[event.event_type].get(event.merchant_id, [])
+                )
+            if "notification" in payload:
+                notifications.append({
+                    "merchant_id": event.merchant_id,
+                    "user_id": event.user_id,
+                    "type": event.event_type,
+                    "message": payload["notification"]["message"],
+                    "data": payload["notification"].get("data"),
+                })
+            if "audit" in payload:
+                audits.append({"user_id": event.user_id, "merchant_id": event.merchant_id, **payload["audit"]})
+
+        delivery_ids = []
+        if deliveries:
+            delivery_ids = list(db.scalars(insert(db_models.WebhookDelivery).returning(db_models.WebhookDelivery.id), deliveries))
+        NotificationService.bulk_create(db, notifications)
+        if audits:
+            db.execute(insert(db_models.AuditLog), audits)
+        db.execute(
+            update(outbox).where(outbox.id.in_([event.id for event in events]))
+            .values(published_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return len(events), delivery_ids
+
+    @staticmethod
+    def drain(session_factory, max_batches: int | None = None) -> int:
+        """Relay batches until the outbox is empty or max_batches is reached. Returns events published."""
+        published = 0
+        for _ in range(max_batches or settings.OUTBOX_RELAY_MAX_BATCHES):
+            db: Session = session_factory()
+            try:
+                count, delivery_ids = OutboxService.relay(db)
+            finally:
+                db.close()
+            WebhookService.dispatch_deliveries(delivery_ids)
+            published += count
+            if count < settings.OUTBOX_BATCH_SIZE:
+                break
+        return published
+
+
+def main():
+    from ..utilities.db_con import SessionLocal
+
+    stopping = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    logger.info(f"Outbox relay started: batch_size={settings.OUTBOX_BATCH_SIZE}")
+    while not stopping:
+        try:
+            if not OutboxService.drain(SessionLocal):
+                time.sleep(settings.OUTBOX_RELAY_POLL_SECONDS)
+        except Exception as e:
+            logger.exception(f"Outbox relay failed, retrying: {e}")
+            time.sleep(settings.OUTBOX_RELAY_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
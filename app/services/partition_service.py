@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Tables range-partitioned by month on created_at (migration f1c7a2e94b36).
+PARTITIONED_TABLES = ("ledger_transactions", "audit_logs")
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _partition_month(table: str, name: str) -> date | None:
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})(\d{{2}})", name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+class PartitionService:
+    """
+    Upkeep of the monthly partitions of ledger_transactions and audit_logs
+    on PostgreSQL.
+
+    `ensure_partitions` creates the partitions for the current month and the
+    next PARTITION_MONTHS_AHEAD, so inserts never land in the default
+    partition. `archive_partitions` detaches every partition that ended more
+    than the table's retention ago, exports it to a gzipped CSV under
+    PARTITION_ARCHIVE_DIR, records it in the directory's manifest and drops
+    it. A partition detached by a run that died before dropping it is
+    exported by the next run.
+
+    Both are no-ops for tables that are not partitioned, such as on SQLite or
+    a database created with `create_all`.
+    """
+
+    @staticmethod
+    def retention_months(table: str) -> int | None:
+        # Off for the ledger by default: balance recomputation sums the whole ledger.
+        return {
+            "ledger_transactions": settings.LEDGER_RETENTION_MONTHS,
+            "audit_logs": settings.AUDIT_LOG_RETENTION_MONTHS,
+        }[table]
+
+    @staticmethod
+    def is_partitioned(db: Session, table: str) -> bool:
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        return bool(db.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+        ).scalar())
+
+    @staticmethod
+    def ensure_partitions(db: Session, months_ahead: int | None = None, now: datetime | None = None) -> list[str]:
+        """Create any missing partitions up to `months_ahead` months from now; return their names."""
+        months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        this_month = (now or datetime.now(timezone.utc)).date().replace(day=1)
+        created = []
+        for table in PARTITIONED_TABLES:
+            if not PartitionService.is_partitioned(db, table):
+                continue
+            for offset in range(months_ahead + 1):
+                month = add_months(this_month, offset)
+                name = partition_name(table, month)
+                if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+                    continue
+                try:
+                    with db.begin_nested():
+                        db.execute(text(
+                            f"CREATE TABLE {name} PARTITION OF {table} "
+                            f"FOR VALUES FROM ('{month} 00:00:00+00') TO ('{add_months(month, 1)} 00:00:00+00')"
+                        ))
+                except Exception as e:
+                    # Rows for that month in the default partition block the new one.
+                    logger.error(f"Could not create partition {name}: {e}")
+                    continue
+                created.append(name)
+        db.commit()
+        if created:
+            logger.info(f"Created partitions: {', '.join(created)}")
+        return created
+
+    @staticmethod
+    def _archivable(db: Session, table: str, cutoff: date) -> list[tuple[str, date, bool]]:
+        """(partition, month, still attached) for the table's partitions that ended before `cutoff`."""
+        rows = db.execute(text("""
+            SELECT c.relname, i.inhrelid IS NOT NULL
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+            WHERE c.relnamespace = to_regnamespace(current_schema()) AND c.relkind = 'r' AND c.relname LIKE :pattern
+        """), {"pattern": f"{table}\\_p%"}).all()
+        found = []
+        for name, attached in rows:
+            month = _partition_month(table, name)
+            if month and add_months(month, 1) <= cutoff:
+                found.append((name, month, attached))
+        return sorted(found, key=lambda row: row[1])
+
+    @staticmethod
+    def _export(db: Session, table: str, name: str, month: date, archive_dir: str) -> dict:
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        rows = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        raw = db.connection().connection
+        with raw.cursor() as cursor, gzip.open(path, "wb") as out:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as archived:
+            for block in iter(lambda: archived.read(1 << 20), b""):
+                digest.update(block)
+        entry = {
+            "table": table,
+            "partition": name,
+            "from": month.isoformat(),
+            "to": add_months(month, 1).isoformat(),
+            "rows": rows,
+            "file": os.path.basename(path),
+            "bytes": os.path.getsize(path),
+            "sha256": digest.hexdigest(),
+            "archived_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(os.path.join(archive_dir, MANIFEST_NAME), "a") as manifest:
+            manifest.write(json.dumps(entry) + "\n")
+        return entry
+
+    @staticmethod
+    def archive_partitions(db: Session, archive_dir: str | None = None, now: datetime | None = None) -> list[dict]:
+        """Detach, export and drop partitions past their table's retention; return their manifest entries."""
+        archive_dir = archive_dir or settings.PARTITION_ARCHIVE_DIR
+        this_month = (now or datetime.now(timezone.utc)).date().replace(day=1)
+        archived = []
+        for table in PARTITIONED_TABLES:
+            retention = PartitionService.retention_months(table)
+            if retention is None or not PartitionService.is_partitioned(db, table):
+                continue
+            os.makedirs(archive_dir, exist_ok=True)
+            for name, month, attached in PartitionService._archivable(db, table, add_months(this_month, -retention)):
+                if table == "ledger_transactions" and db.execute(
+                    text(f"SELECT 1 FROM {name} WHERE NOT materialized LIMIT 1")
+                ).scalar():
+                    logger.warning(f"Not archiving {name}: it has entries not yet applied to balances")
+                    continue
+                if attached:
+                    db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    db.commit()
+                entry = PartitionService._export(db, table, name, month, archive_dir)
+                db.execute(text(f"DROP TABLE {name}"))
+                db.commit()
+                logger.info(f"Archived {name} ({entry['rows']} rows) to {entry['file']}")
+                archived.append(entry)
+        return archived
@@ -1,16 +1,27 @@
 import uuid
 import os
 
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.tasks import process_charge_task
 from ..models import db_models
 from ..schemas import charges as charge_schema
-from ..utilities.exceptions import ChargeCreationError
+from ..utilities import idempotency
+from ..utilities.exceptions import ChargeCreationError, IdempotencyKeyReusedError
 from ..utilities.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+DISPATCH_CHUNK_SIZE = 50
+
+
+def _process_inline() -> bool:
+    in_pytest = "PYTEST_CURRENT_TEST" in os.environ
+    eager_env = os.getenv("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true"
+    return in_pytest or eager_env
+
 class ChargeService:
     @staticmethod
     def create_charge(db: Session, user: db_models.User, charge_data: charge_schema.ChargeCreate) -> db_models.Charge:
@@ -22,6 +33,7 @@ class ChargeService:
                 user_id=user.id, idempotency_key=charge_data.idempotency_key
             ).first()
             if original_charge:
+                 ChargeService._check_idempotent_match(original_charge, charge_data)
                  logger.warning(f"Idempotency key {charge_data.idempotency_key} reused by user {user.id}. Returning original charge {original_charge.id}.")
                  return original_charge
 
@@ -40,12 +52,22 @@ class ChargeService:
             )
 
             db.add(new_charge)
-            db.commit()
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent request with the same idempotency key committed first.
+                db.rollback()
+                if not charge_data.idempotency_key:
+                    raise
+                original_charge = db.query(db_models.Charge).filter_by(
+                    user_id=user.id, idempotency_key=charge_data.idempotency_key
+                ).one()
+                ChargeService._check_idempotent_match(original_charge, charge_data)
+                logger.warning(f"Idempotency key {charge_data.idempotency_key} raced for user {user.id}. Returning original charge {original_charge.id}.")
+                return original_charge
             db.refresh(new_charge)
 
-            in_pytest = "PYTEST_CURRENT_TEST" in os.environ
-            eager_env = os.getenv("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true"
-            if in_pytest or eager_env:
+            if _process_inline():
                 process_charge_task.run(charge_id=new_charge.id)
             elif charge_data.payment_token:
                 process_charge_task.delay(charge_id=new_charge.id, payment_token=charge_data.payment_token)
@@ -56,7 +78,132 @@ class ChargeService:
             updated_charge = db.query(db_models.Charge).filter_by(id=new_charge.id).first()
             return updated_charge  # type: ignore[return-value]
 
+        except IdempotencyKeyReusedError:
+            raise
         except Exception as e:
             db.rollback()
             logger.error(f"API Error: {e} while creating initial charge for user {user.id}", exc_info=True)
             raise ChargeCreationError(f"Failed to create charge: {e}")
+
+    @staticmethod
+    def _check_idempotent_match(original: db_models.Charge, charge_data: charge_schema.ChargeCreate) -> None:
+        if (
+            original.amount != charge_data.amount
+            or original.currency != charge_data.currency.upper()
+            or original.description != charge_data.description
+        ):
+            logger.warning(f"Idempotency key {charge_data.idempotency_key} reused with different parameters for charge {original.id}")
+            raise IdempotencyKeyReusedError()
+
+    @staticmethod
+    def create_charges_batch(db: Session, user: db_models.User, charges: list[charge_schema.ChargeCreate]) -> list[dict]:
+        """
+        Create many charges in one transaction.
+
+        Idempotency keys are checked against existing charges in a single query;
+        a key seen before (or earlier in the same batch) returns the original
+        charge instead of creating a new one, provided the parameters match as
+        they must for `create_charge`. An item reusing a key with different
+        parameters is rejected on its own, with an error, and the rest of the
+        batch goes ahead. New charges are inserted in bulk and handed to the
+        workers as chunked Celery groups.
+
+        Returns one result per input item, in input order.
+        """
+        logger.info(f"API: Creating batch of {len(charges)} charges for user {user.id}")
+        for attempt in range(2):
+            try:
+                return ChargeService._create_charges_batch(db, user, charges)
+            except IntegrityError:
+                # A concurrent request claimed one of our idempotency keys
+                # between the lookup and the insert; redo the lookup once.
+                db.rollback()
+                if attempt:
+                    raise ChargeCreationError("Idempotency key conflict while creating charge batch")
+                logger.warning(f"Idempotency conflict in charge batch for user {user.id}, retrying")
+            except ChargeCreationError:
+                raise
+            except Exception as e:
+                db.rollback()
+                logger.error(f"API Error: {e} while creating charge batch for user {user.id}", exc_info=True)
+                raise ChargeCreationError(f"Failed to create charges: {e}")
+
+    @staticmethod
+    def _create_charges_batch(db: Session, user: db_models.User, charges: list[charge_schema.ChargeCreate]) -> list[dict]:
+        keys = {c.idempotency_key for c in charges if c.idempotency_key}
+        existing = {}
+        if keys:
+            existing = {
+                charge.idempotency_key: charge
+                for charge in db.query(db_models.Charge).filter(
+                    db_models.Charge.user_id == user.id,
+                    db_models.Charge.idempotency_key.in_(keys)
+                )
+            }
+
+        rows, tokens, plan, claimed = [], {}, [], {}
+        for index, item in enumerate(charges):
+            key = item.idempotency_key
+            if key in existing:
+                try:
+                    ChargeService._check_idempotent_match(existing[key], item)
+                except IdempotencyKeyReusedError as e:
+                    plan.append((index, key, "rejected", None, str(e)))
+                    continue
+                plan.append((index, key, "duplicate", existing[key].id, None))
+                continue
+            if key and key in claimed:
+                charge_id, fingerprint = claimed[key]
+                if idempotency.request_fingerprint(item) != fingerprint:
+                    logger.warning(f"Idempotency key {key} repeated with different parameters within a batch for user {user.id}")
+                    plan.append((index, key, "rejected", None, str(IdempotencyKeyReusedError())))
+                    continue
+                plan.append((index, key, "duplicate", charge_id, None))
+                continue
+            charge_id = f"ch_{uuid.uuid4().hex}"
+            rows.append({
+                "id": charge_id,
+                "user_id": user.id,
+                "amount": item.amount,
+                "currency": item.currency.upper(),
+                "description": item.description,
+                "status": "pending",
+                "idempotency_key": key,
+            })
+            tokens[charge_id] = item.payment_token
+            if key:
+                claimed[key] = (charge_id, idempotency.request_fingerprint(item))
+            plan.append((index, key, "created", charge_id, None))
+
+        if rows:
+            db.execute(insert(db_models.Charge), rows)
+        db.commit()
+        logger.info(f"API: Inserted {len(rows)} charges for user {user.id}, {len(charges) - len(rows)} duplicates or rejected")
+
+        ChargeService._dispatch_charges(tokens)
+
+        db.expire_all()
+        charge_ids = {charge_id for _, _, _, charge_id, _ in plan if charge_id}
+        by_id = {
+            charge.id: charge
+            for charge in db.query(db_models.Charge).filter(db_models.Charge.id.in_(charge_ids))
+        }
+        return [
+            {"index": index, "idempotency_key": key, "status": outcome, "charge": by_id.get(charge_id), "error": error}
+            for index, key, outcome, charge_id, error in plan
+        ]
+
+    @staticmethod
+    def _dispatch_charges(tokens: dict[str, str | None]) -> None:
+        if not tokens:
+            return
+        if _process_inline():
+            for charge_id, token in tokens.items():
+                if token:
+                    process_charge_task.run(charge_id=charge_id, payment_token=token)
+                else:
+                    process_charge_task.run(charge_id=charge_id)
+            return
+        args = [(charge_id, token or "tok_valid_success") for charge_id, token in tokens.items()]
+        process_charge_task.chunks(args, DISPATCH_CHUNK_SIZE).group().apply_async()
+        logger.info(f"API: Dispatched {len(args)} charges to workers in chunks of {DISPATCH_CHUNK_SIZE}")
@@ -6,15 +6,36 @@ from decimal import Decimal
 from app.models import db_models
 from app.schemas import payout
 from app.services.merchant_service import MerchantService
-from app.utilities import exceptions as ex
+from app.services.ledger_service import LedgerService
+from app.services.platform_account_service import PlatformAccountService
+from app.utilities import exceptions as ex, principal_cache
+from app.utilities.cache import TwoTierCache
+from app.utilities.config import settings
 from app.utilities.exceptions import InsufficientFundsError
 from app.utilities.logger import setup_logger
+from app.utilities.pagination import keyset_page
 from app.tasks import process_payout_task
 
 logger = setup_logger(__name__)
 
 FEE_RATE = Decimal("0.005")
 
+# Settlement report totals by ledger transaction type. Charges tied to a payout
+# count towards its amount; other types only towards total_transactions.
+REPORT_FIELD_BY_TYPE = {
+    db_models.TransactionType.PAYOUT: "total_amount",
+    db_models.TransactionType.CHARGE: "total_amount",
+    db_models.TransactionType.FEE: "total_fees",
+    db_models.TransactionType.REFUND: "total_refunds",
+}
+REPORT_AMOUNTS = ("total_amount", "total_fees", "total_refunds", "total_chargebacks")
+
+_report_cache = TwoTierCache(
+    "settlement_report",
+    ttl=settings.SETTLEMENT_REPORT_CACHE_TTL_SECONDS,
+    local_ttl=settings.SETTLEMENT_REPORT_CACHE_LOCAL_TTL_SECONDS,
+)
+
 
 class PayoutAccountService:
 
@@ -193,7 +214,8 @@ class PayoutService:
             logger.warning(f"Payout currency {currency} does not match merchant currency {merchant.currency} for merchant {merchant.merchant_id}")
             raise ex.InvalidRequestError(f"Payout currency must match merchant currency ({merchant.currency})")
 
-        if amount > merchant.available_balance:
+        # The mirrored balance lags behind in deferred posting mode; the live check below covers it.
+        if not LedgerService.deferred() and amount > merchant.available_balance:
             raise InsufficientFundsError()
         # create payout row and reserve funds immediately by creating a ledger entry
         new_payout = db_models.Payout(
@@ -212,20 +234,14 @@ class PayoutService:
             db_models.Account.account_type == db_models.AccountType.MERCHANT_AVAILABLE,
             db_models.Account.currency == currency
         ).with_for_update().first()
-        payable_acct = db.query(db_models.Account).filter(
-            db_models.Account.account_type == db_models.AccountType.PLATFORM_PAYABLE,
-            db_models.Account.currency == currency
-        ).with_for_update().first()
 
         # compute fee before final balance checks
         fee_amount = (amount * FEE_RATE).quantize(Decimal("0.0001"))
-        if not available_acct or available_acct.balance < (amount + (fee_amount if fee_amount else Decimal('0'))):
+        if not available_acct or LedgerService.get_balance(db, available_acct) < (amount + (fee_amount if fee_amount else Decimal('0'))):
             raise InsufficientFundsError()
-        if not payable_acct:
-            # create platform payable if missing
-            payable_acct = db_models.Account(account_type=db_models.AccountType.PLATFORM_PAYABLE, currency=currency, balance=0)
-            db.add(payable_acct)
-            db.flush()
+        payable_acct = PlatformAccountService.get_account(
+            db, db_models.AccountType.PLATFORM_PAYABLE, currency, shard_key=str(new_payout.id)
+        )
 
         # create ledger entry to record reservation
         ledger_entry = db_models.LedgerTransaction(
@@ -239,24 +255,15 @@ class PayoutService:
             description=f"Payout reservation {new_payout.id}"
         )
 
-        # Add reservation ledger and apply balances in this transaction
+        # Post reservation ledger (moves payout amount from merchant available -> platform payable)
         try:
-            db.add(ledger_entry)
-            # apply reservation balances: move payout amount from merchant available -> platform payable
-            available_acct.balance -= amount
-            payable_acct.balance += amount
-            merchant.available_balance -= amount
+            entries = [ledger_entry]
 
             # create fee ledger (small platform fee) and move fee to PLATFORM_REVENUE
             if fee_amount and fee_amount > 0:
-                platform_revenue_acct = db.query(db_models.Account).filter(
-                    db_models.Account.account_type == db_models.AccountType.PLATFORM_REVENUE,
-                    db_models.Account.currency == currency
-                ).with_for_update().first()
-                if not platform_revenue_acct:
-                    platform_revenue_acct = db_models.Account(account_type=db_models.AccountType.PLATFORM_REVENUE, currency=currency, balance=0)
-                    db.add(platform_revenue_acct)
-                    db.flush()
+                platform_revenue_acct = PlatformAccountService.get_account(
+                    db, db_models.AccountType.PLATFORM_REVENUE, currency, shard_key=str(new_payout.id)
+                )
 
                 fee_ledger = db_models.LedgerTransaction(
                     payout_id=new_payout.id,
@@ -268,12 +275,8 @@ class PayoutService:
                     credit_account_id=platform_revenue_acct.id,
                     description=f"Payout fee {new_payout.id}"
                 )
-                db.add(fee_ledger)
-
-                # apply fee balances
-                available_acct.balance -= fee_amount
-                platform_revenue_acct.balance += fee_amount
-                merchant.available_balance -= fee_amount
+                entries.append(fee_ledger)
+            LedgerService.post(db, entries)
 
             # create audit log within the same transaction so commit is atomic
             audit = db_models.AuditLog(
@@ -335,25 +338,21 @@ class PayoutService:
         existing_ledgers = db.query(db_models.LedgerTransaction).filter(db_models.LedgerTransaction.payout_id == payout.id).all()
         try:
             if existing_ledgers:
-                for l in existing_ledgers:
-                    # create reversal ledger
-                    rev = db_models.LedgerTransaction(
+                # reverse each reservation entry by swapping its accounts, restoring balances
+                reversals = [
+                    db_models.LedgerTransaction(
                         payout_id=payout.id,
                         merchant_id=payout.merchant_id,
                         transaction_type=db_models.TransactionType.FEE,
-                        amount=-l.amount,
+                        amount=l.amount,
                         currency=l.currency,
                         debit_account_id=l.credit_account_id,
                         credit_account_id=l.debit_account_id,
                         description=f"Reversal for cancelled payout {payout.id}"
                     )
-                    db.add(rev)
-                    # adjust balances back
-                    da = db.query(db_models.Account).get(l.debit_account_id)
-                    ca = db.query(db_models.Account).get(l.credit_account_id)
-                    if da and ca:
-                        da.balance += l.amount
-                        ca.balance -= l.amount
+                    for l in existing_ledgers
+                ]
+                LedgerService.post(db, reversals)
 
             payout.status = db_models.PayoutStatus.FAILED
             payout.failure_reason = "cancelled_by_user"
@@ -379,37 +378,49 @@ class PayoutService:
             raise
 
     @staticmethod
-    def _aggregate_settlement_for_payout(db: Session, payout: db_models.Payout):
-        # Aggregate ledger transactions tied to this payout
-        ledger_rows = db.query(db_models.LedgerTransaction).filter(db_models.LedgerTransaction.payout_id == payout.id).all()
-        total_transactions = len(ledger_rows)
-        total_amount = Decimal('0')
-        total_fees = Decimal('0')
-        total_refunds = Decimal('0')
-        total_chargebacks = Decimal('0')
-        for lr in ledger_rows:
-            ttype = lr.transaction_type
-            # transaction_type may be an Enum member
-            if ttype == db_models.TransactionType.PAYOUT or (hasattr(ttype, 'name') and ttype.name == 'PAYOUT'):
-                total_amount += lr.amount
-            elif ttype == db_models.TransactionType.FEE or (hasattr(ttype, 'name') and ttype.name == 'FEE'):
-                total_fees += lr.amount
-            elif ttype == db_models.TransactionType.REFUND or (hasattr(ttype, 'name') and ttype.name == 'REFUND'):
-                total_refunds += lr.amount
-            elif ttype == db_models.TransactionType.CHARGE or (hasattr(ttype, 'name') and ttype.name == 'CHARGE'):
-                # charges are part of settlement flows; include in net if needed
-                total_amount += lr.amount
-
-        net_settlement = total_amount - total_fees - total_refunds - total_chargebacks
+    def _settlement_totals(db: Session, payouts: List[db_models.Payout]) -> dict[int, dict]:
+        """
+        Ledger totals of each payout, from one aggregate grouped by payout and
+        transaction type. Payouts that are no longer pending get no new ledger
+        rows, so their totals are cached; only the rest are queried.
+        """
+        totals = {}
+        settled = {str(p.id) for p in payouts if p.status != db_models.PayoutStatus.PENDING}
+        if settings.SETTLEMENT_REPORT_CACHE_ENABLED and settled:
+            for key, cached in _report_cache.get_many(settled).items():
+                totals[int(key)] = {field: Decimal(value) if field in REPORT_AMOUNTS else value for field, value in cached.items()}
+
+        missing = [p.id for p in payouts if p.id not in totals]
+        if not missing:
+            return totals
+        for payout_id in missing:
+            totals[payout_id] = {"total_transactions": 0, **{field: Decimal('0') for field in REPORT_AMOUNTS}}
+        lt = db_models.LedgerTransaction
+        rows = db.query(lt.payout_id, lt.transaction_type, func.count(lt.id), func.sum(lt.amount)).filter(
+            lt.payout_id.in_(missing)
+        ).group_by(lt.payout_id, lt.transaction_type).all()
+        for payout_id, transaction_type, count, amount in rows:
+            payout_totals = totals[payout_id]
+            payout_totals["total_transactions"] += count
+            field = REPORT_FIELD_BY_TYPE.get(transaction_type)
+            if field:
+                payout_totals[field] += amount or 0
+
+        if settings.SETTLEMENT_REPORT_CACHE_ENABLED:
+            _report_cache.set_many({
+                str(payout_id): {field: str(value) if field in REPORT_AMOUNTS else value for field, value in totals[payout_id].items()}
+                for payout_id in missing if str(payout_id) in settled
+            })
+        return totals
+
+    @staticmethod
+    def _settlement_report(payout: db_models.Payout, totals: dict):
+        net_settlement = totals["total_amount"] - totals["total_fees"] - totals["total_refunds"] - totals["total_chargebacks"]
         return {
             "merchant_id": payout.merchant_id,
             "settlement_period_start": payout.created_at,
             "settlement_period_end": payout.processed_at or payout.created_at,
-            "total_transactions": total_transactions,
-            "total_amount": total_amount,
-            "total_fees": total_fees,
-            "total_refunds": total_refunds,
-            "total_chargebacks": total_chargebacks,
+            **totals,
             "net_settlement": net_settlement,
             "currency": payout.currency,
             "status": payout.status.value if hasattr(payout.status, 'value') else str(payout.status),
@@ -420,11 +431,13 @@ class PayoutService:
         }
 
     @staticmethod
-    def list_settlement_reports(db: Session, user_id: int):
+    def list_settlement_reports(db: Session, user_id: int, limit: int = 100, cursor: str | None = None):
+        """One page of the merchant's settlement reports, newest first, and the cursor for the next."""
         merchant = MerchantService.get_merchant_account(db=db, user_id=user_id)
-        payouts = db.query(db_models.Payout).filter(db_models.Payout.merchant_id == merchant.merchant_id).order_by(db_models.Payout.created_at.desc()).all()
-        reports = [PayoutService._aggregate_settlement_for_payout(db, p) for p in payouts]
-        return reports
+        query = db.query(db_models.Payout).filter(db_models.Payout.merchant_id == merchant.merchant_id)
+        payouts, next_cursor = keyset_page(query, db_models.Payout, limit, cursor)
+        totals = PayoutService._settlement_totals(db, payouts)
+        return [PayoutService._settlement_report(p, totals[p.id]) for p in payouts], next_cursor
 
     @staticmethod
     def get_settlement_report(db: Session, user_id: int, payout_id: int):
@@ -432,7 +445,7 @@ class PayoutService:
         payout = db.query(db_models.Payout).filter(db_models.Payout.id == payout_id).first()
         if not payout or payout.merchant_id != merchant.merchant_id:
             raise ex.ResourceNotFoundError("Settlement report not found")
-        return PayoutService._aggregate_settlement_for_payout(db, payout)
+        return PayoutService._settlement_report(payout, PayoutService._settlement_totals(db, [payout])[payout.id])
 
     @staticmethod
     def get_settlement_schedule(db: Session, user_id: int):
@@ -455,6 +468,7 @@ class PayoutService:
             merchant.settlement_delay_days = schedule['delay_days']
         if 'minimum_payout_amount' in schedule:
             merchant.minimum_payout_amount = schedule['minimum_payout_amount']
+        principal_cache.invalidate_on_commit(db, user_id=user_id)
         db.add(merchant)
         db.commit()
         db.refresh(merchant)
@@ -500,10 +514,9 @@ class PayoutService:
                 db_models.Account.account_type == db_models.AccountType.MERCHANT_AVAILABLE,
                 db_models.Account.currency == payout.currency
             ).with_for_update().first()
-            payable_acct = db.query(db_models.Account).filter(
-                db_models.Account.account_type == db_models.AccountType.PLATFORM_PAYABLE,
-                db_models.Account.currency == payout.currency
-            ).with_for_update().first()
+            payable_acct = PlatformAccountService.get_account(
+                db, db_models.AccountType.PLATFORM_PAYABLE, payout.currency, shard_key=str(payout.id)
+            )
             if not available_acct or not payable_acct:
                 payout.status = db_models.PayoutStatus.FAILED
                 payout.failure_reason = "Internal platform accounting error."
@@ -513,7 +526,7 @@ class PayoutService:
 
             # compute fee
             fee_amount = (payout.amount * FEE_RATE).quantize(Decimal("0.0001"))
-            if available_acct.balance < (payout.amount + (fee_amount if fee_amount else Decimal('0'))):
+            if LedgerService.get_balance(db, available_acct) < (payout.amount + (fee_amount if fee_amount else Decimal('0'))):
                 payout.status = db_models.PayoutStatus.FAILED
                 payout.failure_reason = "Insufficient funds at time of processing."
                 db.add(payout)
@@ -521,17 +534,13 @@ class PayoutService:
                 raise ex.InsufficientFundsError()
 
             # ensure platform revenue
-            platform_revenue_acct = db.query(db_models.Account).filter(
-                db_models.Account.account_type == db_models.AccountType.PLATFORM_REVENUE,
-                db_models.Account.currency == payout.currency
-            ).with_for_update().first()
-            if not platform_revenue_acct:
-                platform_revenue_acct = db_models.Account(account_type=db_models.AccountType.PLATFORM_REVENUE, currency=payout.currency, balance=0)
-                db.add(platform_revenue_acct)
-                db.flush()
+            platform_revenue_acct = PlatformAccountService.get_account(
+                db, db_models.AccountType.PLATFORM_REVENUE, payout.currency, shard_key=str(payout.id)
+            )
 
             payout_ledger = db_models.LedgerTransaction(
                 payout_id=payout.id,
+                merchant_id=payout.merchant_id,
                 transaction_type=db_models.TransactionType.PAYOUT,
                 description=f"Payout {payout.id} to {payout.payout_account_id}",
                 amount=payout.amount,
@@ -539,11 +548,12 @@ class PayoutService:
                 debit_account_id=available_acct.id,
                 credit_account_id=payable_acct.id
             )
-            db.add(payout_ledger)
+            entries = [payout_ledger]
 
             if fee_amount and fee_amount > 0:
                 fee_ledger = db_models.LedgerTransaction(
                     payout_id=payout.id,
+                    merchant_id=payout.merchant_id,
                     transaction_type=db_models.TransactionType.FEE,
                     description=f"Payout fee for {payout.id}",
                     amount=fee_amount,
@@ -551,14 +561,9 @@ class PayoutService:
                     debit_account_id=available_acct.id,
                     credit_account_id=platform_revenue_acct.id
                 )
-                db.add(fee_ledger)
-
-            # apply balances
-            available_acct.balance -= (payout.amount + (fee_amount if fee_amount else Decimal('0')))
-            payable_acct.balance += payout.amount
-            platform_revenue_acct.balance += (fee_amount if fee_amount else Decimal('0'))
-            if payout.merchant:
-                payout.merchant.available_balance -= (payout.amount + (fee_amount if fee_amount else Decimal('0')))
+                entries.append(fee_ledger)
+
+            LedgerService.post(db, entries)
 
             payout.status = db_models.PayoutStatus.SUCCEEDED
             payout.processed_at = func.now()
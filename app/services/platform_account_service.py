@@ -0,0 +1,112 @@
+import zlib
+from decimal import Decimal
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import db_models
+from ..models.db_models import AccountType
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+from .ledger_service import LedgerService
+
+logger = setup_logger(__name__)
+
+PLATFORM_ACCOUNT_TYPES = (
+    AccountType.SYSTEM_HOLDING,
+    AccountType.PLATFORM_REVENUE,
+    AccountType.PLATFORM_PAYABLE,
+)
+
+
+class PlatformAccountService:
+    """
+    Platform-owned ledger accounts, split into PLATFORM_ACCOUNT_SHARDS rows per
+    (account_type, currency).
+
+    Every charge or payout posts to one shard chosen from its id, so concurrent
+    workers lock different rows instead of queueing on a single one. The
+    logical balance of a platform account is the sum over its shards;
+    `rollup_shards` periodically folds the shards back into shard 0.
+    """
+
+    @staticmethod
+    def shard_for(key: str) -> int:
+        return zlib.crc32(str(key).encode()) % max(settings.PLATFORM_ACCOUNT_SHARDS, 1)
+
+    @staticmethod
+    def get_account(db: Session, account_type: AccountType, currency: str, shard_key: str, lock: bool = True) -> db_models.Account:
+        """Return (creating if needed) the shard of a platform account that `shard_key` maps to."""
+        shard = PlatformAccountService.shard_for(shard_key)
+        return PlatformAccountService._get_shard(db, account_type, currency, shard, lock)
+
+    @staticmethod
+    def _get_shard(db: Session, account_type: AccountType, currency: str, shard: int, lock: bool) -> db_models.Account:
+        query = db.query(db_models.Account).filter(
+            db_models.Account.merchant_id.is_(None),
+            db_models.Account.account_type == account_type,
+            db_models.Account.currency == currency,
+            db_models.Account.shard == shard
+        )
+        if lock:
+            query = query.with_for_update()
+        account = query.first()
+        if account:
+            return account
+
+        try:
+            with db.begin_nested():
+                account = db_models.Account(account_type=account_type, currency=currency, shard=shard, balance=0)
+                db.add(account)
+            logger.info(f"Created {account_type.value} {currency} shard {shard}")
+            return account
+        except IntegrityError:
+            # Another worker created the shard first.
+            return query.one()
+
+    @staticmethod
+    def get_balance(db: Session, account_type: AccountType, currency: str) -> Decimal:
+        """Logical balance of a platform account: the sum of its shards' live balances, deferred entries included."""
+        total = db.query(func.coalesce(func.sum(LedgerService.live_balance()), 0)).filter(
+            db_models.Account.merchant_id.is_(None),
+            db_models.Account.account_type == account_type,
+            db_models.Account.currency == currency
+        ).scalar()
+        return Decimal(total)
+
+    @staticmethod
+    def rollup_shards(db: Session) -> int:
+        """
+        Fold every platform account's shard balances into shard 0.
+
+        Each (account_type, currency) is locked and committed on its own, in
+        shard order, so a roll-up holds at most one account's shards at a time.
+        The logical balance is unchanged. Returns the number of accounts folded.
+        """
+        groups = db.query(db_models.Account.account_type, db_models.Account.currency).filter(
+            db_models.Account.merchant_id.is_(None),
+            db_models.Account.account_type.in_(PLATFORM_ACCOUNT_TYPES)
+        ).distinct().all()
+
+        folded = 0
+        for account_type, currency in groups:
+            primary = PlatformAccountService._get_shard(db, account_type, currency, 0, lock=True)
+            shards = db.query(db_models.Account).filter(
+                db_models.Account.merchant_id.is_(None),
+                db_models.Account.account_type == account_type,
+                db_models.Account.currency == currency,
+                db_models.Account.shard != 0
+            ).order_by(db_models.Account.shard).with_for_update().all()
+
+            moved = Decimal("0")
+            for account in shards:
+                if account.balance:
+                    moved += account.balance
+                    account.balance = 0
+            if moved:
+                primary.balance += moved
+                folded += 1
+                logger.info(f"Folded {moved} into {account_type.value} {currency} shard 0")
+            db.commit()
+        return folded
@@ -0,0 +1,315 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable
+from decimal import Decimal
+
+from sqlalchemy import case, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from ..models import db_models
+from ..models.db_models import AccountType, TransactionType
+from ..utilities import balance_cache, webhook_subscriptions
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+from .ledger_service import LedgerService
+from .notification_service import NotificationService
+
+logger = setup_logger(__name__)
+
+SETTLEMENT_EVENT = "settlement.succeeded"
+
+
+class SettlementService:
+    """
+    Set-based settlement of merchant pending balances into available balances.
+
+    A settlement run covers one day. Its merchants are split into shard_count
+    hash shards (merchant id modulo shard_count) that can be settled in
+    parallel; each shard walks its merchants in id order, in chunks of
+    SETTLEMENT_CHUNK_SIZE, one transaction per chunk. A chunk runs a fixed
+    number of statements regardless of its size: the settleable amounts are
+    computed and posted to the ledger with a single INSERT ... SELECT,
+    balances are moved with UPDATE ... FROM over the new entries, and audit
+    logs, notifications and webhook deliveries are bulk inserted.
+
+    The shard's checkpoint row (last merchant settled, running totals) is
+    locked and updated in the same transaction as each chunk, so a crashed or
+    re-delivered shard resumes after the last committed chunk instead of
+    settling a merchant twice.
+
+    A merchant is due when its settlement_schedule runs on the run date
+    (daily; weekly on Mondays; monthly on the 1st). Only funds credited to the
+    pending account at least settlement_delay_days before the run's `as_of`
+    time are settled.
+    """
+
+    @staticmethod
+    def due_schedules(today: date) -> list[str]:
+        schedules = ["daily"]
+        if today.weekday() == 0:
+            schedules.append("weekly")
+        if today.day == 1:
+            schedules.append("monthly")
+        return schedules
+
+    @staticmethod
+    def start_run(db: Session, now: datetime | None = None, shard_count: int | None = None) -> db_models.SettlementRun:
+        """Return the settlement run for `now`'s date, creating it and its shard checkpoints if needed."""
+        now = now or datetime.now(timezone.utc)
+        run = db.query(db_models.SettlementRun).filter_by(run_date=now.date()).first()
+        if run:
+            if run.status == "failed":
+                # Resuming a failed run: its shards pick up from their checkpoints.
+                run.status, run.error = "running", None
+                db.commit()
+            return run
+
+        shard_count = max(shard_count or settings.SETTLEMENT_SHARDS, 1)
+        try:
+            run = db_models.SettlementRun(run_date=now.date(), as_of=now, shard_count=shard_count, status="running")
+            db.add(run)
+            db.flush()
+            db.add_all([
+                db_models.SettlementShardCheckpoint(run_id=run.id, shard=shard, last_merchant_id=0, merchants_settled=0)
+                for shard in range(shard_count)
+            ])
+            db.commit()
+        except IntegrityError:
+            # Another scheduler started the same day's run first.
+            db.rollback()
+            return db.query(db_models.SettlementRun).filter_by(run_date=now.date()).one()
+        logger.info(f"Started settlement run {run.id} for {run.run_date} with {shard_count} shards")
+        return run
+
+    @staticmethod
+    def pending_shards(db: Session, run_id: int) -> list[int]:
+        return [row[0] for row in db.query(db_models.SettlementShardCheckpoint.shard).filter_by(
+            run_id=run_id, completed=False
+        ).order_by(db_models.SettlementShardCheckpoint.shard).all()]
+
+    @staticmethod
+    def settle_shard(
+        db: Session, run_id: int, shard: int, chunk_size: int | None = None,
+        on_chunk: Callable[[list[int]], None] | None = None,
+    ) -> list[int]:
+        """
+        Settle the merchants of one shard of a run, resuming from its checkpoint.
+
+        Returns the ids of the webhook deliveries created; they are committed
+        with their chunk and are for the caller to dispatch. `on_chunk` is
+        called with each chunk's delivery ids as soon as the chunk commits, so
+        a shard that fails later has already handed off the earlier ones.
+        """
+        chunk_size = chunk_size or settings.SETTLEMENT_CHUNK_SIZE
+        run = db.get(db_models.SettlementRun, run_id)
+        merchant = db_models.MerchantAccount
+        due = merchant.settlement_schedule.in_(SettlementService.due_schedules(run.run_date))
+        as_of = run.as_of if run.as_of.tzinfo else run.as_of.replace(tzinfo=timezone.utc)
+
+        delivery_ids: list[int] = []
+        while True:
+            checkpoint = db.query(db_models.SettlementShardCheckpoint).filter_by(
+                run_id=run_id, shard=shard
+            ).with_for_update().populate_existing().one()
+            if checkpoint.completed:
+                db.commit()
+                break
+
+            chunk = db.query(merchant.id, merchant.settlement_delay_days).filter(
+                due,
+                merchant.id % run.shard_count == shard,
+                merchant.id > checkpoint.last_merchant_id
+            ).order_by(merchant.id).limit(chunk_size).all()
+            if not chunk:
+                checkpoint.completed = True
+                db.commit()
+                break
+
+            cutoffs = {delay_days: as_of - timedelta(days=delay_days) for _, delay_days in chunk}
+            entries, ids = SettlementService._settle_chunk(db, [merchant_id for merchant_id, _ in chunk], cutoffs)
+            totals = json.loads(checkpoint.totals or "{}")
+            for entry in entries:
+                totals[entry.currency] = str(Decimal(totals.get(entry.currency, "0")) + Decimal(entry.amount))
+            checkpoint.totals = json.dumps(totals)
+            checkpoint.merchants_settled += len(entries)
+            checkpoint.last_merchant_id = chunk[-1][0]
+            db.commit()
+            delivery_ids.extend(ids)
+            if on_chunk and ids:
+                on_chunk(ids)
+
+        logger.info(f"Settlement run {run_id} shard {shard} done")
+        return delivery_ids
+
+    @staticmethod
+    def finish_run(db: Session, run_id: int) -> db_models.SettlementRun:
+        """Aggregate the shard checkpoints into the run's totals and mark it completed."""
+        run = db.query(db_models.SettlementRun).filter_by(id=run_id).with_for_update().one()
+        checkpoints = db.query(db_models.SettlementShardCheckpoint).filter_by(run_id=run_id).all()
+        totals: dict[str, Decimal] = {}
+        for checkpoint in checkpoints:
+            for currency, amount in json.loads(checkpoint.totals or "{}").items():
+                totals[currency] = totals.get(currency, Decimal("0")) + Decimal(amount)
+        run.merchants_settled = sum(checkpoint.merchants_settled for checkpoint in checkpoints)
+        run.totals = json.dumps({currency: str(amount) for currency, amount in totals.items()})
+        if all(checkpoint.completed for checkpoint in checkpoints):
+            run.status = "completed"
+            run.completed_at = func.now()
+        db.commit()
+        db.refresh(run)
+        logger.info(f"Settlement run {run.id} {run.status}: {run.merchants_settled} merchants, totals {run.totals}")
+        return run
+
+    @staticmethod
+    def fail_run(db: Session, run_id: int, error: str) -> db_models.SettlementRun:
+        """Mark an unfinished run failed with `error`; the next start_run for its date resumes it."""
+        run = db.query(db_models.SettlementRun).filter_by(id=run_id).with_for_update().one()
+        if run.status != "completed":
+            run.status = "failed"
+            run.error = error
+        db.commit()
+        db.refresh(run)
+        logger.error(f"Settlement run {run.id} {run.status}: {error}")
+        return run
+
+    @staticmethod
+    def settle_pending_funds(db: Session, now: datetime | None = None, chunk_size: int | None = None) -> tuple[int, list[int]]:
+        """
+        Run the whole settlement for `now`'s date in this process, shard by shard.
+
+        Returns (number of merchants settled by the run, ids of the webhook
+        deliveries created by this call).
+        """
+        run = SettlementService.start_run(db, now=now)
+        delivery_ids: list[int] = []
+        for shard in SettlementService.pending_shards(db, run.id):
+            delivery_ids.extend(SettlementService.settle_shard(db, run.id, shard, chunk_size=chunk_size))
+        run = SettlementService.finish_run(db, run.id)
+        return run.merchants_settled, delivery_ids
+
+    @staticmethod
+    def _settle_chunk(db: Session, merchant_ids: list[int], cutoffs: dict[int, datetime]) -> tuple[list, list[int]]:
+        """Settle the due merchants in `merchant_ids`; `cutoffs` maps settlement_delay_days to its cutoff time."""
+        merchant = db_models.MerchantAccount
+        lt = db_models.LedgerTransaction
+        pending = aliased(db_models.Account)
+        available = aliased(db_models.Account)
+
+        # Lock both balance accounts of every merchant in the chunk, in id order,
+        # so concurrent postings cannot change what is being settled.
+        db.query(db_models.Account.id).join(
+            merchant, merchant.merchant_id == db_models.Account.merchant_id
+        ).filter(
+            merchant.id.in_(merchant_ids),
+            db_models.Account.account_type.in_((AccountType.MERCHANT_PENDING, AccountType.MERCHANT_AVAILABLE))
+        ).order_by(db_models.Account.id).with_for_update(of=db_models.Account).all()
+
+        cutoff = case(cutoffs, value=merchant.settlement_delay_days)
+        immature = select(func.coalesce(func.sum(lt.amount), 0)).where(
+            lt.credit_account_id == pending.id, lt.created_at > cutoff
+        ).scalar_subquery()
+        amounts = select(
+            merchant.merchant_id,
+            merchant.currency,
+            pending.id.label("debit_account_id"),
+            available.id.label("credit_account_id"),
+            (LedgerService.live_balance(pending) - immature).label("amount"),
+        ).join(
+            pending, (pending.merchant_id == merchant.merchant_id) & (pending.account_type == AccountType.MERCHANT_PENDING)
+        ).join(
+            available, (available.merchant_id == merchant.merchant_id) & (available.account_type == AccountType.MERCHANT_AVAILABLE)
+        ).where(merchant.id.in_(merchant_ids)).subquery()
+
+        deferred = LedgerService.deferred()
+        entries = db.execute(
+            insert(lt).from_select(
+                ["merchant_id", "currency", "debit_account_id", "credit_account_id", "amount",
+                 "transaction_type", "materialized", "description"],
+                select(
+                    amounts.c.merchant_id,
+                    amounts.c.currency,
+                    amounts.c.debit_account_id,
+                    amounts.c.credit_account_id,
+                    amounts.c.amount,
+                    literal(TransactionType.CHARGE, lt.transaction_type.type),
+                    literal(not deferred),
+                    literal("settlement"),
+                ).where(amounts.c.amount > 0)
+            ).returning(lt.id, lt.merchant_id, lt.amount, lt.currency)
+        ).all()
+        if not entries:
+            return [], []
+
+        entry_ids = [entry.id for entry in entries]
+        balance_cache.bump_on_commit(db, *{entry.merchant_id for entry in entries})
+        if not deferred:
+            account = db_models.Account
+            db.execute(
+                update(account).where(
+                    lt.id.in_(entry_ids),
+                    account.id.in_((lt.debit_account_id, lt.credit_account_id))
+                ).values(
+                    balance=account.balance + case((account.id == lt.credit_account_id, lt.amount), else_=-lt.amount)
+                ).execution_options(synchronize_session=False)
+            )
+            db.execute(
+                update(merchant).where(
+                    lt.id.in_(entry_ids),
+                    merchant.merchant_id == lt.merchant_id
+                ).values(
+                    pending_balance=merchant.pending_balance - lt.amount,
+                    available_balance=merchant.available_balance + lt.amount
+                ).execution_options(synchronize_session=False)
+            )
+
+        user_ids = dict(db.query(merchant.merchant_id, merchant.user_id).filter(
+            merchant.merchant_id.in_([entry.merchant_id for entry in entries])
+        ).all())
+        db.execute(insert(db_models.AuditLog), [
+            {
+                "user_id": user_ids[entry.merchant_id],
+                "merchant_id": entry.merchant_id,
+                "action": "FUNDS_SETTLED",
+                "resource_type": "MERCHANT_ACCOUNT",
+                "resource_id": str(entry.merchant_id),
+                "extra_data": str({"amount_settled": str(Decimal(entry.amount)), "currency": entry.currency}),
+            }
+            for entry in entries
+        ])
+        NotificationService.bulk_create(db, [
+            {
+                "merchant_id": entry.merchant_id,
+                "user_id": user_ids[entry.merchant_id],
+                "type": SETTLEMENT_EVENT,
+                "message": f"Settlement completed: {Decimal(entry.amount)} {entry.currency}",
+                "data": str({"amount": str(Decimal(entry.amount))}),
+            }
+            for entry in entries
+        ])
+
+        by_merchant = {entry.merchant_id: entry for entry in entries}
+        hooks = [
+            (hook_id, merchant_id)
+            for merchant_id, hook_ids in webhook_subscriptions.subscribers(db, by_merchant.keys(), SETTLEMENT_EVENT).items()
+            for hook_id in hook_ids
+        ]
+        delivery_ids = []
+        if hooks:
+            deliveries = [
+                {
+                    "webhook_id": hook_id,
+                    "event": SETTLEMENT_EVENT,
+                    "payload": json.dumps({
+                        "event": SETTLEMENT_EVENT,
+                        "merchant_id": merchant_id,
+                        "amount": str(Decimal(by_merchant[merchant_id].amount)),
+                        "currency": by_merchant[merchant_id].currency,
+                    }),
+                    "status": "pending",
+                    "attempts": 0,
+                }
+                for hook_id, merchant_id in hooks
+            ]
+            delivery_ids = list(db.scalars(insert(db_models.WebhookDelivery).returning(db_models.WebhookDelivery.id), deliveries))
+        return entries, delivery_ids
@@ -26,6 +26,7 @@ from ..utilities.exceptions import (
     ExpiredResetTokenError,
 )
 from ..utilities.logger import setup_logger
+from ..utilities import principal_cache
 from ..utilities.utils import hash_password, verify_password
 
 logger = setup_logger("payment_gateway.services.user_service")
@@ -194,6 +195,7 @@ class UserService:
             user_query.update(update_dict, synchronize_session=False)
             db.flush()
             db.refresh(db_user)
+            principal_cache.invalidate_on_commit(db, user_id=user_id)
             updated_user = user_query.first()
 
             logger.info(f"User {user_id} updated successfully.")
@@ -222,6 +224,7 @@ class UserService:
             hashed_new_password = hash_password(new_password)
             user.password = hashed_new_password
             db.flush()
+            principal_cache.invalidate_on_commit(db, user_id=user.id)
             db.refresh(user)
             logger.debug(f"Password updated in DB for user {user.id}")
         except Exception as e:
@@ -349,6 +352,7 @@ class UserService:
             user.password_reset_token = None
             user.password_reset_expires = None
 
+            principal_cache.invalidate_on_commit(db, user_id=user.id)
             db.commit()
             db.refresh(user)
 
@@ -369,6 +373,7 @@ class UserService:
         :param user_id:
         :return:
         """
+        principal_cache.invalidate_on_commit(db, user_id=user_id)
         return (
             db.query(db_models.User).filter(db_models.User.id == user_id).delete(synchronize_session=False)
         )
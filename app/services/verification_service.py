@@ -9,6 +9,7 @@ from ..utilities.exceptions import (
     VerificationError,
     UserNotFoundError,
 )
+from ..utilities import principal_cache
 from ..utilities.logger import setup_logger
 
 logger = setup_logger("payment_gateway.services.verification_service")
@@ -48,6 +49,7 @@ class VerificationService:
 
             if merchant_account:
                 merchant_account.verification_status = db_models.VerificationStatus.pending
+                principal_cache.invalidate_on_commit(db, user_id=current_user.id)
                 db.flush()
                 logger.info(f"Updated merchant account {merchant_account.merchant_id} verification_status to pending")
 
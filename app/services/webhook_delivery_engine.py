@@ -0,0 +1,317 @@
+"""
+Asyncio webhook delivery engine.
+
+Runs as its own process (`python -m app.services.webhook_delivery_engine`)
+when WEBHOOK_DELIVERY_BACKEND is "engine". It claims pending WebhookDelivery
+rows in batches and sends them concurrently over long-lived httpx.AsyncClient
+pools, one per origin, so repeated deliveries to a merchant reuse their
+connection (HTTP/2 when the h2 package is installed) instead of paying a
+handshake each time.
+
+Concurrency is bounded twice: WEBHOOK_ENGINE_MAX_IN_FLIGHT deliveries in total
+and WEBHOOK_ENGINE_PER_ENDPOINT_CONCURRENCY per webhook endpoint, the latter
+scaled down by the endpoint's health score (see utilities.webhook_circuit), so
+one slow merchant cannot take every slot. Deliveries to an endpoint whose
+circuit is open are parked for retry without being attempted. Results are
+written back in bulk, one transaction per loop iteration.
+
+The engine only claims fresh ('pending') deliveries. Failed deliveries are
+scheduled for retry with WebhookService.failure_outcome and re-sent by
+retry_webhook_deliveries_task, which uses `run_retries` to claim due rows in
+batches through the same pooled sender.
+"""
+import asyncio
+import json
+import signal
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..models import db_models
+from ..utilities import webhook_circuit
+from ..utilities.config import settings
+from ..utilities.logger import setup_logger
+from .notification_service import NotificationService
+from .webhook_service import WebhookService
+
+logger = setup_logger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class WebhookDeliveryEngine:
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        max_in_flight: int | None = None,
+        per_endpoint_concurrency: int | None = None,
+        batch_size: int | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.session_factory = session_factory
+        self.max_in_flight = max_in_flight or settings.WEBHOOK_ENGINE_MAX_IN_FLIGHT
+        self.per_endpoint_concurrency = per_endpoint_concurrency or settings.WEBHOOK_ENGINE_PER_ENDPOINT_CONCURRENCY
+        self.batch_size = batch_size or settings.WEBHOOK_ENGINE_BATCH_SIZE
+        self.transport = transport
+
+        self._clients: OrderedDict[str, httpx.AsyncClient] = OrderedDict()
+        self._in_flight: set[asyncio.Task] = set()
+        self._endpoint_in_flight: defaultdict[int, int] = defaultdict(int)
+        self._results: list[dict] = []
+        self._stopping = asyncio.Event()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is not None:
+            self._clients.move_to_end(origin)
+            return client
+
+        client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and self.transport is None,
+            transport=self.transport,
+            timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=self.per_endpoint_concurrency,
+                max_keepalive_connections=self.per_endpoint_concurrency,
+            ),
+        )
+        self._clients[origin] = client
+        if len(self._clients) > settings.WEBHOOK_ENGINE_MAX_ORIGINS:
+            # Close the least recently used pool; requests already using it finish first.
+            _, stale = self._clients.popitem(last=False)
+            asyncio.get_running_loop().create_task(stale.aclose())
+        return client
+
+    def _claim(self, limit: int, endpoint_in_flight: dict[int, int], retries: bool = False) -> list[dict]:
+        """
+        Mark up to `limit` deliveries as sending and return what is needed to send them.
+
+        Claims fresh deliveries, or with `retries` those whose next attempt is
+        due. Runs in a worker thread, so it takes a snapshot of the
+        per-endpoint in-flight counts rather than reading the live dict.
+        """
+        saturated = [webhook_id for webhook_id, count in endpoint_in_flight.items() if count >= self.per_endpoint_concurrency]
+        now = datetime.now(timezone.utc)
+        delivery = db_models.WebhookDelivery
+        endpoint = db_models.WebhookEndpoint
+
+        db: Session = self.session_factory()
+        try:
+            query = db.query(
+                delivery.id, delivery.webhook_id, delivery.event, delivery.payload, delivery.attempts,
+                endpoint.url, endpoint.merchant_id, endpoint.enabled
+            ).join(endpoint, endpoint.id == delivery.webhook_id)
+            if retries:
+                query = query.filter(delivery.status == "retrying", delivery.next_attempt_at <= now).order_by(delivery.next_attempt_at)
+            else:
+                query = query.filter(delivery.status == "pending").order_by(delivery.id)
+            if saturated:
+                query = query.filter(delivery.webhook_id.notin_(saturated))
+            rows = query.limit(limit).with_for_update(of=delivery, skip_locked=True).all()
+
+            # The circuit breaker sets each endpoint's concurrency from its
+            # health, and parks deliveries to endpoints whose circuit is open.
+            limits = webhook_circuit.admit({row.webhook_id for row in rows}, self.per_endpoint_concurrency)
+            quota = {webhook_id: limit - endpoint_in_flight.get(webhook_id, 0) for webhook_id, (limit, _) in limits.items()}
+            claimed = []
+            parked = defaultdict(list)
+            for row in rows:
+                limit, retry_at = limits[row.webhook_id]
+                if not limit:
+                    parked[retry_at].append(row.id)
+                    continue
+                if quota[row.webhook_id] <= 0:
+                    continue  # left for a later batch
+                quota[row.webhook_id] -= 1
+                claimed.append(row._asdict())
+            if claimed:
+                db.execute(
+                    update(delivery).where(delivery.id.in_([row["id"] for row in claimed]))
+                    .values(status="sending", last_attempt_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            for retry_at, delivery_ids in parked.items():
+                db.execute(
+                    update(delivery).where(delivery.id.in_(delivery_ids))
+                    .values(status="retrying", next_attempt_at=retry_at)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    async def _deliver(self, row: dict) -> None:
+        now = datetime.now(timezone.utc)
+        result = {
+            "id": row["id"], "merchant_id": row["merchant_id"], "event": row["event"],
+            "attempts": (row["attempts"] or 0) + 1, "last_attempt_at": now, "next_attempt_at": None, "notify": True,
+            "webhook_id": row["webhook_id"], "latency_ms": None,
+        }
+        started = time.monotonic()
+        try:
+            if not row["enabled"]:
+                result.update(status="failed", http_status=None, response_body="Webhook endpoint is disabled", notify=False, webhook_id=None)
+                return
+            try:
+                payload = json.loads(row["payload"])
+            except Exception:
+                payload = row["payload"]
+            response = await self._client_for(row["url"]).post(row["url"], json=payload)
+            result["latency_ms"] = (time.monotonic() - started) * 1000
+            result.update(http_status=response.status_code, response_body=response.text)
+            if response.status_code < 400:
+                result["status"] = "success"
+            else:
+                result.update(WebhookService.failure_outcome(result["attempts"], now))
+        except Exception as e:
+            logger.warning(f"Error sending webhook delivery {row['id']}: {e}")
+            result.update(http_status=None, response_body=str(e))
+            result.update(WebhookService.failure_outcome(result["attempts"], now))
+        finally:
+            self._results.append(result)
+            self._endpoint_in_flight[row["webhook_id"]] -= 1
+            if not self._endpoint_in_flight[row["webhook_id"]]:
+                del self._endpoint_in_flight[row["webhook_id"]]
+
+    def _record(self, results: list[dict]) -> None:
+        """Write delivery outcomes and their merchant notifications in one transaction."""
+        webhook_circuit.record(
+            (result["webhook_id"], result["status"] == "success", result["latency_ms"])
+            for result in results if result["webhook_id"] is not None
+        )
+        delivery = db_models.WebhookDelivery
+        db: Session = self.session_factory()
+        try:
+            db.execute(update(delivery), [
+                {key: result[key] for key in ("id", "status", "http_status", "response_body", "attempts", "last_attempt_at", "next_attempt_at")}
+                for result in results
+            ])
+            notifications = [
+                {
+                    "merchant_id": result["merchant_id"],
+                    "user_id": None,
+                    "type": "webhook.delivery",
+                    "message": (
+                        f"Webhook event '{result['event']}' delivery {result['status']} (http {result['http_status']})"
+                        if result["http_status"] is not None
+                        else f"Webhook event '{result['event']}' delivery failed: {result['response_body']}"
+                    ),
+                    "data": str({"delivery_id": result["id"], "http_status": result["http_status"]}),
+                }
+                for result in results if result["notify"]
+            ]
+            NotificationService.bulk_create(db, notifications)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _flush_results(self) -> int:
+        results, self._results = self._results, []
+        if results:
+            await asyncio.to_thread(self._record, results)
+        return len(results)
+
+    async def run_once(self) -> int:
+        """Claim one batch, start sending it, and record finished deliveries. Returns the number claimed."""
+        free = self.max_in_flight - len(self._in_flight)
+        claimed = []
+        if free > 0:
+            claimed = await asyncio.to_thread(self._claim, min(free, self.batch_size), dict(self._endpoint_in_flight))
+        self._start(claimed)
+        await self._flush_results()
+        return len(claimed)
+
+    async def run_retries(self, max_batches: int) -> int:
+        """Re-send deliveries whose retry is due, one claimed batch at a time. Returns the number sent."""
+        sent = 0
+        try:
+            for _ in range(max_batches):
+                claimed = await asyncio.to_thread(self._claim, self.batch_size, {}, True)
+                if not claimed:
+                    break
+                self._start(claimed)
+                await self.drain()
+                sent += len(claimed)
+        finally:
+            await self.close()
+        return sent
+
+    def _start(self, claimed: list[dict]) -> None:
+        for row in claimed:
+            self._endpoint_in_flight[row["webhook_id"]] += 1
+            task = asyncio.create_task(self._deliver(row))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def drain(self) -> None:
+        """Wait for every in-flight delivery and record the results."""
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        await self._flush_results()
+
+    async def run(self) -> None:
+        logger.info(
+            f"Webhook delivery engine started: max_in_flight={self.max_in_flight} "
+            f"per_endpoint={self.per_endpoint_concurrency} http2={HTTP2_AVAILABLE}"
+        )
+        try:
+            while not self._stopping.is_set():
+                claimed = await self.run_once()
+                if claimed < self.batch_size or len(self._in_flight) >= self.max_in_flight:
+                    # Nothing more to claim right now, or no free slots: wait for
+                    # new deliveries or for in-flight ones to finish.
+                    done_waiting = [asyncio.create_task(self._stopping.wait())]
+                    if self._in_flight:
+                        done_waiting.append(asyncio.create_task(asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)))
+                    _, pending = await asyncio.wait(
+                        done_waiting, timeout=settings.WEBHOOK_ENGINE_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in pending:
+                        task.cancel()
+            await self.drain()
+        finally:
+            await self.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def close(self) -> None:
+        clients, self._clients = list(self._clients.values()), OrderedDict()
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+def main():
+    from ..utilities.db_con import SessionLocal
+
+    async def serve():
+        engine = WebhookDeliveryEngine(SessionLocal)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, engine.stop)
+        await engine.run()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
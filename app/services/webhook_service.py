@@ -1,9 +1,14 @@
 from sqlalchemy.orm import Session
 from app.models import db_models
 from app.utilities.logger import setup_logger
+from app.utilities import webhook_subscriptions
+from app.utilities.config import settings
 from app.utilities.exceptions import ResourceNotFoundError
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import json
+import random
+
+from sqlalchemy import update
 
 logger = setup_logger(__name__)
 
@@ -21,6 +26,7 @@ class WebhookService:
         )
         db.add(webhook)
         db.commit()
+        webhook_subscriptions.invalidate(merchant_id)
         db.refresh(webhook)
         logger.info(f"Created webhook {webhook.id} for merchant {merchant_id}")
         return webhook
@@ -45,6 +51,7 @@ class WebhookService:
         wh.updated_at = datetime.now(timezone.utc)
         db.add(wh)
         db.commit()
+        webhook_subscriptions.invalidate(merchant_id)
         db.refresh(wh)
         return wh
 
@@ -53,6 +60,7 @@ class WebhookService:
         wh = WebhookService.get_webhook(db, merchant_id, webhook_id)
         db.delete(wh)
         db.commit()
+        webhook_subscriptions.invalidate(merchant_id)
         return True
 
     @staticmethod
@@ -86,6 +94,85 @@ class WebhookService:
         db.refresh(d)
         return d
 
+    @staticmethod
+    def dispatch_deliveries(delivery_ids):
+        """
+        Hand recorded deliveries to the configured sender.
+
+        With WEBHOOK_DELIVERY_BACKEND="engine" the delivery engine picks up
+        pending rows itself, so there is nothing to enqueue. The deliveries are
+        already committed, so a broker error is logged rather than raised:
+        release_undispatched picks up whatever was not enqueued.
+        """
+        if settings.WEBHOOK_DELIVERY_BACKEND == "engine":
+            return
+        from app.celery_worker import celery_app
+        try:
+            for delivery_id in delivery_ids:
+                celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery_id,))
+        except Exception as e:
+            logger.warning(f"Failed to enqueue webhook deliveries, leaving them for the retry sweep: {e}")
+
+    @staticmethod
+    def failure_outcome(attempts: int, now: datetime | None = None) -> dict:
+        """
+        Status and next_attempt_at for a delivery whose `attempts`-th attempt failed.
+
+        Retries back off exponentially from WEBHOOK_RETRY_BASE_SECONDS up to
+        WEBHOOK_RETRY_MAX_SECONDS, with jitter over the upper half of each
+        interval so failed bursts do not retry in lockstep. After
+        WEBHOOK_MAX_ATTEMPTS the delivery is dead-lettered.
+        """
+        if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            return {"status": "dead", "next_attempt_at": None}
+        now = now or datetime.now(timezone.utc)
+        delay = min(settings.WEBHOOK_RETRY_MAX_SECONDS, settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+        return {"status": "retrying", "next_attempt_at": now + timedelta(seconds=random.uniform(delay / 2, delay))}
+
+    @staticmethod
+    def release_stale_claims(db: Session) -> int:
+        """Schedule deliveries stuck in 'sending' (their sender died) for an immediate retry."""
+        now = datetime.now(timezone.utc)
+        result = db.execute(
+            update(db_models.WebhookDelivery).where(
+                db_models.WebhookDelivery.status == 'sending',
+                db_models.WebhookDelivery.last_attempt_at < now - timedelta(seconds=settings.WEBHOOK_ENGINE_CLAIM_TIMEOUT_SECONDS)
+            ).values(status='retrying', next_attempt_at=now).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def release_undispatched(db: Session) -> int:
+        """
+        Schedule deliveries left 'pending' for WEBHOOK_PENDING_GRACE_SECONDS for an immediate retry.
+
+        With the Celery backend a pending delivery is only sent if its task was
+        enqueued, which happens after the delivery commits; a sender that dies
+        in between would otherwise strand it. The engine claims pending rows
+        itself, so there is nothing to release.
+        """
+        if settings.WEBHOOK_DELIVERY_BACKEND == "engine":
+            return 0
+        now = datetime.now(timezone.utc)
+        result = db.execute(
+            update(db_models.WebhookDelivery).where(
+                db_models.WebhookDelivery.status == 'pending',
+                db_models.WebhookDelivery.created_at < now - timedelta(seconds=settings.WEBHOOK_PENDING_GRACE_SECONDS)
+            ).values(status='retrying', next_attempt_at=now).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def requeue_delivery(db: Session, delivery: db_models.WebhookDelivery):
+        delivery.status = 'pending'
+        delivery.next_attempt_at = None
+        db.add(delivery)
+        db.commit()
+        WebhookService.dispatch_deliveries([delivery.id])
+        return delivery
+
     @staticmethod
     def list_deliveries(db: Session, webhook_id: int):
         # order by created_at descending
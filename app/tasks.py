@@ -1,7 +1,9 @@
+import asyncio
+import time
 from contextlib import contextmanager
 from decimal import Decimal
 
-from celery import shared_task
+from celery import chord, shared_task
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
@@ -11,11 +13,20 @@ from app.models.db_models import TransactionType, AccountType
 from app.utilities.exceptions import DatabaseError
 from app.utilities.logger import setup_logger
 from app.utilities.db_con import SessionLocal
+from app.utilities import api_key_usage, event_stream, webhook_circuit
+from app.utilities.config import settings
 import httpx
 
 from app.services.webhook_service import WebhookService
-from app.utilities.logger import setup_logger
+from app.services.webhook_delivery_engine import WebhookDeliveryEngine
 from app.services.notification_service import NotificationService
+from app.utilities.logger import setup_logger
+from app.services.ledger_service import LedgerService
+from app.services.merchant_stats_service import MerchantStatsService
+from app.services.partition_service import PartitionService
+from app.services.platform_account_service import PlatformAccountService
+from app.services.settlement_service import SettlementService
+from app.services.outbox_service import OutboxService
 
 logger = setup_logger(__name__)
 
@@ -36,6 +47,28 @@ def session_scope():
         session.close()
 
 
+def _publish_charge_status(db: Session, charge, merchant_id: str | None = None) -> None:
+    if merchant_id is None:
+        merchant_id = db.query(db_models.MerchantAccount.merchant_id).filter_by(user_id=charge.user_id).scalar()
+    event_stream.publish_on_commit(db, merchant_id, "charge.updated", {
+        "charge_id": charge.id,
+        "status": charge.status,
+        "amount": str(charge.amount),
+        "currency": charge.currency,
+        "failure_message": getattr(charge, "failure_message", None),
+    })
+
+
+def _publish_payout_status(db: Session, payout) -> None:
+    event_stream.publish_on_commit(db, payout.merchant_id, "payout.updated", {
+        "payout_id": payout.id,
+        "status": getattr(payout.status, "value", payout.status),
+        "amount": str(payout.amount),
+        "currency": payout.currency,
+        "failure_reason": payout.failure_reason,
+    })
+
+
 @shared_task(name="app.tasks.process_charge_task", bind=True)
 def process_charge_task(self, charge_id: str, payment_token: str = "tok_valid_success"):
     logger.info(f"Worker: Received charge {charge_id} with token {payment_token}")
@@ -53,50 +86,48 @@ def process_charge_task(self, charge_id: str, payment_token: str = "tok_valid_su
         if payment_token == "tok_card_declined":
             charge.status = "failed"
             charge.failure_message = "Your card was declined."
+            _publish_charge_status(db, charge)
             logger.warning(f"Task: Charge {charge_id} simulated FAILED (tok_card_declined).")
 
         elif payment_token == "tok_insufficient_funds":
             charge.status = "failed"
             charge.failure_message = "Insufficient funds."
+            _publish_charge_status(db, charge)
             logger.warning(f"Task: Charge {charge_id} simulated FAILED (tok_insufficient_funds).")
 
         elif payment_token == "tok_valid_success":
             logger.info(f"Task: Charge {charge_id} simulated SUCCEEDED. Processing ledger.")
 
-            merchant_account = db.query(db_models.MerchantAccount).filter_by(
-                user_id=charge.user_id).with_for_update().first()
+            # Deferred posting only appends ledger entries, so no balance rows are locked.
+            lock_balances = not LedgerService.deferred()
+            merchant_query = db.query(db_models.MerchantAccount).filter_by(user_id=charge.user_id)
+            if lock_balances:
+                merchant_query = merchant_query.with_for_update()
+            merchant_account = merchant_query.first()
             if not merchant_account:
                 raise DatabaseError("Merchant account not found for charge user")
             if merchant_account.currency != charge.currency:
                 charge.status = 'failed'
                 charge.failure_message = f"Currency mismatch: merchant uses {merchant_account.currency}"
+                _publish_charge_status(db, charge, merchant_account.merchant_id)
+                MerchantStatsService.record_failed_charge(db, charge, merchant_account.merchant_id)
                 logger.warning(f"Charge {charge_id} failed due to currency mismatch: {charge.currency} vs {merchant_account.currency}")
                 return
 
-            system_holding_acct = db.query(db_models.Account).filter_by(
-                account_type=AccountType.SYSTEM_HOLDING, currency=charge.currency
-            ).with_for_update().first()
-            if not system_holding_acct:
-                system_holding_acct = db_models.Account(
-                    account_type=AccountType.SYSTEM_HOLDING, currency=charge.currency, balance=0
-                )
-                db.add(system_holding_acct)
-                db.flush()
-
-            platform_revenue_acct = db.query(db_models.Account).filter_by(
-                account_type=AccountType.PLATFORM_REVENUE, currency=charge.currency
-            ).with_for_update().first()
-            if not platform_revenue_acct:
-                platform_revenue_acct = db_models.Account(
-                    account_type=AccountType.PLATFORM_REVENUE, currency=charge.currency, balance=0
-                )
-                db.add(platform_revenue_acct)
-                db.flush()
+            system_holding_acct = PlatformAccountService.get_account(
+                db, AccountType.SYSTEM_HOLDING, charge.currency, shard_key=charge.id, lock=False
+            )
+            platform_revenue_acct = PlatformAccountService.get_account(
+                db, AccountType.PLATFORM_REVENUE, charge.currency, shard_key=charge.id, lock=lock_balances
+            )
 
-            merchant_pending_acct = db.query(db_models.Account).filter_by(
+            pending_query = db.query(db_models.Account).filter_by(
                 merchant_id=merchant_account.merchant_id,
                 account_type=AccountType.MERCHANT_PENDING
-            ).with_for_update().first()
+            )
+            if lock_balances:
+                pending_query = pending_query.with_for_update()
+            merchant_pending_acct = pending_query.first()
             if not merchant_pending_acct:
                 merchant_pending_acct = db_models.Account(
                     merchant_id=merchant_account.merchant_id,
@@ -133,112 +164,72 @@ def process_charge_task(self, charge_id: str, payment_token: str = "tok_valid_su
                 credit_account_id=merchant_pending_acct.id
             )
 
-            db.add_all([ledger_fee, ledger_charge])
-            platform_revenue_acct.balance += fee_amount
-            merchant_pending_acct.balance += net_amount
+            LedgerService.post(db, [ledger_fee, ledger_charge])
             charge.status = 'succeeded'
-
-            try:
-                hooks = db.query(db_models.WebhookEndpoint).filter_by(merchant_id=merchant_account.merchant_id, enabled=True).all()
-                for hook in hooks:
-                    payload = {
-                        "event": "charge.succeeded",
-                        "charge_id": charge.id,
-                        "amount": str(charge.amount),
-                        "currency": charge.currency,
-                        "merchant_id": merchant_account.merchant_id
-                    }
-                    delivery = WebhookService.record_delivery(db=db, webhook_id=hook.id, event="charge.succeeded", payload=payload)
-                    celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery.id,))
-            except Exception as e:
-                logger.exception(f"Error creating webhook deliveries for charge {charge.id}: {e}")
-
-            # create notification for merchant about charge
-            try:
-                NotificationService.create_notification(db=db, merchant_id=merchant_account.merchant_id, user_id=charge.user_id, type='charge.succeeded', message=f"Charge succeeded: {charge.amount} {charge.currency}", data=str({"charge_id": charge.id}))
-            except Exception:
-                logger.exception("Failed to create charge succeeded notification")
+            _publish_charge_status(db, charge, merchant_account.merchant_id)
+
+            # Webhooks and the notification go out through the outbox, committed with the ledger entries.
+            OutboxService.publish(
+                db, "charge.succeeded", merchant_account.merchant_id, user_id=charge.user_id,
+                webhook={
+                    "event": "charge.succeeded",
+                    "charge_id": charge.id,
+                    "amount": str(charge.amount),
+                    "currency": charge.currency,
+                    "merchant_id": merchant_account.merchant_id
+                },
+                notification={"message": f"Charge succeeded: {charge.amount} {charge.currency}", "data": str({"charge_id": charge.id})},
+            )
 
             logger.info(f"Worker: Charge {charge_id} ledger logic complete.")
 
         else:
             charge.status = "failed"
             charge.failure_message = "Invalid payment token provided."
+            _publish_charge_status(db, charge)
             logger.error(f"Task: Charge {charge_id} failed (Invalid payment token).")
 
+        # Failed charges post nothing to the ledger, so the stats rollup can't see them.
+        if charge.status == "failed":
+            MerchantStatsService.record_failed_charge(db, charge)
+
 
 @celery_app.task(name="app.tasks.settle_pending_funds_task")
 def settle_pending_funds_task():
+    """Start (or resume) today's settlement run as a chord of per-shard tasks."""
     logger.info("Settlement task started...")
     with session_scope() as db:
-        try:
-            merchants = db.query(db_models.MerchantAccount).all()
-
-            for merchant in merchants:
-                pending_acct = db.query(db_models.Account).filter_by(
-                    merchant_id=merchant.merchant_id,
-                    account_type=AccountType.MERCHANT_PENDING
-                ).with_for_update().first()
-
-                available_acct = db.query(db_models.Account).filter_by(
-                    merchant_id=merchant.merchant_id,
-                    account_type=AccountType.MERCHANT_AVAILABLE
-                ).with_for_update().first()
-                amount_to_settle = pending_acct.balance
-
-                if amount_to_settle > 0:
-                    logger.info(f"Settling {amount_to_settle} {merchant.currency} for merchant {merchant.merchant_id}")
-
-                    debit_entry = db_models.LedgerTransaction(
-                        merchant_id=merchant.merchant_id,
-                        transaction_type=TransactionType.CHARGE,
-                        amount=amount_to_settle,
-                        currency=merchant.currency,
-                        debit_account_id=pending_acct.id,
-                        credit_account_id=available_acct.id
-                    )
-                    db.add(debit_entry)
-
-                    pending_acct.balance -= amount_to_settle
-                    available_acct.balance += amount_to_settle
-                    merchant.pending_balance -= amount_to_settle
-                    merchant.available_balance += amount_to_settle
-
-
-                    audit = db_models.AuditLog(
-                        user_id=merchant.user_id,
-                        merchant_id=merchant.merchant_id,
-                        action="FUNDS_SETTLED",
-                        resource_type="MERCHANT_ACCOUNT",
-                        resource_id=str(merchant.merchant_id),
-                        extra_data=str({
-                            "amount_settled": str(amount_to_settle),
-                            "currency": merchant.currency
-                        })
-                    )
-                    db.add(audit)
-                    try:
-                        NotificationService.create_notification(db=db, merchant_id=merchant.merchant_id, user_id=merchant.user_id, type='settlement.succeeded', message=f"Settlement completed: {amount_to_settle} {merchant.currency}", data=str({"amount": str(amount_to_settle)}))
-                    except Exception:
-                        logger.exception("Failed to create settlement notification")
-                    try:
-                        hooks = db.query(db_models.WebhookEndpoint).filter_by(merchant_id=merchant.merchant_id, enabled=True).all()
-                        for hook in hooks:
-                            payload = {
-                                "event": "settlement.succeeded",
-                                "merchant_id": merchant.merchant_id,
-                                "amount": str(amount_to_settle),
-                                "currency": merchant.currency
-                            }
-                            delivery = WebhookService.record_delivery(db=db, webhook_id=hook.id, event="settlement.succeeded", payload=payload)
-                            celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery.id,))
-                    except Exception as e:
-                        logger.exception(f"Error creating webhook delivery for settlement {merchant.merchant_id}: {e}")
-
-            logger.info("Settlement task finished successfully.")
+        run = SettlementService.start_run(db)
+        shards = SettlementService.pending_shards(db, run.id)
+        run_id = run.id
 
-        except Exception as e:
-            logger.error(f"Settlement task failed: {e}", exc_info=True)
+    if not shards:
+        logger.info(f"Settlement run {run_id} has no pending shards.")
+        return
+    callback = finish_settlement_run_task.s(run_id).on_error(fail_settlement_run_task.s(run_id=run_id))
+    chord(settle_shard_task.s(run_id, shard) for shard in shards)(callback)
+    logger.info(f"Settlement run {run_id} dispatched {len(shards)} shard tasks.")
+
+
+@celery_app.task(name="app.tasks.settle_shard_task", acks_late=True)
+def settle_shard_task(run_id: int, shard: int):
+    with session_scope() as db:
+        SettlementService.settle_shard(db, run_id, shard, on_chunk=WebhookService.dispatch_deliveries)
+    return shard
+
+
+@celery_app.task(name="app.tasks.finish_settlement_run_task")
+def finish_settlement_run_task(shards, run_id: int):
+    with session_scope() as db:
+        run = SettlementService.finish_run(db, run_id)
+        return {"run_id": run.id, "status": run.status, "merchants_settled": run.merchants_settled, "totals": run.totals}
+
+
+@celery_app.task(name="app.tasks.fail_settlement_run_task")
+def fail_settlement_run_task(request, exc, traceback, run_id: int):
+    """Chord error callback: a shard failed for good, so the run is marked failed instead of left running."""
+    with session_scope() as db:
+        SettlementService.fail_run(db, run_id, f"{type(exc).__name__}: {exc}")
 
 
 @celery_app.task(name="app.tasks.process_payout_task")
@@ -260,60 +251,56 @@ def process_payout_task(payout_id: str):
                 payout.status = db_models.PayoutStatus.SUCCEEDED
                 payout.processed_at = func.now()
                 db.add(payout)
-                audit = db_models.AuditLog(
-                    user_id=payout.merchant.user_id if payout.merchant else None,
-                    merchant_id=payout.merchant_id,
-                    action="PAYOUT_PROCESSED",
-                    resource_type="PAYOUT",
-                    resource_id=str(payout.id),
-                    extra_data=str({"amount": str(payout.amount), "currency": payout.currency})
+                OutboxService.publish(
+                    db, "payout.succeeded", payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None,
+                    notification={"message": f"Payout succeeded: {payout.amount} {payout.currency}", "data": str({"payout_id": payout.id})},
+                    audit={
+                        "action": "PAYOUT_PROCESSED",
+                        "resource_type": "PAYOUT",
+                        "resource_id": str(payout.id),
+                        "extra_data": str({"amount": str(payout.amount), "currency": payout.currency}),
+                    },
                 )
-                db.add(audit)
+                _publish_payout_status(db, payout)
                 db.commit()
                 logger.info(f"Finalized payout {payout_id} (reservation path)")
-                try:
-                    NotificationService.create_notification(db=db, merchant_id=payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None, type='payout.succeeded', message=f"Payout succeeded: {payout.amount} {payout.currency}", data=str({"payout_id": payout.id}))
-                except Exception:
-                    logger.exception("Failed to create payout succeeded notification (reservation path)")
                 return
             available_acct = db.query(db_models.Account).filter(
                 db_models.Account.merchant_id == payout.merchant_id,
                 db_models.Account.account_type == db_models.AccountType.MERCHANT_AVAILABLE,
                 db_models.Account.currency == payout.currency
             ).with_for_update().first()
-            payable_acct = db.query(db_models.Account).filter(
-                db_models.Account.account_type == db_models.AccountType.PLATFORM_PAYABLE,
-                db_models.Account.currency == payout.currency
-            ).with_for_update().first()
+            payable_acct = PlatformAccountService.get_account(
+                db, AccountType.PLATFORM_PAYABLE, payout.currency, shard_key=str(payout.id)
+            )
             if not available_acct or not payable_acct:
                 logger.error(f"Missing ledger accounts for payout {payout_id} (Currency: {payout.currency})")
                 payout.status = db_models.PayoutStatus.FAILED
                 payout.failure_reason = "Internal platform accounting error."
                 db.add(payout)
+                _publish_payout_status(db, payout)
                 db.commit()
                 return
 
-            if available_acct.balance < payout.amount:
-                logger.warning(f"Insufficient funds for payout {payout_id}. Found {available_acct.balance} but needed {payout.amount}")
+            available_balance = LedgerService.get_balance(db, available_acct)
+            if available_balance < payout.amount:
+                logger.warning(f"Insufficient funds for payout {payout_id}. Found {available_balance} but needed {payout.amount}")
                 payout.status = db_models.PayoutStatus.FAILED
                 payout.failure_reason = "Insufficient funds at time of processing."
                 db.add(payout)
+                _publish_payout_status(db, payout)
                 db.commit()
                 return
 
             fee_amount = (payout.amount * FEE_RATE).quantize(Decimal("0.0001"))
 
-            platform_revenue_acct = db.query(db_models.Account).filter(
-                db_models.Account.account_type == db_models.AccountType.PLATFORM_REVENUE,
-                db_models.Account.currency == payout.currency
-            ).with_for_update().first()
-            if not platform_revenue_acct:
-                platform_revenue_acct = db_models.Account(account_type=db_models.AccountType.PLATFORM_REVENUE, currency=payout.currency, balance=0)
-                db.add(platform_revenue_acct)
-                db.flush()
+            platform_revenue_acct = PlatformAccountService.get_account(
+                db, AccountType.PLATFORM_REVENUE, payout.currency, shard_key=str(payout.id)
+            )
 
             payout_ledger = db_models.LedgerTransaction(
                 payout_id=payout.id,
+                merchant_id=payout.merchant_id,
                 transaction_type=db_models.TransactionType.PAYOUT,
                 description=f"Payout {payout.id} to {payout.payout_account_id}",
                 amount=payout.amount,
@@ -321,10 +308,11 @@ def process_payout_task(payout_id: str):
                 debit_account_id=available_acct.id,
                 credit_account_id=payable_acct.id
             )
-            db.add(payout_ledger)
+            entries = [payout_ledger]
             if fee_amount and fee_amount > 0:
                 fee_ledger = db_models.LedgerTransaction(
                     payout_id=payout.id,
+                    merchant_id=payout.merchant_id,
                     description=f"Payout fee for {payout.id}",
                     amount=fee_amount,
                     transaction_type=db_models.TransactionType.FEE,
@@ -332,46 +320,31 @@ def process_payout_task(payout_id: str):
                     debit_account_id=available_acct.id,
                     credit_account_id=platform_revenue_acct.id
                 )
-                db.add(fee_ledger)
-
-            available_acct.balance -= (payout.amount + (fee_amount if fee_amount else Decimal('0')))
-            payable_acct.balance += payout.amount
-            platform_revenue_acct.balance += (fee_amount if fee_amount else Decimal('0'))
-            if payout.merchant:
-                payout.merchant.available_balance -= (payout.amount + (fee_amount if fee_amount else Decimal('0')))
+                entries.append(fee_ledger)
+            LedgerService.post(db, entries)
 
             payout.status = db_models.PayoutStatus.SUCCEEDED
             payout.processed_at = func.now()
-            audit = db_models.AuditLog(
-                user_id=payout.merchant.user_id if payout.merchant else None,
-                merchant_id=payout.merchant_id,
-                action="PAYOUT_PROCESSED",
-                resource_type="PAYOUT",
-                resource_id=str(payout.id),
-                extra_data=str({"amount": str(payout.amount), "fee": str(fee_amount), "currency": payout.currency})
+            OutboxService.publish(
+                db, "payout.succeeded", payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None,
+                webhook={
+                    "event": "payout.succeeded",
+                    "payout_id": payout.id,
+                    "amount": str(payout.amount),
+                    "currency": payout.currency,
+                    "merchant_id": payout.merchant_id
+                },
+                notification={"message": f"Payout succeeded: {payout.amount} {payout.currency}", "data": str({"payout_id": payout.id, "fee": str(fee_amount)})},
+                audit={
+                    "action": "PAYOUT_PROCESSED",
+                    "resource_type": "PAYOUT",
+                    "resource_id": str(payout.id),
+                    "extra_data": str({"amount": str(payout.amount), "fee": str(fee_amount), "currency": payout.currency}),
+                },
             )
-            db.add(audit)
+            _publish_payout_status(db, payout)
             db.commit()
-            try:
-                hooks = db.query(db_models.WebhookEndpoint).filter_by(merchant_id=payout.merchant_id, enabled=True).all()
-                for hook in hooks:
-                    payload = {
-                        "event": "payout.succeeded",
-                        "payout_id": payout.id,
-                        "amount": str(payout.amount),
-                        "currency": payout.currency,
-                        "merchant_id": payout.merchant_id
-                    }
-                    delivery = WebhookService.record_delivery(db=db, webhook_id=hook.id, event="payout.succeeded", payload=payload)
-                    celery_app.send_task("app.tasks.process_webhook_delivery", args=(delivery.id,))
-            except Exception as e:
-                logger.exception(f"Error creating webhook deliveries for payout {payout.id}: {e}")
-
             logger.info(f"Successfully processed payout {payout_id} (fallback path). fee={fee_amount}")
-            try:
-                NotificationService.create_notification(db=db, merchant_id=payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None, type='payout.succeeded', message=f"Payout succeeded: {payout.amount} {payout.currency}", data=str({"payout_id": payout.id, "fee": str(fee_amount)}))
-            except Exception:
-                logger.exception("Failed to create payout succeeded notification (fallback path)")
 
         except Exception as e:
             logger.error(f"Error processing payout {payout_id}: {e}", exc_info=True)
@@ -380,11 +353,12 @@ def process_payout_task(payout_id: str):
                 payout.status = db_models.PayoutStatus.FAILED
                 payout.failure_reason = "Processing error"
                 db.add(payout)
+                OutboxService.publish(
+                    db, "payout.failed", payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None,
+                    notification={"message": f"Payout failed: {payout.amount} {payout.currency}", "data": str({"payout_id": payout.id, "reason": payout.failure_reason})},
+                )
+                _publish_payout_status(db, payout)
                 db.commit()
-                try:
-                    NotificationService.create_notification(db=db, merchant_id=payout.merchant_id, user_id=payout.merchant.user_id if payout.merchant else None, type='payout.failed', message=f"Payout failed: {payout.amount} {payout.currency}", data=str({"payout_id": payout.id, "reason": payout.failure_reason}))
-                except Exception:
-                    logger.exception("Failed to create payout failed notification")
             except Exception:
                 db.rollback()
             return
@@ -399,6 +373,10 @@ def process_webhook_delivery(delivery_id: int):
             if not delivery:
                 logger.error(f"Delivery {delivery_id} not found")
                 return
+            if delivery.status != 'pending':
+                # Already sent, or claimed by the delivery engine.
+                logger.info(f"Delivery {delivery_id} is {delivery.status}, skipping")
+                return
 
             webhook = db.query(db_models.WebhookEndpoint).filter_by(id=delivery.webhook_id).first()
             if not webhook or not webhook.enabled:
@@ -409,7 +387,17 @@ def process_webhook_delivery(delivery_id: int):
                 db.add(delivery)
                 return
 
+            limit, retry_at = webhook_circuit.admit([webhook.id], 1)[webhook.id]
+            if not limit:
+                # Circuit open: park the delivery without spending an attempt.
+                logger.info(f"Webhook {webhook.id} circuit is open, parking delivery {delivery_id} until {retry_at}")
+                delivery.status = 'retrying'
+                delivery.next_attempt_at = retry_at
+                db.add(delivery)
+                return
+
             payload = None
+            started = time.monotonic()
             try:
                 import json
                 try:
@@ -420,45 +408,51 @@ def process_webhook_delivery(delivery_id: int):
                 with httpx.Client(timeout=10.0) as client:
                     resp = client.post(webhook.url, json=payload)
                 http_status = resp.status_code
+                webhook_circuit.record([(webhook.id, http_status < 400, (time.monotonic() - started) * 1000)])
                 response_body = resp.text
                 delivery.attempts = (delivery.attempts or 0) + 1
                 delivery.http_status = http_status
                 delivery.response_body = response_body
-                delivery.status = 'success' if http_status < 400 else 'failed'
+                if http_status < 400:
+                    delivery.status = 'success'
+                    delivery.next_attempt_at = None
+                else:
+                    outcome = WebhookService.failure_outcome(delivery.attempts)
+                    delivery.status = outcome["status"]
+                    delivery.next_attempt_at = outcome["next_attempt_at"]
                 delivery.last_attempt_at = func.now()
                 db.add(delivery)
 
                 note_msg = f"Webhook event '{delivery.event}' delivery {delivery.status} (http {http_status})"
-                note = db_models.Notification(
-                    merchant_id=webhook.merchant_id,
-                    user_id=None,
-                    type='webhook.delivery',
-                    message=note_msg,
-                    data=str({"delivery_id": delivery.id, "http_status": http_status}),
-                    is_read=False
-                )
-                db.add(note)
+                NotificationService.bulk_create(db, [{
+                    "merchant_id": webhook.merchant_id,
+                    "user_id": None,
+                    "type": 'webhook.delivery',
+                    "message": note_msg,
+                    "data": str({"delivery_id": delivery.id, "http_status": http_status}),
+                }])
                 db.commit()
                 logger.info(f"Processed delivery {delivery_id}: status={delivery.status} http={http_status}")
 
             except Exception as e:
                 logger.exception(f"Error sending webhook delivery {delivery_id}: {e}")
+                webhook_circuit.record([(webhook.id, False, None)])
                 delivery.attempts = (delivery.attempts or 0) + 1
-                delivery.status = 'failed'
+                outcome = WebhookService.failure_outcome(delivery.attempts)
+                delivery.status = outcome["status"]
+                delivery.next_attempt_at = outcome["next_attempt_at"]
                 delivery.response_body = str(e)
                 delivery.last_attempt_at = func.now()
                 db.add(delivery)
 
                 note_msg = f"Webhook event '{delivery.event}' delivery failed: {str(e)}"
-                note = db_models.Notification(
-                    merchant_id=webhook.merchant_id if webhook else None,
-                    user_id=None,
-                    type='webhook.delivery',
-                    message=note_msg,
-                    data=str({"delivery_id": delivery.id}),
-                    is_read=False
-                )
-                db.add(note)
+                NotificationService.bulk_create(db, [{
+                    "merchant_id": webhook.merchant_id if webhook else None,
+                    "user_id": None,
+                    "type": 'webhook.delivery',
+                    "message": note_msg,
+                    "data": str({"delivery_id": delivery.id}),
+                }])
                 db.commit()
 
         except Exception as ex:
@@ -467,3 +461,76 @@ def process_webhook_delivery(delivery_id: int):
                 db.rollback()
             except Exception:
                 pass
+
+
+@celery_app.task(name="app.tasks.retry_webhook_deliveries_task")
+def retry_webhook_deliveries_task(max_batches: int | None = None):
+    """Re-send due failed deliveries, a batch at a time, through the pooled delivery engine."""
+    with session_scope() as db:
+        released = WebhookService.release_stale_claims(db)
+        undispatched = WebhookService.release_undispatched(db)
+    if released:
+        logger.warning(f"Released {released} stale webhook delivery claims for retry")
+    if undispatched:
+        logger.warning(f"Released {undispatched} undispatched webhook deliveries for retry")
+    engine = WebhookDeliveryEngine(SessionLocal)
+    retried = asyncio.run(engine.run_retries(max_batches or settings.WEBHOOK_RETRY_MAX_BATCHES))
+    if retried:
+        logger.info(f"Retried {retried} webhook deliveries")
+    return retried
+
+
+@celery_app.task(name="app.tasks.relay_outbox_task")
+def relay_outbox_task(max_batches: int | None = None):
+    """Fan out committed outbox events to webhooks, notifications and audit logs."""
+    published = OutboxService.drain(SessionLocal, max_batches)
+    if published:
+        logger.info(f"Relayed {published} outbox events")
+    return published
+
+
+@celery_app.task(name="app.tasks.flush_api_key_usage_task")
+def flush_api_key_usage_task():
+    with session_scope() as db:
+        flushed = api_key_usage.flush(db)
+    return {"api_keys": flushed}
+
+
+@celery_app.task(name="app.tasks.rollup_platform_account_shards_task")
+def rollup_platform_account_shards_task():
+    with session_scope() as db:
+        folded = PlatformAccountService.rollup_shards(db)
+    logger.info(f"Platform account roll-up folded {folded} accounts")
+    return {"accounts": folded}
+
+
+@celery_app.task(name="app.tasks.materialize_ledger_balances_task")
+def materialize_ledger_balances_task(max_batches: int = 20):
+    applied = 0
+    for _ in range(max_batches):
+        with session_scope() as db:
+            count = LedgerService.materialize(db)
+        applied += count
+        if not count:
+            break
+    return {"entries": applied}
+
+
+@celery_app.task(name="app.tasks.maintain_partitions_task")
+def maintain_partitions_task():
+    with session_scope() as db:
+        created = PartitionService.ensure_partitions(db)
+        archived = PartitionService.archive_partitions(db)
+    return {"created": created, "archived": [entry["partition"] for entry in archived]}
+
+
+@celery_app.task(name="app.tasks.rollup_merchant_stats_task")
+def rollup_merchant_stats_task(max_batches: int = 20):
+    rolled = 0
+    for _ in range(max_batches):
+        with session_scope() as db:
+            count = MerchantStatsService.rollup(db)
+        rolled += count
+        if not count:
+            break
+    return {"entries": rolled}
@@ -3,13 +3,15 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from .config import settings
 from .db_con import get_db
 from ..models import db_models
 from ..schemas import token as tk
 from ..utilities import db_con
-from ..utilities.utils import verify_password
+from ..utilities.utils import verify_password, api_key_digest, verify_api_key_digest, parse_api_key_lookup_id
 from .logger import log_user_action, log_security_event, setup_logger
+from . import principal_cache, api_key_usage
 
 logger = setup_logger(__name__)
 
@@ -128,6 +130,11 @@ def get_current_user(
         logger.warning("No token provided in Authorization header or access_token cookie")
         raise credentials_exception
 
+    cache_key = principal_cache.jwt_cache_key(token)
+    cached = principal_cache.get(cache_key)
+    if cached:
+        return principal_cache.attach(db, cached)
+
     token_data = verify_access_token(token, credentials_exception)
 
     if token_data.id is None:
@@ -138,9 +145,67 @@ def get_current_user(
     if user is None:
         raise credentials_exception
 
+    principal_cache.put(cache_key, user, expires_at=jwt.get_unverified_claims(token).get("exp"))
     return user
 
 
+def _backfill_key_digest(db: Session, key: db_models.APIKey, digest: str) -> None:
+    """Store a legacy key's digest in its own transaction, leaving the request's untouched."""
+    try:
+        with Session(bind=db.get_bind()) as backfill_db:
+            backfill_db.query(db_models.APIKey).filter(
+                db_models.APIKey.id == key.id,
+                db_models.APIKey.key_digest.is_(None)
+            ).update({"key_digest": digest}, synchronize_session=False)
+            backfill_db.commit()
+    except Exception as e:
+        logger.warning(f"Failed to backfill digest for legacy API key {key.id}: {e}")
+        return
+    set_committed_value(key, "key_digest", digest)
+    logger.info(f"Backfilled digest for legacy API key {key.id}")
+
+
+def find_api_key(api_key: str, db: Session) -> db_models.APIKey | None:
+    """
+    Resolve a raw API key to its active row.
+
+    Keys carrying a lookup id are fetched by that id and checked against the
+    stored keyed digest, and nothing else: a bad key of that shape costs one
+    constant-time compare, never the legacy scan. Older keys are matched on their digest once they have
+    been upgraded; until then they fall back to a bcrypt scan over the
+    not-yet-upgraded rows, and a match backfills the digest so the next
+    request takes the indexed path.
+    """
+    lookup_id = parse_api_key_lookup_id(api_key)
+    if lookup_id:
+        key = db.query(db_models.APIKey).filter(
+            db_models.APIKey.lookup_id == lookup_id,
+            db_models.APIKey.is_active == True
+        ).first()
+        return key if key and verify_api_key_digest(api_key, key.key_digest) else None
+
+    digest = api_key_digest(api_key)
+    key = db.query(db_models.APIKey).filter(
+        db_models.APIKey.key_digest == digest,
+        db_models.APIKey.is_active == True
+    ).first()
+    if key:
+        return key
+
+    if not settings.API_KEY_LEGACY_SCAN:
+        return None
+
+    legacy_keys = db.query(db_models.APIKey).filter(
+        db_models.APIKey.key_digest.is_(None),
+        db_models.APIKey.is_active == True
+    ).all()
+    for key in legacy_keys:
+        if verify_password(api_key, key.api_key):
+            _backfill_key_digest(db, key, digest)
+            return key
+    return None
+
+
 def get_user_from_api_key(api_key: str, db: Session) -> db_models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -152,20 +217,17 @@ def get_user_from_api_key(api_key: str, db: Session) -> db_models.User:
         log_security_event("NO_API_KEY_PROVIDED", {"endpoint": "protected_resource"})
         raise credentials_exception
     logger.debug(f"API key received: {api_key[:15]}...")
-    api_keys = db.query(db_models.APIKey).filter(
-        db_models.APIKey.is_active == True
-    ).all()
-    matched_key = None
-    for key in api_keys:
-        if verify_password(api_key, key.api_key):
-            matched_key = key
-            break
+    cache_key = principal_cache.api_key_cache_key(api_key_digest(api_key))
+    cached = principal_cache.get(cache_key)
+    if cached:
+        api_key_usage.record(cached["api_key_id"], db)
+        return principal_cache.attach(db, cached)
+    matched_key = find_api_key(api_key, db)
     if not matched_key:
         logger.warning(f"Invalid API key attempted: {api_key[:15]}...")
         log_security_event("INVALID_API_KEY", {"key_prefix": api_key[:15]}, severity="WARNING")
         raise credentials_exception
-    matched_key.last_used_at = datetime.now(timezone.utc)
-    db.commit()
+    api_key_usage.record(matched_key.id, db)
     merchant = db.query(db_models.MerchantAccount).filter(
         db_models.MerchantAccount.merchant_id == matched_key.merchant_id
     ).first()
@@ -181,6 +243,7 @@ def get_user_from_api_key(api_key: str, db: Session) -> db_models.User:
         log_security_event("USER_NOT_FOUND_FOR_MERCHANT", {"merchant_id": merchant.merchant_id}, severity="ERROR")
         raise credentials_exception
     logger.info(f"User {user.id} authenticated via API key {matched_key.id}")
+    principal_cache.put(cache_key, user, api_key_id=matched_key.id)
     return user
 
 
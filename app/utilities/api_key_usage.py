@@ -0,0 +1,186 @@
+"""
+Write-behind usage tracking for API keys.
+
+Authenticating with an API key only records the hit here; nothing is written to
+the request's transaction. Hits accumulate in Redis (shared by every API
+process) or, when Redis is unavailable, in a per-process buffer, and `flush`
+moves them to the database in bulk: one UPDATE for `api_keys.last_used_at` and
+one upsert into `api_key_usage_daily` for the per-day request counters.
+
+The Celery beat entry "flush_api_key_usage" calls `flush` every
+API_KEY_USAGE_FLUSH_SECONDS. Processes buffering locally flush their own buffer
+on the same interval, so `last_used_at` and the counters lag by at most that long.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timezone
+
+import redis
+from sqlalchemy import case, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import db_models
+from .cache import get_redis
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_LAST_USED_KEY = "api_key_usage:last_used"
+_COUNTS_KEY = "api_key_usage:counts"
+
+_lock = threading.Lock()
+_last_used: dict[int, float] = {}
+_counts: defaultdict[tuple[int, date], int] = defaultdict(int)
+_last_local_flush = time.monotonic()
+
+
+def record(api_key_id: int, db: Session | None = None) -> None:
+    """Note one authenticated request for `api_key_id`."""
+    now = time.time()
+    day = datetime.fromtimestamp(now, timezone.utc).date()
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(_LAST_USED_KEY, str(api_key_id), now)
+            pipe.hincrby(_COUNTS_KEY, f"{api_key_id}:{day.isoformat()}", 1)
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Failed to record API key usage in Redis, buffering locally: {e}")
+
+    _buffer({api_key_id: now}, {(api_key_id, day): 1})
+    if db is not None and _local_flush_due():
+        try:
+            with Session(bind=db.get_bind()) as flush_db:
+                flush(flush_db)
+        except Exception:
+            pass  # already logged and re-buffered by flush; never fail the request
+
+
+def _buffer(last_used: dict[int, float], counts: dict[tuple[int, date], int]) -> None:
+    with _lock:
+        for key_id, ts in last_used.items():
+            if ts > _last_used.get(key_id, 0):
+                _last_used[key_id] = ts
+        for bucket, count in counts.items():
+            _counts[bucket] += count
+
+
+def _restore(last_used: dict[int, float], counts: dict[tuple[int, date], int]) -> None:
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key_id, ts in last_used.items():
+                # Anything recorded since the drain is newer; keep it.
+                pipe.hsetnx(_LAST_USED_KEY, str(key_id), ts)
+            for (key_id, day), count in counts.items():
+                pipe.hincrby(_COUNTS_KEY, f"{key_id}:{day.isoformat()}", count)
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Failed to return API key usage to Redis, buffering locally: {e}")
+    _buffer(last_used, counts)
+
+
+def _local_flush_due() -> bool:
+    global _last_local_flush
+    with _lock:
+        if time.monotonic() - _last_local_flush < settings.API_KEY_USAGE_FLUSH_SECONDS:
+            return False
+        _last_local_flush = time.monotonic()
+        return True
+
+
+def _drain_redis(client) -> tuple[dict[str, str], dict[str, str]]:
+    # One MULTI reads and clears both hashes atomically: either both are
+    # drained or neither is touched, and hits recorded meanwhile run after it
+    # and land in fresh hashes.
+    pipe = client.pipeline(transaction=True)
+    pipe.hgetall(_LAST_USED_KEY)
+    pipe.hgetall(_COUNTS_KEY)
+    pipe.delete(_LAST_USED_KEY, _COUNTS_KEY)
+    raw_last_used, raw_counts, _ = pipe.execute()
+    return raw_last_used, raw_counts
+
+
+def _drain() -> tuple[dict[int, float], dict[tuple[int, date], int]]:
+    with _lock:
+        last_used = dict(_last_used)
+        counts = dict(_counts)
+        _last_used.clear()
+        _counts.clear()
+
+    client = get_redis()
+    if client is None:
+        return last_used, counts
+    try:
+        raw_last_used, raw_counts = _drain_redis(client)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to drain API key usage from Redis: {e}")
+        return last_used, counts
+
+    for key_id, ts in raw_last_used.items():
+        key_id, ts = int(key_id), float(ts)
+        if ts > last_used.get(key_id, 0):
+            last_used[key_id] = ts
+    for field, count in raw_counts.items():
+        key_id, day = field.split(":", 1)
+        bucket = (int(key_id), date.fromisoformat(day))
+        counts[bucket] = counts.get(bucket, 0) + int(count)
+    return last_used, counts
+
+
+def _upsert_counts(db: Session, rows: list[dict]) -> None:
+    table = db_models.APIKeyUsageDaily.__table__
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.api_key_id, table.c.day],
+        set_={"request_count": table.c.request_count + stmt.excluded.request_count},
+    )
+    db.execute(stmt)
+
+
+def flush(db: Session) -> int:
+    """Persist buffered usage. Returns the number of API keys touched."""
+    last_used, counts = _drain()
+    if not last_used and not counts:
+        return 0
+
+    key_ids = set(last_used) | {key_id for key_id, _ in counts}
+    try:
+        existing = set(db.scalars(
+            select(db_models.APIKey.id).where(db_models.APIKey.id.in_(key_ids))
+        ))
+        last_used_at = {
+            key_id: datetime.fromtimestamp(ts, timezone.utc)
+            for key_id, ts in last_used.items() if key_id in existing
+        }
+        if last_used_at:
+            db.execute(
+                update(db_models.APIKey)
+                .where(db_models.APIKey.id.in_(last_used_at))
+                .values(last_used_at=case(last_used_at, value=db_models.APIKey.id))
+                .execution_options(synchronize_session=False)
+            )
+        rows = [
+            {"api_key_id": key_id, "day": day, "request_count": count}
+            for (key_id, day), count in counts.items() if key_id in existing
+        ]
+        if rows:
+            _upsert_counts(db, rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _restore(last_used, counts)
+        logger.error(f"Failed to flush API key usage, kept {len(key_ids)} keys buffered: {e}", exc_info=True)
+        raise
+
+    logger.info(f"Flushed usage for {len(existing)} API keys ({sum(counts.values())} requests)")
+    return len(existing)
@@ -0,0 +1,118 @@
+"""
+Versioned cache of merchant balances for the dashboard balance endpoint.
+
+Every merchant has a version counter in Redis that is incremented after each
+transaction that moves its balances commits (charge, settlement and payout
+postings, balance corrections). A cached balance carries the version that was
+current when it was read from the database, and is served only while that is
+still the merchant's version, so a read costs one Redis GET instead of the
+balance queries. The version is read before the balances, so a posting that
+commits while a balance is being computed leaves that entry already stale.
+
+Without Redis there is no shared version to check, and balances are always
+read from the database.
+"""
+import threading
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import TwoTierCache, get_redis
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_cache = TwoTierCache(
+    "balance",
+    ttl=settings.BALANCE_CACHE_TTL_SECONDS,
+    local_ttl=settings.BALANCE_CACHE_LOCAL_TTL_SECONDS,
+)
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+_PENDING_KEY = "balance_cache_bumps"
+
+
+def _version_key(merchant_id: str) -> str:
+    return f"balance:version:{merchant_id}"
+
+
+def _count(outcome: str) -> None:
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def stats() -> dict:
+    """Hits, misses and hit rate of this process since start (or `reset_stats`)."""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def current_version(merchant_id: str) -> int | None:
+    """The merchant's balance version, or None when it cannot be read."""
+    client = get_redis()
+    if client is None or not settings.BALANCE_CACHE_ENABLED:
+        return None
+    try:
+        return int(client.get(_version_key(merchant_id)) or 0)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read balance version for merchant {merchant_id}: {e}")
+        return None
+
+
+def get(user_id: int) -> dict | None:
+    """The cached balance of `user_id`'s merchant, if it is still current."""
+    if not settings.BALANCE_CACHE_ENABLED:
+        return None
+    entry = _cache.get(str(user_id))
+    if entry is None or current_version(entry["merchant_id"]) != entry["version"]:
+        _count("misses")
+        return None
+    _count("hits")
+    return entry["balance"]
+
+
+def put(user_id: int, merchant_id: str, version: int | None, balance: dict) -> None:
+    """Cache `balance`, read from the database at `version` (from `current_version`)."""
+    if version is None or not settings.BALANCE_CACHE_ENABLED:
+        return
+    _cache.set(str(user_id), {"merchant_id": merchant_id, "version": version, "balance": balance})
+
+
+def bump(*merchant_ids: str) -> None:
+    client = get_redis()
+    if client is None or not merchant_ids:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for merchant_id in merchant_ids:
+            pipe.incr(_version_key(merchant_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to bump balance versions for {len(merchant_ids)} merchants: {e}")
+
+
+def bump_on_commit(db: Session, *merchant_ids: str | None) -> None:
+    """Bump the merchants' balance versions once `db` commits."""
+    db.info.setdefault(_PENDING_KEY, set()).update(m for m in merchant_ids if m)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        bump(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
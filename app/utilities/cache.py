@@ -0,0 +1,180 @@
+"""
+Small caching helpers shared by the API and the workers.
+
+TwoTierCache keeps a bounded, short-lived LRU in the current process in front of
+Redis. Redis is optional: when REDIS_URL is unset or the server is unreachable
+the cache degrades to the in-process tier only and never raises.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import redis
+
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the shared Redis client, or None when Redis is not configured."""
+    global _redis_client
+    if not settings.REDIS_URL:
+        return None
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                _redis_client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    decode_responses=True,
+                    socket_timeout=0.5,
+                    socket_connect_timeout=0.5,
+                )
+    return _redis_client
+
+
+def set_redis(client) -> None:
+    """Swap the shared Redis client (used by tests to plug in fakeredis)."""
+    global _redis_client
+    _redis_client = client
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class TwoTierCache:
+    """In-process LRU backed by Redis; values must be JSON serialisable."""
+
+    def __init__(self, namespace: str, ttl: int, local_ttl: float, local_maxsize: int = 10_000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=local_maxsize, ttl=local_ttl)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            raw = client.get(self._key(key))
+        except redis.RedisError as e:
+            logger.warning(f"Redis read failed for {self.namespace}: {e}")
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def get_many(self, keys) -> dict[str, Any]:
+        """Look up several keys with at most one Redis round trip; misses are left out."""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        client = get_redis()
+        if not missing or client is None:
+            return found
+        try:
+            raws = client.mget([self._key(k) for k in missing])
+        except redis.RedisError as e:
+            logger.warning(f"Redis read failed for {self.namespace}: {e}")
+            return found
+        for key, raw in zip(missing, raws):
+            if raw is not None:
+                found[key] = json.loads(raw)
+                self.local.set(key, found[key])
+        return found
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        if not items:
+            return
+        for key, value in items.items():
+            self.local.set(key, value)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self._key(key), json.dumps(value), ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Redis write failed for {self.namespace}: {e}")
+
+    def set(self, key: str, value: Any, ttl: int | None = None) -> None:
+        ttl = self.ttl if ttl is None else max(1, min(int(ttl), self.ttl))
+        self.local.set(key, value, ttl)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.set(self._key(key), json.dumps(value), ex=ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Redis write failed for {self.namespace}: {e}")
+
+    def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        self.local.delete(*keys)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.delete(*[self._key(k) for k in keys])
+        except redis.RedisError as e:
+            logger.warning(f"Redis delete failed for {self.namespace}: {e}")
+
+    def clear_local(self) -> None:
+        self.local.clear()
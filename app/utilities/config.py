@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Config(BaseSettings):
@@ -21,6 +23,65 @@ class Config(BaseSettings):
     GOOGLE_REDIRECT_URI: str = "http://ivypayments.ddns.net:8000/api/v1/auth/google/callback"
     GITHUB_CLIENT_ID: str
     GITHUB_CLIENT_SECRET: str
+    API_KEY_LEGACY_SCAN: bool = True
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_LOCAL_TTL_SECONDS: int = 5
+    API_KEY_USAGE_FLUSH_SECONDS: int = 30
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_LOCK_TTL_SECONDS: int = 30
+    IDEMPOTENCY_WAIT_SECONDS: float = 5.0
+    PLATFORM_ACCOUNT_SHARDS: int = 16
+    LEDGER_POSTING_MODE: Literal["immediate", "deferred"] = "immediate"
+    LEDGER_MATERIALIZE_BATCH_SIZE: int = 5000
+    SETTLEMENT_CHUNK_SIZE: int = 1000
+    SETTLEMENT_SHARDS: int = 8
+    WEBHOOK_DELIVERY_BACKEND: Literal["celery", "engine"] = "celery"
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    WEBHOOK_ENGINE_MAX_IN_FLIGHT: int = 256
+    WEBHOOK_ENGINE_PER_ENDPOINT_CONCURRENCY: int = 8
+    WEBHOOK_ENGINE_BATCH_SIZE: int = 200
+    WEBHOOK_ENGINE_POLL_SECONDS: float = 0.5
+    WEBHOOK_ENGINE_MAX_ORIGINS: int = 512
+    WEBHOOK_ENGINE_CLAIM_TIMEOUT_SECONDS: int = 120
+    WEBHOOK_PENDING_GRACE_SECONDS: int = 300
+    WEBHOOK_MAX_ATTEMPTS: int = 8
+    WEBHOOK_RETRY_BASE_SECONDS: int = 30
+    WEBHOOK_RETRY_MAX_SECONDS: int = 21600
+    WEBHOOK_RETRY_MAX_BATCHES: int = 20
+    WEBHOOK_CIRCUIT_FAILURE_THRESHOLD: float = 0.5
+    WEBHOOK_CIRCUIT_MIN_SAMPLES: int = 5
+    WEBHOOK_CIRCUIT_OPEN_SECONDS: int = 30
+    WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS: int = 600
+    WEBHOOK_CIRCUIT_SLOW_MS: float = 2000.0
+    WEBHOOK_SUBSCRIPTION_CACHE_TTL_SECONDS: int = 300
+    WEBHOOK_SUBSCRIPTION_CACHE_LOCAL_TTL_SECONDS: int = 5
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_RELAY_MAX_BATCHES: int = 20
+    OUTBOX_RELAY_POLL_SECONDS: float = 0.2
+    EVENT_STREAM_MAXLEN: int = 1000
+    EVENT_STREAM_TTL_SECONDS: int = 86400
+    EVENT_STREAM_QUEUE_SIZE: int = 100
+    EVENT_STREAM_REPLAY_BATCH: int = 200
+    EVENT_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    EVENT_STREAM_RETRY_MS: int = 3000
+    COUNT_ESTIMATE_THRESHOLD: int = 10000
+    COUNT_CACHE_TTL_SECONDS: int = 30
+    COUNT_CACHE_LOCAL_TTL_SECONDS: int = 10
+    BALANCE_RECOMPUTE_CHUNK_SIZE: int = 1000
+    MERCHANT_SEARCH_CANDIDATES: int = 1000
+    BALANCE_CACHE_ENABLED: bool = True
+    BALANCE_CACHE_TTL_SECONDS: int = 300
+    BALANCE_CACHE_LOCAL_TTL_SECONDS: int = 60
+    BALANCE_HISTORY_STREAM_BATCH_SIZE: int = 1000
+    PARTITION_MONTHS_AHEAD: int = 3
+    PARTITION_ARCHIVE_DIR: str = "archive"
+    AUDIT_LOG_RETENTION_MONTHS: int | None = 12
+    LEDGER_RETENTION_MONTHS: int | None = None
+    STATS_ROLLUP_BATCH_SIZE: int = 5000
+    SETTLEMENT_REPORT_CACHE_ENABLED: bool = True
+    SETTLEMENT_REPORT_CACHE_TTL_SECONDS: int = 86400
+    SETTLEMENT_REPORT_CACHE_LOCAL_TTL_SECONDS: int = 600
 
 
 settings = Config()
@@ -0,0 +1,218 @@
+"""
+Per-merchant event stream behind the server-sent events endpoint.
+
+Writers call `publish_on_commit` inside their transaction. Once it commits,
+each event is appended to the merchant's Redis stream (`merchant_events:{id}`,
+capped at EVENT_STREAM_MAXLEN entries) and the batch is announced with a
+single PUBLISH on the shared `merchant_events` channel. Nothing is published
+for rolled back transactions, or when Redis is not configured.
+
+Each API process runs one EventHub: a single pub/sub subscription that fans
+announcements out to the SSE connections open in that process, so 10k
+streams cost one Redis connection rather than 10k. Every connection has a
+bounded queue. A consumer that falls behind is not buffered without limit:
+when its queue fills it is marked lagging and catches up by reading the
+Redis stream from the last event it was sent, which is also how a
+reconnecting client resumes from its Last-Event-ID.
+"""
+import asyncio
+import json
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import get_redis
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CHANNEL = "merchant_events"
+_PENDING_KEY = "event_stream_pending"
+
+
+def stream_key(merchant_id: str) -> str:
+    return f"{CHANNEL}:{merchant_id}"
+
+
+def available() -> bool:
+    return bool(settings.REDIS_URL)
+
+
+def publish(events) -> None:
+    """Append events, an iterable of (merchant_id, event, data), to their streams and announce them."""
+    events = [(merchant_id, name, json.dumps(data, default=str)) for merchant_id, name, data in events if merchant_id]
+    client = get_redis()
+    if not events or client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for merchant_id, name, data in events:
+            pipe.xadd(stream_key(merchant_id), {"event": name, "data": data}, maxlen=settings.EVENT_STREAM_MAXLEN, approximate=True)
+        entry_ids = pipe.execute()
+        pipe = client.pipeline(transaction=False)
+        for merchant_id in {merchant_id for merchant_id, _, _ in events}:
+            pipe.expire(stream_key(merchant_id), settings.EVENT_STREAM_TTL_SECONDS)
+        pipe.publish(CHANNEL, json.dumps([
+            [merchant_id, entry_id, name, data] for (merchant_id, name, data), entry_id in zip(events, entry_ids)
+        ]))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish {len(events)} merchant events: {e}")
+
+
+def publish_on_commit(db: Session, merchant_id: str | None, name: str, data: dict) -> None:
+    """Publish the event once `db` commits; dropped if it rolls back."""
+    if merchant_id and available():
+        db.info.setdefault(_PENDING_KEY, []).append((merchant_id, name, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        publish(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _entry_key(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def format_event(entry_id: str, name: str, data: str) -> str:
+    return f"id: {entry_id}\nevent: {name}\ndata: {data}\n\n"
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENT_STREAM_QUEUE_SIZE)
+        self.lagging = False
+
+
+class EventHub:
+    def __init__(self, client: aioredis.Redis | None = None):
+        self._client = client
+        self._subscribers: defaultdict[str, set[_Subscriber]] = defaultdict(set)
+        self._reader: asyncio.Task | None = None
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _redis(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._client
+
+    async def _ensure_reader(self) -> None:
+        if self._reader is None or self._reader.done():
+            ready = asyncio.Event()
+            self._reader = asyncio.create_task(self._read(ready))
+            await ready.wait()
+
+    async def _read(self, ready: asyncio.Event) -> None:
+        while True:
+            pubsub = self._redis().pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                ready.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Merchant event subscription lost, resubscribing: {e}")
+                # Announcements may have been missed: everyone catches up from the streams.
+                for subscribers in self._subscribers.values():
+                    for subscriber in subscribers:
+                        subscriber.lagging = True
+                        try:
+                            subscriber.queue.put_nowait(None)  # wake it up to catch up
+                        except asyncio.QueueFull:
+                            pass
+                ready.set()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, batch: list) -> None:
+        for merchant_id, entry_id, name, data in batch:
+            for subscriber in self._subscribers.get(merchant_id, ()):
+                if subscriber.lagging:
+                    continue
+                try:
+                    subscriber.queue.put_nowait((entry_id, name, data))
+                except asyncio.QueueFull:
+                    subscriber.lagging = True
+
+    async def _replay(self, merchant_id: str, after: str):
+        """Stream entries after `after`, oldest first, in EVENT_STREAM_REPLAY_BATCH pages."""
+        while True:
+            entries = await self._redis().xrange(
+                stream_key(merchant_id), min=f"({after}", max="+", count=settings.EVENT_STREAM_REPLAY_BATCH
+            )
+            for entry_id, fields in entries:
+                yield entry_id, fields["event"], fields["data"]
+                after = entry_id
+            if len(entries) < settings.EVENT_STREAM_REPLAY_BATCH:
+                return
+
+    async def stream(self, merchant_id: str, last_event_id: str | None = None):
+        """Yield SSE frames for `merchant_id`, starting after `last_event_id` when given."""
+        subscriber = _Subscriber()
+        await self._ensure_reader()
+        self._subscribers[merchant_id].add(subscriber)
+        try:
+            if last_event_id:
+                try:
+                    _entry_key(last_event_id)
+                except ValueError:
+                    last_event_id = None
+            if last_event_id:
+                subscriber.lagging = True
+            else:
+                latest = await self._redis().xrevrange(stream_key(merchant_id), count=1)
+                last_event_id = latest[0][0] if latest else "0-0"
+            yield f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n"
+
+            while True:
+                if subscriber.lagging:
+                    # Take live events again before reading the stream, so nothing
+                    # published meanwhile is missed; duplicates are skipped below.
+                    subscriber.lagging = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    async for entry_id, name, data in self._replay(merchant_id, last_event_id):
+                        last_event_id = entry_id
+                        yield format_event(entry_id, name, data)
+                    continue
+                try:
+                    item = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    continue
+                entry_id, name, data = item
+                if _entry_key(entry_id) <= _entry_key(last_event_id):
+                    continue
+                last_event_id = entry_id
+                yield format_event(entry_id, name, data)
+        finally:
+            subscribers = self._subscribers.get(merchant_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[merchant_id]
+
+
+hub = EventHub()
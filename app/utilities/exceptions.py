@@ -12,6 +12,10 @@ class InvalidRequestError(PaymentGatewayException):
     def __init__(self, detail: str = "Invalid request"):
         super().__init__(detail, "INVALID_REQUEST")
 
+class InvalidCursorError(InvalidRequestError):
+    def __init__(self, detail: str = "Invalid pagination cursor"):
+        super().__init__(detail)
+
 class ResourceNotFoundError(PaymentGatewayException):
     def __init__(self, resource: str = "Resource"):
         super().__init__(f"{resource} not found", "RESOURCE_NOT_FOUND")
@@ -126,6 +130,14 @@ class DuplicateChargeError(PaymentGatewayException):
     def __init__(self, detail: str = "A charge with this idempotency key already exists"):
         super().__init__(detail, "DUPLICATE_CHARGE")
 
+class IdempotencyKeyReusedError(PaymentGatewayException):
+    def __init__(self, detail: str = "This idempotency key was already used with different request parameters"):
+        super().__init__(detail, "IDEMPOTENCY_KEY_REUSED")
+
+class IdempotencyRequestInProgressError(PaymentGatewayException):
+    def __init__(self, detail: str = "A request with this idempotency key is still being processed"):
+        super().__init__(detail, "IDEMPOTENCY_REQUEST_IN_PROGRESS")
+
 class InsufficientFundsError(PaymentFailedError):
     def __init__(self):
         super().__init__("Insufficient funds for this operation")
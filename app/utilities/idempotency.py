@@ -0,0 +1,194 @@
+"""
+Redis-backed idempotency store for charge creation.
+
+Each (user, Idempotency-Key) pair gets one Redis record. The first request
+claims it atomically (SET NX) as "in_flight"; when it succeeds the record is
+replaced by the serialised response and kept for IDEMPOTENCY_TTL_SECONDS.
+Retries that arrive while the original is still running wait up to
+IDEMPOTENCY_WAIT_SECONDS for it to finish, then replay its response without
+touching the database. A retry whose body differs from the original is rejected.
+Batches claim all of their keys at once with `acquire_many` and do not wait.
+
+Redis is optional: without it `acquire` always lets the request through and
+ChargeService falls back to the database lookup and unique constraint.
+"""
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+
+import redis
+
+from ..schemas import charges as charge_schema
+from .cache import get_redis
+from .config import settings
+from .exceptions import IdempotencyKeyReusedError, IdempotencyRequestInProgressError
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_POLL_INTERVAL_SECONDS = 0.05
+
+
+def request_fingerprint(charge_data: charge_schema.ChargeCreate) -> str:
+    """Digest of the request parameters that must match on a retry."""
+    body = {
+        "amount": str(charge_data.amount.normalize()),
+        "currency": charge_data.currency.upper(),
+        "description": charge_data.description,
+        "payment_token": charge_data.payment_token,
+    }
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+def _key(user_id: int, idempotency_key: str) -> str:
+    return f"idempotency:charge:{user_id}:{hashlib.sha256(idempotency_key.encode()).hexdigest()}"
+
+
+class IdempotencyClaim:
+    """Ownership of an in-flight record, returned by `acquire`."""
+
+    def __init__(self, user_id: int, idempotency_key: str, fingerprint: str, token: str):
+        self.key = _key(user_id, idempotency_key)
+        self.fingerprint = fingerprint
+        self.token = token
+
+    def complete(self, response: dict) -> None:
+        """Store the response so retries replay it."""
+        client = get_redis()
+        if client is None:
+            return
+        record = {"state": "done", "fp": self.fingerprint, "response": response}
+        try:
+            client.set(self.key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store idempotent response: {e}")
+
+    def release(self) -> None:
+        """Drop the in-flight record after a failure so the client can retry."""
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(self.key)
+                raw = pipe.get(self.key)
+                if raw is None or json.loads(raw).get("token") != self.token:
+                    return
+                pipe.multi()
+                pipe.delete(self.key)
+                pipe.execute()
+        except redis.WatchError:
+            pass  # someone else replaced the record; it is no longer ours
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release idempotency record: {e}")
+
+
+async def acquire(user_id: int, idempotency_key: str, fingerprint: str) -> tuple[IdempotencyClaim | None, dict | None]:
+    """
+    Claim `idempotency_key` for this request.
+
+    Returns (claim, None) when the caller should process the request and then
+    call claim.complete() or claim.release(); (None, response) when an earlier
+    request already produced `response`; and (None, None) when Redis is
+    unavailable.
+
+    Raises:
+        IdempotencyKeyReusedError: If the key was used with a different body
+        IdempotencyRequestInProgressError: If the original request is still
+            running after IDEMPOTENCY_WAIT_SECONDS
+    """
+    client = get_redis()
+    if client is None:
+        return None, None
+
+    key = _key(user_id, idempotency_key)
+    token = secrets.token_hex(8)
+    in_flight = json.dumps({"state": "in_flight", "fp": fingerprint, "token": token})
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    try:
+        while True:
+            if client.set(key, in_flight, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL_SECONDS):
+                return IdempotencyClaim(user_id, idempotency_key, fingerprint, token), None
+
+            raw = client.get(key)
+            if raw is None:
+                continue  # released or expired between SET and GET; try to claim again
+            record = json.loads(raw)
+            if record["fp"] != fingerprint:
+                raise IdempotencyKeyReusedError()
+            if record["state"] == "done":
+                logger.info(f"Replaying idempotent charge response for user {user_id}")
+                return None, record["response"]
+            if time.monotonic() >= deadline:
+                raise IdempotencyRequestInProgressError()
+            await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Idempotency store unavailable, falling back to database: {e}")
+        return None, None
+
+
+def acquire_many(user_id: int, fingerprints: dict[str, str]) -> tuple[dict[str, IdempotencyClaim], dict[str, dict], dict[str, Exception]]:
+    """
+    Claim every key of a batch, `fingerprints` mapping idempotency key to
+    request fingerprint, in two round trips: one pipelined SET NX for all of
+    them and one MGET for the keys already taken. Unlike `acquire` it never
+    waits; a key whose original request is still running is reported straight away.
+
+    Returns (claims, replays, errors) keyed by idempotency key: claims to
+    complete or release, responses of earlier requests, and
+    IdempotencyKeyReusedError / IdempotencyRequestInProgressError for keys
+    that cannot be used. All three are empty when Redis is unavailable.
+    """
+    client = get_redis()
+    if client is None or not fingerprints:
+        return {}, {}, {}
+
+    keys = list(fingerprints)
+    tokens = {key: secrets.token_hex(8) for key in keys}
+    claims: dict[str, IdempotencyClaim] = {}
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                in_flight = json.dumps({"state": "in_flight", "fp": fingerprints[key], "token": tokens[key]})
+                pipe.set(_key(user_id, key), in_flight, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL_SECONDS)
+            acquired = pipe.execute()
+        claims = {
+            key: IdempotencyClaim(user_id, key, fingerprints[key], tokens[key])
+            for key, ok in zip(keys, acquired) if ok
+        }
+        taken = [key for key in keys if key not in claims]
+        records = client.mget([_key(user_id, key) for key in taken]) if taken else []
+    except redis.RedisError as e:
+        logger.warning(f"Idempotency store unavailable, falling back to database: {e}")
+        for claim in claims.values():
+            claim.release()
+        return {}, {}, {}
+
+    replays, errors = {}, {}
+    for key, raw in zip(taken, records):
+        record = json.loads(raw) if raw is not None else None
+        if record is not None and record["fp"] != fingerprints[key]:
+            errors[key] = IdempotencyKeyReusedError()
+        elif record is not None and record["state"] == "done":
+            replays[key] = record["response"]
+        else:
+            # Still running, or released between SET and GET: the client retries either way.
+            errors[key] = IdempotencyRequestInProgressError()
+    return claims, replays, errors
+
+
+def complete_many(completed: list[tuple[IdempotencyClaim, dict]]) -> None:
+    """Store the responses of several claims in one pipelined round trip; see IdempotencyClaim.complete."""
+    client = get_redis()
+    if client is None or not completed:
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for claim, response in completed:
+                record = {"state": "done", "fp": claim.fingerprint, "response": response}
+                pipe.set(claim.key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+            pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to store idempotent responses: {e}")
@@ -0,0 +1,58 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Lists are ordered newest first by (created_at, id). Instead of an OFFSET,
+which makes the database walk and discard every row before the page, a page
+carries an opaque cursor naming the last row it returned, and the next page
+asks for rows strictly after it:
+
+    WHERE (created_at, id) < (:created_at, :id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit
+
+With a (filter columns..., created_at, id) index that is a range scan starting
+at the cursor, so page 10,000 costs the same as page 1. The id tiebreak keeps
+rows sharing a created_at from being skipped or repeated across pages.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from .exceptions import InvalidCursorError
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, object]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError() from e
+
+
+def keyset_page(query: Query, model, limit: int, cursor: str | None = None, skip: int = 0) -> tuple[list, str | None]:
+    """
+    Fetch one page of `query` newest first, after `cursor` when given.
+
+    `skip` is the legacy OFFSET, honoured only without a cursor. Returns the
+    rows and the cursor for the next page, or None on the last page.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    elif skip:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,179 @@
+"""
+Cache of authenticated principals for the auth dependencies in Oauth2.
+
+Entries are compact user + merchant snapshots keyed by a digest of the bearer
+token or API key. On a hit the snapshot is attached to the request session as
+already-loaded instances, so authentication and `current_user.merchant_info`
+cost no queries; columns that are not in the snapshot load lazily if touched.
+
+Invalidation hooks run immediately and again after the surrounding transaction
+commits, so a request racing the change cannot re-populate a stale entry.
+Other processes drop their in-process copy within PRINCIPAL_CACHE_LOCAL_TTL_SECONDS.
+"""
+import enum
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+import redis
+from sqlalchemy import DateTime, Enum as SAEnum, event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..models import db_models
+from .cache import TwoTierCache, get_redis
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+USER_FIELDS = ("id", "name", "email", "country", "is_active", "is_superadmin", "created_at")
+MERCHANT_FIELDS = (
+    "id", "merchant_id", "user_id", "account_status", "verification_status",
+    "kyc_status", "currency", "settlement_schedule", "settlement_delay_days",
+)
+
+_cache = TwoTierCache(
+    "principal",
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    local_ttl=settings.PRINCIPAL_CACHE_LOCAL_TTL_SECONDS,
+)
+_user_index: dict[int, set[str]] = {}
+_index_lock = threading.Lock()
+
+_PENDING_KEY = "principal_cache_invalidations"
+
+
+def jwt_cache_key(token: str) -> str:
+    return "jwt:" + hashlib.sha256(token.encode()).hexdigest()
+
+
+def api_key_cache_key(key_digest: str) -> str:
+    return "key:" + key_digest
+
+
+def _dump(obj, fields) -> dict:
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, enum.Enum):
+            value = value.value
+        data[field] = value
+    return data
+
+
+def _load(db: Session, model, data: dict):
+    columns = model.__table__.columns
+    values = {}
+    for field, value in data.items():
+        column_type = columns[field].type
+        if value is not None and isinstance(column_type, SAEnum):
+            value = column_type.enum_class(value)
+        elif value is not None and isinstance(column_type, DateTime):
+            value = datetime.fromisoformat(value)
+        values[field] = value
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return db.merge(instance, load=False)
+
+
+def get(key: str) -> dict | None:
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return None
+    snapshot = _cache.get(key)
+    if snapshot is None:
+        return None
+    expires_at = snapshot.get("exp")
+    if expires_at is not None and expires_at <= time.time():
+        _cache.delete(key)
+        return None
+    return snapshot
+
+
+def put(key: str, user: db_models.User, expires_at: float | None = None, **extra) -> None:
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return
+    ttl = settings.PRINCIPAL_CACHE_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(ttl, int(expires_at - time.time()))
+        if ttl <= 0:
+            return
+    merchant = user.merchant_info
+    snapshot = {
+        "user": _dump(user, USER_FIELDS),
+        "merchant": _dump(merchant, MERCHANT_FIELDS) if merchant else None,
+        "exp": expires_at,
+        **extra,
+    }
+    _cache.set(key, snapshot, ttl)
+    _index(user.id, key, ttl)
+
+
+def attach(db: Session, snapshot: dict) -> db_models.User:
+    """Turn a snapshot into a session-bound User without touching the database."""
+    user = _load(db, db_models.User, snapshot["user"])
+    merchant = None
+    if snapshot.get("merchant"):
+        merchant = _load(db, db_models.MerchantAccount, snapshot["merchant"])
+    set_committed_value(user, "merchant_info", merchant)
+    return user
+
+
+def _index(user_id: int, key: str, ttl: int) -> None:
+    with _index_lock:
+        _user_index.setdefault(user_id, set()).add(key)
+    client = get_redis()
+    if client is None:
+        return
+    index_key = f"principal:user:{user_id}"
+    try:
+        pipe = client.pipeline()
+        pipe.sadd(index_key, key)
+        pipe.expire(index_key, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to index principal cache key for user {user_id}: {e}")
+
+
+def invalidate_user(user_id: int) -> None:
+    with _index_lock:
+        keys = _user_index.pop(user_id, set())
+    client = get_redis()
+    if client is not None:
+        index_key = f"principal:user:{user_id}"
+        try:
+            keys |= set(client.smembers(index_key))
+            client.delete(index_key)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read principal cache index for user {user_id}: {e}")
+    _cache.delete(*keys)
+    logger.info(f"Invalidated {len(keys)} cached principals for user {user_id}")
+
+
+def invalidate_api_key(key_digest: str | None) -> None:
+    if key_digest:
+        _cache.delete(api_key_cache_key(key_digest))
+
+
+def invalidate_on_commit(db: Session, user_id: int | None = None, key_digest: str | None = None) -> None:
+    """Invalidate now and once more after `db` commits."""
+    if user_id is not None:
+        invalidate_user(user_id)
+    invalidate_api_key(key_digest)
+    db.info.setdefault(_PENDING_KEY, []).append((user_id, key_digest))
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_pending_invalidations(session: Session) -> None:
+    for user_id, key_digest in session.info.pop(_PENDING_KEY, []):
+        if user_id is not None:
+            invalidate_user(user_id)
+        invalidate_api_key(key_digest)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_invalidations(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,87 @@
+"""
+Row counts for paginated admin lists, estimated when exact counting is expensive.
+
+An exact COUNT(*) over charges or audit_logs reads the whole table (or the
+whole filtered range) on every list call. On PostgreSQL `count` asks the
+planner first:
+
+* an unfiltered query takes pg_class.reltuples, the table size as of the last
+  ANALYZE or autovacuum;
+* a filtered one takes the row estimate of `EXPLAIN` for the query.
+
+When the estimate is at least COUNT_ESTIMATE_THRESHOLD rows the estimate is
+returned and flagged as one; below it the filter is narrow enough that an
+exact count is cheap, and it is counted exactly. Other databases always count
+exactly. Results are cached for COUNT_CACHE_TTL_SECONDS per query signature
+(its SQL and parameters), so paging through a list counts it once.
+"""
+import hashlib
+import json
+
+from sqlalchemy import Table, text
+from sqlalchemy.orm import Query, Session
+
+from .cache import TwoTierCache
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_cache = TwoTierCache(
+    "row_counts",
+    ttl=settings.COUNT_CACHE_TTL_SECONDS,
+    local_ttl=settings.COUNT_CACHE_LOCAL_TTL_SECONDS,
+)
+
+
+def _signature(statement, dialect) -> str:
+    compiled = statement.compile(dialect=dialect)
+    raw = json.dumps([str(compiled), sorted(compiled.params.items())], default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _table_estimate(db: Session, table_name: str) -> int | None:
+    """pg_class.reltuples, or None if the table has never been analyzed."""
+    reltuples = db.execute(
+        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"), {"name": table_name}
+    ).scalar()
+    if reltuples is None or reltuples < 0:
+        return None
+    return int(reltuples)
+
+
+def _plan_estimate(db: Session, statement) -> int:
+    compiled = statement.compile(dialect=db.get_bind().dialect)
+    [plan] = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return int(plan["Plan"]["Plan Rows"])
+
+
+def estimate(db: Session, query: Query) -> int | None:
+    """The planner's row estimate for `query`, or None when the database has no planner estimates."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    statement = query.enable_eagerloads(False).order_by(None).statement
+    froms = statement.get_final_froms()
+    if statement.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table):
+        rows = _table_estimate(db, froms[0].name)
+        if rows is not None:
+            return rows
+    return _plan_estimate(db, statement)
+
+
+def count(db: Session, query: Query) -> tuple[int, bool]:
+    """Return (row count of `query`, whether it is an estimate)."""
+    query = query.enable_eagerloads(False).order_by(None)
+    key = _signature(query.statement, db.get_bind().dialect)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1]
+
+    rows = estimate(db, query)
+    if rows is not None and rows >= settings.COUNT_ESTIMATE_THRESHOLD:
+        result = [rows, True]
+    else:
+        result = [query.count(), False]
+    _cache.set(key, result)
+    logger.debug(f"Counted {result[0]} rows (estimate={result[1]})")
+    return result[0], result[1]
@@ -1,8 +1,55 @@
+import hashlib
+import hmac
+import secrets
+
 from passlib.context import CryptContext
+
+from .config import settings
+
 pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+API_KEY_LOOKUP_ID_BYTES = 8
+
+
+def generate_api_key(prefix: str) -> tuple[str, str]:
+    """Build a raw API key of the form ``<prefix><lookup_id>_<secret>``.
+
+    The lookup id is hex so it never contains the ``_`` separator and can be
+    parsed back out of the raw key to find the row with one indexed query.
+    """
+    lookup_id = secrets.token_hex(API_KEY_LOOKUP_ID_BYTES)
+    raw_key = f"{prefix}{lookup_id}_{secrets.token_urlsafe(32)}"
+    return lookup_id, raw_key
+
+
+def parse_api_key_lookup_id(raw_key: str) -> str | None:
+    """Return the lookup id segment of a raw key, or None for legacy keys."""
+    parts = raw_key.split("_", 3)
+    if len(parts) != 4:
+        return None
+    lookup_id = parts[2]
+    if len(lookup_id) != API_KEY_LOOKUP_ID_BYTES * 2:
+        return None
+    try:
+        int(lookup_id, 16)
+    except ValueError:
+        return None
+    return lookup_id
+
+
+def api_key_digest(raw_key: str) -> str:
+    """Keyed SHA-256 digest of a raw API key, cheap enough for every request."""
+    return hmac.new(settings.SECRET_KEY.encode(), raw_key.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_api_key_digest(raw_key: str, digest: str | None) -> bool:
+    if not digest:
+        return False
+    return hmac.compare_digest(api_key_digest(raw_key), digest)
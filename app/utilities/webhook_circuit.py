@@ -0,0 +1,181 @@
+"""
+Per-endpoint circuit breaker and health score for webhook delivery.
+
+Every delivery outcome updates an exponentially weighted failure rate and
+latency for its WebhookEndpoint. When the failure rate reaches
+WEBHOOK_CIRCUIT_FAILURE_THRESHOLD (after WEBHOOK_CIRCUIT_MIN_SAMPLES outcomes)
+the circuit opens: senders park the endpoint's deliveries until
+`open_until` instead of spending a worker on a request that will time out.
+Once that passes the circuit is half-open and exactly one probe delivery is
+let through; success closes the circuit, failure re-opens it for twice as
+long, up to WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS.
+
+While closed, the health score (success rate, scaled down further when the
+endpoint is slower than WEBHOOK_CIRCUIT_SLOW_MS) scales the endpoint's share
+of delivery concurrency, so a struggling merchant gets fewer slots.
+
+State lives in Redis so every worker and the delivery engine share it; without
+Redis each process keeps its own.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import redis
+
+from .cache import get_redis
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_EWMA_ALPHA = 0.2
+_FIELDS = ("state", "failure_rate", "latency_ms", "samples", "open_until", "open_seconds")
+
+_lock = threading.Lock()
+_local: dict[int, dict] = {}
+_local_probes: dict[int, float] = {}
+
+# Indirection so tests can move the clock.
+_clock = time.time
+
+
+def _key(endpoint_id: int) -> str:
+    return f"webhook_circuit:{endpoint_id}"
+
+
+def _parse(raw: dict) -> dict:
+    state = {"state": raw.get("state") or "closed"}
+    for field in ("failure_rate", "latency_ms", "open_until", "open_seconds"):
+        state[field] = float(raw.get(field) or 0)
+    state["samples"] = int(float(raw.get("samples") or 0))
+    return state
+
+
+def _load(endpoint_ids) -> dict[int, dict]:
+    endpoint_ids = list(endpoint_ids)
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for endpoint_id in endpoint_ids:
+                pipe.hgetall(_key(endpoint_id))
+            return {endpoint_id: _parse(raw) for endpoint_id, raw in zip(endpoint_ids, pipe.execute())}
+        except redis.RedisError as e:
+            logger.warning(f"Circuit state unavailable in Redis, using local state: {e}")
+    with _lock:
+        return {endpoint_id: _parse(_local.get(endpoint_id, {})) for endpoint_id in endpoint_ids}
+
+
+def _save(states: dict[int, dict]) -> None:
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for endpoint_id, state in states.items():
+                pipe.hset(_key(endpoint_id), mapping={field: state[field] for field in _FIELDS})
+                pipe.expire(_key(endpoint_id), max(int(settings.WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS) * 4, 3600))
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store circuit state in Redis: {e}")
+    with _lock:
+        _local.update({endpoint_id: dict(state) for endpoint_id, state in states.items()})
+
+
+def _claim_probe(endpoint_id: int, now: float) -> bool:
+    """Let exactly one sender probe a half-open endpoint per probe window."""
+    ttl = max(int(settings.WEBHOOK_TIMEOUT_SECONDS * 2), 1)
+    client = get_redis()
+    if client is not None:
+        try:
+            return bool(client.set(f"{_key(endpoint_id)}:probe", 1, nx=True, ex=ttl))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to claim circuit probe in Redis: {e}")
+    with _lock:
+        if _local_probes.get(endpoint_id, 0) > now:
+            return False
+        _local_probes[endpoint_id] = now + ttl
+        return True
+
+
+def _release_probe(endpoint_id: int) -> None:
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(f"{_key(endpoint_id)}:probe")
+            return
+        except redis.RedisError:
+            pass
+    with _lock:
+        _local_probes.pop(endpoint_id, None)
+
+
+def health(state: dict) -> float:
+    if state["state"] == "open":
+        return 0.0
+    score = 1.0 - state["failure_rate"]
+    if state["latency_ms"] > settings.WEBHOOK_CIRCUIT_SLOW_MS:
+        score *= settings.WEBHOOK_CIRCUIT_SLOW_MS / state["latency_ms"]
+    return max(score, 0.0)
+
+
+def admit(endpoint_ids, base_concurrency: int) -> dict[int, tuple[int, datetime | None]]:
+    """
+    How many concurrent deliveries each endpoint may have right now.
+
+    Returns endpoint_id -> (limit, retry_at). A limit of 0 means the circuit is
+    open (or half-open with its probe already taken) and deliveries should be
+    parked until retry_at; a half-open endpoint whose probe this call claimed
+    gets a limit of 1.
+    """
+    now = _clock()
+    admitted = {}
+    for endpoint_id, state in _load(set(endpoint_ids)).items():
+        if state["state"] != "open":
+            admitted[endpoint_id] = (max(1, round(base_concurrency * health(state))), None)
+        elif now < state["open_until"]:
+            admitted[endpoint_id] = (0, datetime.fromtimestamp(state["open_until"], timezone.utc))
+        elif _claim_probe(endpoint_id, now):
+            admitted[endpoint_id] = (1, None)
+        else:
+            admitted[endpoint_id] = (0, datetime.fromtimestamp(now + settings.WEBHOOK_TIMEOUT_SECONDS, timezone.utc))
+    return admitted
+
+
+def record(outcomes) -> None:
+    """Feed delivery outcomes, an iterable of (endpoint_id, success, latency_ms), into the breakers."""
+    by_endpoint = defaultdict(list)
+    for endpoint_id, success, latency_ms in outcomes:
+        by_endpoint[endpoint_id].append((success, latency_ms))
+    if not by_endpoint:
+        return
+
+    now = _clock()
+    states = _load(by_endpoint.keys())
+    for endpoint_id, results in by_endpoint.items():
+        state = states[endpoint_id]
+        for success, latency_ms in results:
+            if state["state"] == "open":
+                # The half-open probe (or a request started before the circuit opened).
+                if success:
+                    logger.info(f"Webhook endpoint {endpoint_id} circuit closed")
+                    state.update(state="closed", failure_rate=0.0, samples=0, open_until=0.0, open_seconds=0.0)
+                elif now >= state["open_until"]:
+                    state["open_seconds"] = min(state["open_seconds"] * 2, settings.WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS)
+                    state["open_until"] = now + state["open_seconds"]
+                _release_probe(endpoint_id)
+                continue
+
+            state["samples"] += 1
+            state["failure_rate"] += _EWMA_ALPHA * ((0.0 if success else 1.0) - state["failure_rate"])
+            if latency_ms is not None:
+                state["latency_ms"] = latency_ms if state["samples"] == 1 else (
+                    state["latency_ms"] + _EWMA_ALPHA * (latency_ms - state["latency_ms"])
+                )
+            if state["samples"] >= settings.WEBHOOK_CIRCUIT_MIN_SAMPLES and state["failure_rate"] >= settings.WEBHOOK_CIRCUIT_FAILURE_THRESHOLD:
+                state.update(state="open", open_seconds=float(settings.WEBHOOK_CIRCUIT_OPEN_SECONDS))
+                state["open_until"] = now + state["open_seconds"]
+                logger.warning(f"Webhook endpoint {endpoint_id} circuit opened, failure rate {state['failure_rate']:.2f}")
+    _save(states)
@@ -0,0 +1,89 @@
+"""
+Cached index of which webhook endpoints each merchant has subscribed to which events.
+
+Event fan-out (charges, payouts, settlement) asks `subscribers` for the
+endpoints that want an event instead of querying webhook_endpoints every time,
+and only writes deliveries for those. Entries hold a merchant's enabled
+endpoints with their event filters; merchants without endpoints are cached
+too, so the common case of no webhooks costs no query at all.
+
+An endpoint's `events` is "*" (everything), or a comma separated or JSON list
+of event names, where "charge.*" matches every charge event. WebhookService
+invalidates a merchant's entry whenever one of its endpoints changes; other
+processes drop their in-process copy within
+WEBHOOK_SUBSCRIPTION_CACHE_LOCAL_TTL_SECONDS.
+"""
+import json
+
+from sqlalchemy.orm import Session
+
+from ..models import db_models
+from .cache import TwoTierCache
+from .config import settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_cache = TwoTierCache(
+    "webhook_subs",
+    ttl=settings.WEBHOOK_SUBSCRIPTION_CACHE_TTL_SECONDS,
+    local_ttl=settings.WEBHOOK_SUBSCRIPTION_CACHE_LOCAL_TTL_SECONDS,
+)
+
+
+def parse_events(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                value = value.strip("[]").split(",")
+        else:
+            value = value.split(",")
+    return [str(event).strip().strip("'\"") for event in value if str(event).strip()]
+
+
+def matches(patterns: list[str], event: str) -> bool:
+    for pattern in patterns:
+        if pattern == "*" or pattern == event:
+            return True
+        if pattern.endswith(".*") and event.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+def _load(db: Session, merchant_ids: list[str]) -> dict[str, list]:
+    endpoint = db_models.WebhookEndpoint
+    entries: dict[str, list] = {merchant_id: [] for merchant_id in merchant_ids}
+    rows = db.query(endpoint.id, endpoint.merchant_id, endpoint.events).filter(
+        endpoint.merchant_id.in_(merchant_ids), endpoint.enabled == True
+    ).order_by(endpoint.id).all()
+    for endpoint_id, merchant_id, events in rows:
+        entries[merchant_id].append([endpoint_id, parse_events(events)])
+    return entries
+
+
+def subscribers(db: Session, merchant_ids, event: str) -> dict[str, list[int]]:
+    """Map each merchant with at least one endpoint subscribed to `event` to those endpoint ids."""
+    merchant_ids = list(dict.fromkeys(merchant_ids))
+    entries = _cache.get_many(merchant_ids)
+    missing = [merchant_id for merchant_id in merchant_ids if merchant_id not in entries]
+    if missing:
+        loaded = _load(db, missing)
+        _cache.set_many(loaded)
+        entries.update(loaded)
+
+    subscribed = {}
+    for merchant_id, endpoints in entries.items():
+        endpoint_ids = [endpoint_id for endpoint_id, patterns in endpoints if matches(patterns, event)]
+        if endpoint_ids:
+            subscribed[merchant_id] = endpoint_ids
+    return subscribed
+
+
+def invalidate(merchant_id: str) -> None:
+    _cache.delete(merchant_id)
+    logger.debug(f"Invalidated webhook subscriptions for merchant {merchant_id}")
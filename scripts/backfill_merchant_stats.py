@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Usage:
+  python scripts/backfill_merchant_stats.py --start 2025-01-01                   # through today
+  python scripts/backfill_merchant_stats.py --start 2025-01-01 --end 2025-06-30
+
+Rebuilds merchant_daily_stats for the given days from the ledger and the
+charges table, one month per transaction. Run it once after migration
+d4b7e2a91c53 to cover the entries it marked as rolled up, or to repair a
+range; the periodic rollup then keeps the table current.
+"""
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+from app.utilities.db_con import SessionLocal
+from app.services.merchant_stats_service import MerchantStatsService
+from app.services.partition_service import add_months
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start', type=date.fromisoformat, required=True, help='First day (YYYY-MM-DD)')
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help='Last day (default: today, UTC)')
+    args = parser.parse_args()
+    end = args.end or datetime.now(timezone.utc).date()
+    if args.start > end:
+        parser.error("--start must not be after --end")
+
+    total = 0
+    chunk_start = args.start
+    while chunk_start <= end:
+        chunk_end = min(add_months(chunk_start.replace(day=1), 1) - timedelta(days=1), end)
+        db = SessionLocal()
+        try:
+            rows = MerchantStatsService.backfill(db, chunk_start, chunk_end)
+        finally:
+            db.close()
+        print(f"{chunk_start}..{chunk_end}: {rows} rows")
+        total += rows
+        chunk_start = chunk_end + timedelta(days=1)
+    print(f"\nBackfilled {total} merchant-day rows.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Measure API key authentication latency as the number of stored keys grows.
+
+Usage:
+  python scripts/bench_api_key_auth.py                     # 10, 100, 1k, 10k, 100k keys
+  python scripts/bench_api_key_auth.py --sizes 10 1000     # custom sizes
+  python scripts/bench_api_key_auth.py --iterations 500
+
+Runs against an in-memory SQLite database, so the numbers show how the lookup
+scales rather than absolute production latency.
+"""
+import argparse
+import logging
+import statistics
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import db_models
+from app.utilities.db_con import Base
+from app.utilities.Oauth2 import get_user_from_api_key
+from app.utilities.utils import generate_api_key, api_key_digest, hash_password
+
+
+def seed(db, key_count: int) -> str:
+    user = db_models.User(name="Bench", email="bench@example.com", password="x", country="NG")
+    db.add(user)
+    db.flush()
+    merchant = db_models.MerchantAccount(merchant_id="merch_bench", user_id=user.id, currency="NGN")
+    db.add(merchant)
+    db.flush()
+
+    rows = []
+    for i in range(key_count - 1):
+        lookup_id, raw_key = generate_api_key("sk_test_")
+        rows.append({
+            "merchant_id": merchant.merchant_id,
+            "name": f"key {i}",
+            "api_key": f"unused-hash-{i}",
+            "key_prefix": "sk_test_",
+            "lookup_id": lookup_id,
+            "key_digest": api_key_digest(raw_key),
+            "key_type": "secret",
+            "environment": "test",
+            "is_active": True,
+        })
+    if rows:
+        db.execute(insert(db_models.APIKey), rows)
+
+    lookup_id, raw_key = generate_api_key("sk_test_")
+    db.add(db_models.APIKey(
+        merchant_id=merchant.merchant_id,
+        name="target",
+        api_key=hash_password(raw_key),
+        key_prefix="sk_test_",
+        lookup_id=lookup_id,
+        key_digest=api_key_digest(raw_key),
+        key_type="secret",
+        environment="test",
+        is_active=True,
+    ))
+    db.commit()
+    return raw_key
+
+
+def run(key_count: int, iterations: int) -> list[float]:
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        raw_key = seed(db, key_count)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            get_user_from_api_key(raw_key, db)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1_000, 10_000, 100_000])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{'keys':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for size in args.sizes:
+        timings = sorted(run(size, args.iterations))
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>8} {statistics.median(timings):>8.3f} {p95:>8.3f} {timings[-1]:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
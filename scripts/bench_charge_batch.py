@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Compare charge creation throughput: one request per charge vs POST /v1/charges/batch.
+
+Usage:
+  python scripts/bench_charge_batch.py                    # 1000 charges, batches of 100
+  python scripts/bench_charge_batch.py --charges 5000 --batch-size 500
+
+Runs the service layer against an in-memory SQLite database and publishes tasks
+to Celery's in-memory broker, so it measures the API-side cost (queries,
+commits, task publishing) and not charge processing in the workers.
+"""
+import argparse
+import logging
+import os
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+os.environ["CELERY_TASK_ALWAYS_EAGER"] = "false"
+
+from app.celery_worker import celery_app
+from app.models import db_models
+from app.schemas.charges import ChargeCreate
+from app.services.payment_service import ChargeService
+from app.utilities.db_con import Base
+
+
+def make_items(count: int) -> list[ChargeCreate]:
+    return [
+        ChargeCreate(
+            amount=Decimal("12.50"),
+            currency="NGN",
+            description=f"invoice {i}",
+            idempotency_key=f"inv_{uuid.uuid4().hex}",
+        )
+        for i in range(count)
+    ]
+
+
+def setup():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    user = db_models.User(name="Bench", email="bench@example.com", password="x", country="NG")
+    db.add(user)
+    db.commit()
+    return engine, db, user
+
+
+def bench_single(count: int) -> float:
+    engine, db, user = setup()
+    items = make_items(count)
+    start = time.perf_counter()
+    for item in items:
+        ChargeService.create_charge(db=db, user=user, charge_data=item)
+    elapsed = time.perf_counter() - start
+    db.close()
+    engine.dispose()
+    return elapsed
+
+
+def bench_batch(count: int, batch_size: int) -> float:
+    engine, db, user = setup()
+    items = make_items(count)
+    start = time.perf_counter()
+    for i in range(0, count, batch_size):
+        ChargeService.create_charges_batch(db=db, user=user, charges=items[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    db.close()
+    engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--charges', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    celery_app.conf.update(broker_url="memory://", result_backend="cache+memory://")
+
+    single = bench_single(args.charges)
+    batch = bench_batch(args.charges, args.batch_size)
+    print(f"{'path':>10} {'seconds':>9} {'charges/s':>10}")
+    print(f"{'single':>10} {single:>9.3f} {args.charges / single:>10.0f}")
+    print(f"{'batch':>10} {batch:>9.3f} {args.charges / batch:>10.0f}")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
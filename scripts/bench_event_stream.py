@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Hold many concurrent merchant event streams open and measure fan-out.
+
+Usage:
+  python scripts/bench_event_stream.py                              # 10k streams, in-memory fakeredis
+  python scripts/bench_event_stream.py --streams 10000 --merchants 1000 --events 200
+  python scripts/bench_event_stream.py --redis-url redis://localhost:6379/15 --slow-fraction 0.05
+
+Opens --streams EventHub streams spread over --merchants merchants in this
+process, the way one API worker holds its SSE connections, then publishes
+--events events to random merchants in batches of --batch every --interval-ms.
+Reports how long opening the streams took, the publish-to-delivery latency
+(p50/p99) seen by the consumers, resident memory, and whether every consumer
+received every event for its merchant in order. --slow-fraction of the
+consumers sleep --slow-ms after every frame, so their queues overflow and
+they have to catch up from the Redis stream instead of losing events.
+
+Without --redis-url the run uses fakeredis, which measures the hub rather than
+Redis itself; with it, the URL's database receives merchant_events:* keys.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import statistics
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from app.utilities import cache, event_stream
+from app.utilities.config import settings
+
+
+async def consume(hub, merchant_id: str, received: list, ready: asyncio.Event, slow_ms: float) -> None:
+    frames = hub.stream(merchant_id)
+    await frames.__anext__()  # retry: frame, sent once the stream is subscribed
+    ready.set()
+    async for frame in frames:
+        if not frame.startswith("id: "):
+            continue
+        data = json.loads(frame.split("data: ", 1)[1])
+        received.append((data["seq"], time.time() - data["sent"]))
+        if slow_ms:
+            await asyncio.sleep(slow_ms / 1000)
+
+
+async def run(args, async_client) -> None:
+    hub = event_stream.EventHub(async_client)
+    merchants = [f"merch_bench_{i}" for i in range(args.merchants)]
+    rng = random.Random(7)
+    consumers = []
+    started = time.perf_counter()
+    for i in range(args.streams):
+        merchant_id = merchants[i % len(merchants)]
+        slow = rng.random() < args.slow_fraction
+        received, ready = [], asyncio.Event()
+        task = asyncio.create_task(consume(hub, merchant_id, received, ready, args.slow_ms if slow else 0))
+        consumers.append((merchant_id, slow, received, ready, task))
+    await asyncio.gather(*(ready.wait() for _, _, _, ready, _ in consumers))
+    connect_seconds = time.perf_counter() - started
+    print(f"opened {hub.connections} streams in {connect_seconds:.2f}s")
+
+    expected: dict[str, list[int]] = {merchant_id: [] for merchant_id in merchants}
+    for seq in range(0, args.events, args.batch):
+        batch = []
+        for n in range(seq, min(seq + args.batch, args.events)):
+            merchant_id = rng.choice(merchants)
+            expected[merchant_id].append(n)
+            batch.append((merchant_id, "charge.updated", {"seq": n, "sent": time.time()}))
+        event_stream.publish(batch)
+        await asyncio.sleep(args.interval_ms / 1000)
+
+    deadline = time.monotonic() + args.drain_seconds
+    while time.monotonic() < deadline:
+        if all(len(received) >= len(expected[merchant_id]) for merchant_id, _, received, _, _ in consumers):
+            break
+        await asyncio.sleep(0.1)
+    for *_, task in consumers:
+        task.cancel()
+    await asyncio.gather(*(task for *_, task in consumers), return_exceptions=True)
+    hub._reader.cancel()
+
+    for label, want_slow in (("fast", False), ("slow", True)):
+        group = [c for c in consumers if c[1] == want_slow]
+        if not group:
+            continue
+        latencies = sorted(latency * 1000 for _, _, received, _, _ in group for _, latency in received)
+        complete = sum(1 for merchant_id, _, received, _, _ in group if [seq for seq, _ in received] == expected[merchant_id])
+        p50 = statistics.median(latencies) if latencies else 0.0
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+        print(f"{label:>5} consumers={len(group):>6} complete={complete:>6} frames={len(latencies):>8} "
+              f"p50={p50:>8.1f}ms p99={p99:>8.1f}ms")
+    print(f"max rss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, default=10000)
+    parser.add_argument('--merchants', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--interval-ms', type=float, default=10.0)
+    parser.add_argument('--slow-fraction', type=float, default=0.01)
+    parser.add_argument('--slow-ms', type=float, default=50.0)
+    parser.add_argument('--queue-size', type=int, default=settings.EVENT_STREAM_QUEUE_SIZE)
+    parser.add_argument('--drain-seconds', type=float, default=60.0)
+    parser.add_argument('--redis-url')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    settings.EVENT_STREAM_QUEUE_SIZE = args.queue_size
+    if args.redis_url:
+        settings.REDIS_URL = args.redis_url
+        sync_client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        async_client = aioredis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        settings.REDIS_URL = "redis://fakeredis"
+        sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        async_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    cache.set_redis(sync_client)
+    print(f"streams={args.streams} merchants={args.merchants} events={args.events} "
+          f"slow_fraction={args.slow_fraction} queue_size={args.queue_size}")
+    asyncio.run(run(args, async_client))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Usage:
+  python scripts/recalculate_balances.py --merchant-id merch_abc            # dry run: report drift
+  python scripts/recalculate_balances.py --merchant-id merch_abc --apply    # correct it
+  python scripts/recalculate_balances.py --all-merchants                    # dry run over every merchant
+  python scripts/recalculate_balances.py --all-merchants --apply --chunk-size 500
+
+Balances are recomputed in the database from materialized ledger entries;
+only the accounts that drifted are returned, so a run over every merchant
+never loads ledger rows into Python. --all-merchants takes one transaction per
+chunk of merchants and prints drift as each chunk finishes.
+"""
+import argparse
+
+from app.utilities.db_con import SessionLocal
+from app.services.balance_service import BalanceService
+
+
+def print_drift(row):
+    print(
+        f"- merchant={row['merchant_id']} account={row['account_id']} type={row['account_type'].value} "
+        f"stored={row['stored']} mirrored={row['mirrored']} ledger={row['recomputed']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--merchant-id', help='Recalculate a single merchant')
+    target.add_argument('--all-merchants', action='store_true', help='Recalculate every merchant, in chunks')
+    parser.add_argument('--apply', action='store_true', help='Write the recomputed balances (default: report only)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Merchants per transaction with --all-merchants')
+    args = parser.parse_args()
+
+    if args.merchant_id:
+        db = SessionLocal()
+        try:
+            drift = BalanceService.recalculate_merchant_balance(db, args.merchant_id, apply=args.apply)
+        finally:
+            db.close()
+    else:
+        drift = BalanceService.recalculate_all(SessionLocal, apply=args.apply, chunk_size=args.chunk_size)
+
+    drifted = 0
+    for row in drift:
+        print_drift(row)
+        drifted += 1
+
+    if not drifted:
+        print("No balance drift found.")
+    elif args.apply:
+        print(f"\nCorrected {drifted} drifted accounts.")
+    else:
+        print(f"\nFound {drifted} drifted accounts. Dry-run only. Use --apply to correct them.")
+
+
+if __name__ == '__main__':
+    main()
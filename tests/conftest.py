@@ -4,6 +4,7 @@ os.environ.setdefault("CELERY_TASK_ALWAYS_EAGER", "true")
 import uuid
 from decimal import Decimal
 
+import fakeredis
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -43,6 +44,21 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Route the shared Redis client (app.utilities.cache) to an in-memory fakeredis."""
+    from app.utilities import cache
+    from app.utilities.config import settings
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://fakeredis")
+    cache.set_redis(client)
+    try:
+        yield client
+    finally:
+        cache.set_redis(None)
+
+
 @pytest.fixture
 def test_user(db_session):
     user = db_models.User(
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.utilities import cache, event_stream
+from app.utilities.config import settings
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://fakeredis")
+    cache.set_redis(fakeredis.FakeRedis(server=server, decode_responses=True))
+    try:
+        yield server
+    finally:
+        cache.set_redis(None)
+
+
+def _frame_id(frame: str) -> str:
+    return frame.split("\n")[0].removeprefix("id: ")
+
+
+async def _take(frames, count: int) -> list[str]:
+    return [await asyncio.wait_for(frames.__anext__(), timeout=2) for _ in range(count)]
+
+
+def test_stream_delivers_live_events_resumes_and_catches_up_when_lagging(redis_server, monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_STREAM_QUEUE_SIZE", 2)
+
+    async def scenario():
+        hub = event_stream.EventHub(fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True))
+        try:
+            frames = hub.stream("M1")
+            assert (await _take(frames, 1))[0].startswith("retry:")
+            event_stream.publish([("M1", "charge.updated", {"charge_id": "c1"}), ("M2", "charge.updated", {"charge_id": "other"})])
+            [frame] = await _take(frames, 1)
+            assert "event: charge.updated" in frame and '"c1"' in frame
+            await frames.aclose()
+            assert hub.connections == 0
+
+            # Reconnecting with Last-Event-ID replays what was missed while away.
+            event_stream.publish([("M1", "payout.updated", {"n": n}) for n in range(3)])
+            resumed = hub.stream("M1", last_event_id=_frame_id(frame))
+            replayed = (await _take(resumed, 4))[1:]
+            assert [f'"n": {n}' in f for n, f in enumerate(replayed)] == [True] * 3
+
+            # A consumer that stops reading overflows its queue and catches up from the stream.
+            for n in range(3, 10):
+                event_stream.publish([("M1", "payout.updated", {"n": n})])
+            await asyncio.sleep(0.05)
+            caught_up = await _take(resumed, 7)
+            assert [f'"n": {n}' in f for n, f in zip(range(3, 10), caught_up)] == [True] * 7
+            ids = [_frame_id(f) for f in replayed + caught_up]
+            assert ids == sorted(ids, key=event_stream._entry_key) and len(set(ids)) == 10
+            await resumed.aclose()
+        finally:
+            hub._reader.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_events_are_published_only_when_the_transaction_commits(redis_server, db_session):
+    client = cache.get_redis()
+    db_session.execute(text("SELECT 1"))
+    event_stream.publish_on_commit(db_session, "M1", "charge.updated", {"charge_id": "c1"})
+    db_session.rollback()
+    db_session.commit()
+    assert client.xlen(event_stream.stream_key("M1")) == 0
+
+    event_stream.publish_on_commit(db_session, "M1", "charge.updated", {"charge_id": "c2"})
+    db_session.commit()
+    [(_, fields)] = client.xrange(event_stream.stream_key("M1"))
+    assert fields["event"] == "charge.updated" and '"c2"' in fields["data"]
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.models.db_models import Charge
+from app.schemas import merchant as mer_schema
+from app.routers import charges as charges_router
+from app.schemas.charges import ChargeBatchCreate, ChargeCreate
+from app.services.merchant_service import MerchantService
+from app.services.payment_service import ChargeService
+from app.utilities import idempotency
+from app.utilities.config import settings
+from app.utilities.exceptions import IdempotencyKeyReusedError, IdempotencyRequestInProgressError
+
+
+def make_charge(amount="25.00", key="order-1"):
+    return ChargeCreate(amount=Decimal(amount), currency="NGN", description="Order 1", idempotency_key=key)
+
+
+def test_retry_replays_stored_response(fake_redis):
+    fp = idempotency.request_fingerprint(make_charge())
+    claim, replay = asyncio.run(idempotency.acquire(1, "order-1", fp))
+    assert claim is not None and replay is None
+    claim.complete({"id": "ch_123", "status": "succeeded"})
+
+    claim, replay = asyncio.run(idempotency.acquire(1, "order-1", fp))
+    assert claim is None
+    assert replay == {"id": "ch_123", "status": "succeeded"}
+
+
+def test_concurrent_retry_waits_then_gives_up(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    fp = idempotency.request_fingerprint(make_charge())
+    claim, _ = asyncio.run(idempotency.acquire(1, "order-1", fp))
+
+    with pytest.raises(IdempotencyRequestInProgressError):
+        asyncio.run(idempotency.acquire(1, "order-1", fp))
+
+    claim.release()
+    retry, replay = asyncio.run(idempotency.acquire(1, "order-1", fp))
+    assert retry is not None and replay is None
+
+
+def test_reused_key_with_different_body_is_rejected(fake_redis):
+    claim, _ = asyncio.run(idempotency.acquire(1, "order-1", idempotency.request_fingerprint(make_charge())))
+    claim.complete({"id": "ch_123"})
+
+    with pytest.raises(IdempotencyKeyReusedError):
+        asyncio.run(idempotency.acquire(1, "order-1", idempotency.request_fingerprint(make_charge(amount="99.00"))))
+    claim, _ = asyncio.run(idempotency.acquire(2, "order-1", idempotency.request_fingerprint(make_charge(amount="99.00"))))
+    assert claim is not None
+
+
+def test_database_fallback_rejects_mismatched_retry(db_session, test_user):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    original = ChargeService.create_charge(db=db_session, user=test_user, charge_data=make_charge())
+
+    assert ChargeService.create_charge(db=db_session, user=test_user, charge_data=make_charge()).id == original.id
+    with pytest.raises(IdempotencyKeyReusedError):
+        ChargeService.create_charge(db=db_session, user=test_user, charge_data=make_charge(amount="30.00"))
+    assert db_session.query(Charge).filter_by(user_id=test_user.id).count() == 1
+
+
+def test_batch_rejects_reused_keys_with_different_parameters(db_session, test_user):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    original = ChargeService.create_charge(db=db_session, user=test_user, charge_data=make_charge())
+
+    results = ChargeService.create_charges_batch(db=db_session, user=test_user, charges=[
+        make_charge(amount="30.00"),
+        make_charge(key="order-2"),
+        make_charge(amount="40.00", key="order-2"),
+        make_charge(),
+    ])
+    assert [r["status"] for r in results] == ["rejected", "created", "rejected", "duplicate"]
+    assert results[0]["charge"] is None and results[0]["error"] == str(IdempotencyKeyReusedError())
+    assert results[3]["charge"].id == original.id
+    assert db_session.query(Charge).filter_by(user_id=test_user.id).count() == 2
+
+
+def test_batch_endpoint_uses_the_idempotency_store(db_session, test_user, fake_redis):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    db_session.refresh(test_user)
+    request = Request({"type": "http", "method": "POST", "headers": [], "client": ("testclient", 0)})
+
+    def submit(*charges):
+        batch = ChargeBatchCreate(charges=list(charges))
+        return asyncio.run(charges_router.create_charge_batch(batch=batch, request=request, db=db_session, current_user=test_user))
+
+    first = submit(make_charge(), make_charge(key="order-2"))
+    assert (first["created"], first["duplicates"], first["rejected"]) == (2, 0, 0)
+
+    # Both keys replay from Redis; the mismatched body is rejected by the store.
+    retry = submit(make_charge(key="order-2"), make_charge(amount="99.00"), make_charge(key="order-3"))
+    assert [r["status"] for r in retry["results"]] == ["duplicate", "rejected", "created"]
+    assert retry["results"][0]["charge"]["id"] == first["results"][1]["charge"].id
+    assert db_session.query(Charge).filter_by(user_id=test_user.id).count() == 3
+
+
+def test_batch_claims_do_not_wait_and_are_released_on_failure(db_session, test_user, fake_redis, monkeypatch):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    db_session.refresh(test_user)
+    request = Request({"type": "http", "method": "POST", "headers": [], "client": ("testclient", 0)})
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 60)
+    in_flight, _ = asyncio.run(idempotency.acquire(test_user.id, "order-1", idempotency.request_fingerprint(make_charge())))
+
+    def submit(*charges):
+        batch = ChargeBatchCreate(charges=list(charges))
+        return asyncio.run(charges_router.create_charge_batch(batch=batch, request=request, db=db_session, current_user=test_user))
+
+    started = time.monotonic()
+    result = submit(make_charge(), make_charge(key="order-2"))
+    assert time.monotonic() - started < 5
+    assert [(r["status"], r["error"]) for r in result["results"]] == [
+        ("rejected", str(IdempotencyRequestInProgressError())), ("created", None),
+    ]
+    in_flight.release()
+
+    def fail(**kwargs):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(ChargeService, "create_charges_batch", fail)
+    with pytest.raises(HTTPException):
+        submit(make_charge(key="order-3"), make_charge(key="order-4"))
+    # The claims taken for the failed batch were released, so a retry can claim them.
+    claims, replays, errors = idempotency.acquire_many(test_user.id, {
+        key: idempotency.request_fingerprint(make_charge(key=key)) for key in ("order-3", "order-4")
+    })
+    assert (sorted(claims), replays, errors) == (["order-3", "order-4"], {}, {})
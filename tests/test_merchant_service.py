@@ -1,10 +1,20 @@
+from datetime import datetime, timedelta
 from decimal import Decimal
 import pytest
-from sqlalchemy.orm import Session
+import redis
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, sessionmaker
+from app.services.admin_service import AdminService
+from app.services.merchant_search_service import MerchantSearchService
 from app.services.merchant_service import MerchantService
+from app.routers import merchant as merchant_router
 from app.schemas import merchant as mer_schema
 from app.models import db_models
 from app.utilities.exceptions import DatabaseError
+from app.utilities import api_key_usage
+from app.utilities import Oauth2 as oauth2
+from app.utilities.Oauth2 import find_api_key, get_user_from_api_key
+from app.utilities.utils import hash_password, api_key_digest
 
 
 def test_create_merchant_account_success(db_session: Session):
@@ -119,3 +129,166 @@ def test_roll_merchant_key(db_session: Session, test_user, tes_api_key):
 
 
 
+def test_api_key_resolves_by_lookup_id(db_session: Session, test_user, tes_api_key):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    api_key, raw_key = MerchantService.create_api_key(db=db_session, user_id=merchant.user_id, key_data=tes_api_key)
+    assert raw_key.startswith(f"pk_live_{api_key.lookup_id}_")
+    assert api_key.key_digest is not None
+    assert find_api_key(raw_key, db_session).id == api_key.id
+    assert find_api_key(raw_key + "x", db_session) is None
+
+def test_invalid_new_format_key_never_reaches_the_legacy_scan(db_session: Session, test_user, tes_api_key, monkeypatch):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    api_key, raw_key = MerchantService.create_api_key(db=db_session, user_id=merchant.user_id, key_data=tes_api_key)
+    db_session.add(db_models.APIKey(merchant_id=merchant.merchant_id, name="old", api_key=hash_password("sk_test_legacy"),
+                                    key_prefix="sk_test_", key_type="secret", environment="test", is_active=True))
+    db_session.commit()
+    verify_calls = []
+    monkeypatch.setattr(oauth2, "verify_password", lambda *args: verify_calls.append(args) or False)
+
+    wrong_secret = raw_key[:raw_key.rindex("_") + 1] + "wrong-secret"
+    assert find_api_key(wrong_secret, db_session) is None
+    api_key.is_active = False
+    db_session.commit()
+    assert find_api_key(raw_key, db_session) is None
+    assert verify_calls == []
+
+def test_legacy_api_key_gets_digest_backfilled(db_session: Session, test_user):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    raw_key = "sk_test_legacy-key_value"
+    legacy = db_models.APIKey(merchant_id=merchant.merchant_id, name="old", api_key=hash_password(raw_key),
+                              key_prefix="sk_test_", key_type="secret", environment="test", is_active=True)
+    db_session.add(legacy)
+    db_session.commit()
+    pending = db_models.APIKey(merchant_id=merchant.merchant_id, name="unsaved", api_key="x",
+                               key_prefix="sk_test_", key_type="secret", environment="test", is_active=True)
+    db_session.add(pending)
+    assert find_api_key(raw_key, db_session).id == legacy.id
+    assert legacy.key_digest == api_key_digest(raw_key)
+    # The backfill commits on its own; whatever the request had pending is not committed with it.
+    db_session.rollback()
+    assert db_session.query(db_models.APIKey).filter_by(name="unsaved").count() == 0
+    assert db_session.get(db_models.APIKey, legacy.id).key_digest == api_key_digest(raw_key)
+
+def test_api_key_usage_is_written_behind(db_session: Session, test_user, tes_api_key, monkeypatch):
+    monkeypatch.setattr(api_key_usage.settings, "API_KEY_USAGE_FLUSH_SECONDS", 3600)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    api_key, raw_key = MerchantService.create_api_key(db=db_session, user_id=merchant.user_id, key_data=tes_api_key)
+    api_key_usage.flush(db_session)
+
+    for _ in range(3):
+        assert get_user_from_api_key(raw_key, db_session).id == test_user.id
+    db_session.refresh(api_key)
+    assert api_key.last_used_at is None
+
+    assert api_key_usage.flush(db_session) == 1
+    db_session.refresh(api_key)
+    assert api_key.last_used_at is not None
+    usage = MerchantService.get_api_key_usage(db=db_session, user_id=test_user.id, key_id=api_key.id, days=7)
+    assert usage["total_requests"] == 3
+    assert len(usage["days"]) == 7
+    assert usage["days"][-1]["request_count"] == 3
+
+
+def test_api_key_usage_survives_a_failed_redis_drain(db_session: Session, test_user, tes_api_key, fake_redis, monkeypatch):
+    monkeypatch.setattr(api_key_usage.settings, "API_KEY_USAGE_FLUSH_SECONDS", 3600)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    api_key, raw_key = MerchantService.create_api_key(db=db_session, user_id=merchant.user_id, key_data=tes_api_key)
+    for _ in range(2):
+        assert get_user_from_api_key(raw_key, db_session).id == test_user.id
+
+    pipeline = fake_redis.pipeline
+
+    def failing_pipeline(transaction=True):
+        pipe = pipeline(transaction=transaction)
+        if transaction:
+            monkeypatch.setattr(pipe, "execute", lambda: (_ for _ in ()).throw(redis.ConnectionError("connection lost")))
+        return pipe
+
+    monkeypatch.setattr(fake_redis, "pipeline", failing_pipeline)
+    assert api_key_usage.flush(db_session) == 0
+    # Nothing was drained, so nothing is stranded under another key.
+    assert sorted(fake_redis.keys("api_key_usage:*")) == ["api_key_usage:counts", "api_key_usage:last_used"]
+
+    monkeypatch.setattr(fake_redis, "pipeline", pipeline)
+    assert api_key_usage.flush(db_session) == 1
+    assert fake_redis.keys("api_key_usage:*") == []
+    usage = MerchantService.get_api_key_usage(db=db_session, user_id=test_user.id, key_id=api_key.id, days=1)
+    assert usage["total_requests"] == 2
+
+
+def test_admin_merchant_search_ranks_exact_prefix_and_substring_matches(db_session: Session):
+    owners = [
+        ("Ada Lovelace", "ada@example.com", "merch_ada"),
+        ("Adam Smith", "adam.smith@example.com", "merch_smith"),
+        ("Grace Hopper", "grace@adastra.io", "merch_grace"),
+        ("Alan Turing", "alan@example.com", "merch_alan"),
+        ("Under_score", "u100%@example.com", "merch_u"),
+    ]
+    for name, email, merchant_id in owners:
+        user = db_models.User(name=name, email=email, password="x", country="NG")
+        db_session.add(user)
+        db_session.flush()
+        db_session.add(db_models.MerchantAccount(merchant_id=merchant_id, user_id=user.id, currency="NGN"))
+    db_session.commit()
+
+    def search(term):
+        return [m.merchant_id for m in AdminService.get_all_merchants(db_session, search=term)["merchants"]]
+
+    # Exact email beats prefix matches, which beat a substring of an email domain.
+    assert search("ada@example.com") == ["merch_ada"]
+    assert search("ADA") == ["merch_ada", "merch_smith", "merch_grace"]
+    # Terms shorter than a trigram match by prefix only.
+    assert search("al") == ["merch_alan"]
+    # LIKE wildcards in the term are literal.
+    assert search("100%") == ["merch_u"]
+    assert search("a_a") == []
+    result = AdminService.get_all_merchants(db_session, search="example", limit=2)
+    assert (result["total"], len(result["merchants"])) == (None, 2)
+    # Only a bounded candidate set is ranked, but exact matches are always in it.
+    assert len(MerchantSearchService.search_query(db_session, "example", candidates=1).all()) == 1
+    bounded = MerchantSearchService.search_query(db_session, "alan@example.com", candidates=1).all()
+    assert bounded[0].merchant_id == "merch_alan"
+
+
+def test_balance_history_pages_streams_and_rolls_up(db_session: Session, monkeypatch):
+    start = datetime(2026, 3, 2, 12)  # a Monday
+    db_session.execute(insert(db_models.LedgerTransaction), [
+        {"merchant_id": "merch_hist", "transaction_type": db_models.TransactionType.CHARGE, "amount": Decimal("10.00"),
+         "currency": "NGN", "debit_account_id": 1, "credit_account_id": 2, "created_at": start + timedelta(days=i)}
+        for i in range(9)
+    ] + [
+        {"merchant_id": "merch_other", "transaction_type": db_models.TransactionType.CHARGE, "amount": Decimal("1.00"),
+         "currency": "NGN", "debit_account_id": 1, "credit_account_id": 3, "created_at": start}
+    ])
+    db_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = MerchantService.get_merchant_balance_history(db_session, "merch_hist", limit=4, cursor=cursor)
+        seen.extend(entry.created_at for entry in page)
+        if cursor is None:
+            break
+    assert seen == [start + timedelta(days=i) for i in reversed(range(9))]
+
+    weeks = MerchantService.get_merchant_balance_history_buckets(db_session, "merch_hist", "week")
+    assert [(str(b["period"]), b["count"], Decimal(b["amount"])) for b in weeks] == [
+        ("2026-03-09", 2, Decimal("20.00")), ("2026-03-02", 7, Decimal("70.00")),
+    ]
+    months = MerchantService.get_merchant_balance_history_buckets(db_session, "merch_hist", "month")
+    assert [(str(b["period"]), b["transaction_type"], b["count"]) for b in months] == [("2026-03-01", "CHARGE", 9)]
+    assert len(MerchantService.get_merchant_balance_history_buckets(db_session, "merch_hist", "day")) == 9
+
+    monkeypatch.setattr(merchant_router, "SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    monkeypatch.setattr(merchant_router.settings, "BALANCE_HISTORY_STREAM_BATCH_SIZE", 4)
+    chunks = list(merchant_router._export_balance_history("merch_hist", "csv"))
+    lines = "".join(chunks).splitlines()
+    assert len(chunks) == 3
+    assert lines[0] == "charge_id,transaction_type,amount,currency,created_at"
+    assert len(lines) == 10 and lines[1] == ",CHARGE,10.0000,NGN,2026-03-10T12:00:00"
+    assert len("".join(merchant_router._export_balance_history("merch_hist", "ndjson")).splitlines()) == 9
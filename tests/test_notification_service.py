@@ -0,0 +1,39 @@
+from sqlalchemy import event
+
+from app.models.db_models import Notification
+from app.schemas import merchant as mer_schema
+from app.services.merchant_service import MerchantService
+from app.services.notification_service import NotificationService
+from app.services.user_service import UserService
+
+
+def test_unread_counter_tracks_creates_and_reads(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant_id = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id).merchant_id
+    assert NotificationService.get_unread_count(db_session, merchant_id) == 0
+
+    first = NotificationService.create_notification(db_session, merchant_id, user.id, "payout.created", "Payout requested")
+    assert NotificationService.bulk_create(db_session, [
+        {"merchant_id": merchant_id, "user_id": user.id, "type": "charge.succeeded", "message": f"Charge {i}"}
+        for i in range(4)
+    ]) == 4
+    db_session.commit()
+
+    engine = db_session.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert NotificationService.get_unread_count(db_session, merchant_id) == 5
+        assert len(statements) == 1 and "FROM notification_counters" in statements[0]
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    NotificationService.mark_read(db_session, merchant_id, first.id)
+    NotificationService.mark_read(db_session, merchant_id, first.id)  # already read: no double decrement
+    assert NotificationService.get_unread_count(db_session, merchant_id) == 4
+
+    NotificationService.mark_all_read(db_session, merchant_id)
+    assert NotificationService.get_unread_count(db_session, merchant_id) == 0
+    assert db_session.query(Notification).filter_by(merchant_id=merchant_id, is_read=False).count() == 0
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+
+from app.models.db_models import Charge
+from app.services.admin_service import AdminService
+from app.services.user_service import UserService
+from app.utilities import row_counts
+from app.utilities.cache import TwoTierCache
+from app.utilities.exceptions import InvalidCursorError
+
+
+@pytest.fixture(autouse=True)
+def fresh_counts(monkeypatch):
+    monkeypatch.setattr(row_counts, "_cache", TwoTierCache("row_counts", ttl=30, local_ttl=30))
+
+
+def test_cursor_pages_walk_every_row_once_newest_first(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    start = datetime(2026, 1, 1)
+    # Pairs of charges share a created_at, so pages must break ties on id.
+    db_session.execute(insert(Charge), [
+        {"id": f"ch_{i:03d}", "user_id": user.id, "description": "x", "amount": 1, "currency": "NGN",
+         "status": "succeeded", "created_at": start + timedelta(seconds=i // 2)}
+        for i in range(25)
+    ])
+    db_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = AdminService.get_all_transactions(db_session, limit=4, cursor=cursor, include_total=cursor is None)
+        seen.extend(charge.id for charge in page["transactions"])
+        assert (page["total"] == 25) if cursor is None else page["total"] is None
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"ch_{i:03d}" for i in reversed(range(25))]
+
+    # Offset paging still works, in the same order.
+    offset_page = AdminService.get_all_transactions(db_session, skip=4, limit=4)
+    assert [charge.id for charge in offset_page["transactions"]] == seen[4:8]
+
+    with pytest.raises(InvalidCursorError):
+        AdminService.get_all_transactions(db_session, limit=4, cursor="not-a-cursor")
+
+
+def test_admin_counts_are_cached_and_estimated_only_when_large(db_session, test_new_user, monkeypatch):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    db_session.execute(insert(Charge), [
+        {"id": f"ch_{i}", "user_id": user.id, "description": "x", "amount": 1, "currency": "NGN", "status": "succeeded"}
+        for i in range(3)
+    ])
+    db_session.commit()
+
+    page = AdminService.get_all_transactions(db_session, limit=2)
+    assert (page["total"], page["is_estimate"]) == (3, False)
+
+    engine = db_session.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        AdminService.get_all_transactions(db_session, limit=2)
+        assert not any("count(" in statement.lower() for statement in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # A planner estimate above the threshold is returned as is, and flagged.
+    monkeypatch.setattr(row_counts, "estimate", lambda db, query: 2_500_000)
+    page = AdminService.get_audit_logs(db_session, limit=2)
+    assert (page["total"], page["is_estimate"]) == (2_500_000, True)
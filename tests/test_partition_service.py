@@ -0,0 +1,19 @@
+from datetime import date, datetime
+
+from app.services.partition_service import PartitionService, _partition_month, add_months, partition_name
+
+
+def test_partition_months_and_names():
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -13) == date(2024, 12, 1)
+    name = partition_name("audit_logs", date(2026, 3, 1))
+    assert name == "audit_logs_p202603"
+    assert _partition_month("audit_logs", name) == date(2026, 3, 1)
+    assert _partition_month("audit_logs", "audit_logs_default") is None
+
+
+def test_partition_upkeep_skips_unpartitioned_tables(db_session, tmp_path):
+    assert not PartitionService.is_partitioned(db_session, "ledger_transactions")
+    assert PartitionService.ensure_partitions(db_session, now=datetime(2026, 10, 17)) == []
+    assert PartitionService.archive_partitions(db_session, archive_dir=str(tmp_path)) == []
+    assert list(tmp_path.iterdir()) == []
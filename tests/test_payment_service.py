@@ -1,10 +1,37 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
-from app.models.db_models import Charge, LedgerTransaction
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.models.db_models import Account, AccountType, AuditLog, Charge, LedgerCheckpoint, LedgerTransaction, Notification, OutboxEvent, Payout, PayoutStatus, SettlementRun, TransactionType, User, WebhookDelivery
+from app.celery_worker import celery_app
+from app.routers import admin_router
+from app.schemas.charges import ChargeCreate
 from app.schemas import merchant as mer_schema
+from app.services.balance_service import BalanceService
 from app.services.merchant_service import MerchantService
+from app.services.merchant_stats_service import MerchantStatsService
+from app.services.outbox_service import OutboxService
+from app.services.ledger_service import LedgerService
 from app.services.payment_service import ChargeService
+from app.services.payout_service import PayoutService
+from app.services.platform_account_service import PlatformAccountService
+from app.services.settlement_service import SettlementService
 from app.services.user_service import UserService
+from app.services.webhook_delivery_engine import WebhookDeliveryEngine
+from app.services.webhook_service import WebhookService
+from app.utilities import balance_cache
+from app.utilities.cache import TwoTierCache
+from app.utilities.config import settings
+import app.services.payout_service as payout_service
+import app.tasks as tasks_module
 
 
 def test_create_new_charge(db_session, test_new_charge, test_new_user):
@@ -23,3 +50,415 @@ def test_create_new_charge(db_session, test_new_charge, test_new_user):
     assert count_after == count_before + 1
     assert charge_db.idempotency_key == new_charge.idempotency_key
     assert charge_db and ledger is not None
+
+
+def test_create_charges_batch_dedupes_idempotency_keys(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    first = ChargeService.create_charge(
+        db=db_session, user=user,
+        charge_data=ChargeCreate(amount=Decimal('10.00'), currency="NGN", description="inv-0", idempotency_key="inv-0")
+    )
+
+    items = [
+        ChargeCreate(amount=Decimal('10.00'), currency="NGN", description="inv-0", idempotency_key="inv-0"),
+        ChargeCreate(amount=Decimal('20.00'), currency="NGN", description="inv-1", idempotency_key="inv-1"),
+        ChargeCreate(amount=Decimal('20.00'), currency="NGN", description="inv-1", idempotency_key="inv-1"),
+        ChargeCreate(amount=Decimal('30.00'), currency="ngn", description="no key"),
+    ]
+    results = ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    assert [r["status"] for r in results] == ["duplicate", "created", "duplicate", "created"]
+    assert results[0]["charge"].id == first.id
+    assert results[1]["charge"].id == results[2]["charge"].id
+    assert results[3]["charge"].currency == "NGN"
+    assert all(r["charge"].status == "succeeded" for r in results)
+    assert db_session.query(Charge).filter_by(user_id=user.id).count() == 3
+
+
+def test_platform_revenue_is_sharded_and_rolled_up(db_session, test_new_user, monkeypatch):
+    monkeypatch.setattr(settings, "PLATFORM_ACCOUNT_SHARDS", 4)
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    items = [ChargeCreate(amount=Decimal('50.00'), currency="NGN", description=f"c{i}") for i in range(12)]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    shards = db_session.query(Account).filter_by(account_type=AccountType.PLATFORM_REVENUE, currency="NGN").all()
+    assert len(shards) > 1
+    assert PlatformAccountService.get_balance(db_session, AccountType.PLATFORM_REVENUE, "NGN") == Decimal('12.00')
+
+    assert PlatformAccountService.rollup_shards(db_session) >= 1
+    db_session.expire_all()
+    balances = {a.shard: a.balance for a in db_session.query(Account).filter_by(account_type=AccountType.PLATFORM_REVENUE)}
+    assert balances[0] == Decimal('12.00')
+    assert all(balance == 0 for shard, balance in balances.items() if shard)
+    assert PlatformAccountService.get_balance(db_session, AccountType.PLATFORM_REVENUE, "NGN") == Decimal('12.00')
+
+
+def test_charge_events_are_relayed_from_the_outbox(db_session, test_new_user, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_DELIVERY_BACKEND", "engine")
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    charges_hook = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://a.example.com/hook", "events": "charge.*", "secret": "s"})
+    WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://b.example.com/hook", "events": "payout.succeeded", "secret": "s"})
+    items = [ChargeCreate(amount=Decimal('10.00'), currency="NGN", description=f"c{i}") for i in range(3)]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    # The charge tasks only wrote outbox events, in their ledger transaction.
+    assert db_session.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).count() == 3
+    assert db_session.query(Notification).filter_by(type="charge.succeeded").count() == 0
+    assert db_session.query(WebhookDelivery).count() == 0
+
+    Session = sessionmaker(bind=db_session.get_bind())
+    assert OutboxService.drain(Session) == 3
+    assert OutboxService.drain(Session) == 0
+    db_session.expire_all()
+    assert db_session.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).count() == 0
+    assert db_session.query(Notification).filter_by(type="charge.succeeded", merchant_id=merchant.merchant_id).count() == 3
+    deliveries = db_session.query(WebhookDelivery).all()
+    assert [(d.webhook_id, d.event, d.status) for d in deliveries] == [(charges_hook.id, "charge.succeeded", "pending")] * 3
+    assert sorted(json.loads(d.payload)["charge_id"] for d in deliveries) == sorted(
+        c.id for c in db_session.query(Charge).filter_by(user_id=user.id)
+    )
+
+
+def test_deliveries_stranded_by_a_failed_dispatch_are_swept(db_session, test_new_user, monkeypatch):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://a.example.com/hook", "events": "charge.*", "secret": "s"})
+    items = [ChargeCreate(amount=Decimal('10.00'), currency="NGN", description=f"c{i}") for i in range(2)]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    enqueued = []
+
+    def broker_down(name, args):
+        enqueued.append(args)
+        raise ConnectionError("broker unavailable")
+
+    monkeypatch.setattr(celery_app, "send_task", broker_down)
+    Session = sessionmaker(bind=db_session.get_bind())
+    assert OutboxService.drain(Session) == 2
+    assert len(enqueued) == 1
+    assert [d.status for d in db_session.query(WebhookDelivery)] == ["pending"] * 2
+
+    # Within the grace period the deliveries are left for their Celery tasks.
+    assert WebhookService.release_undispatched(db_session) == 0
+    monkeypatch.setattr(settings, "WEBHOOK_PENDING_GRACE_SECONDS", -1)
+    assert WebhookService.release_undispatched(db_session) == 2
+
+    sent = []
+    transport = httpx.MockTransport(lambda request: sent.append(request) or httpx.Response(200))
+    engine = WebhookDeliveryEngine(Session, transport=transport)
+    assert asyncio.run(engine.run_retries(max_batches=1)) == 2
+    db_session.expire_all()
+    assert [d.status for d in db_session.query(WebhookDelivery)] == ["success"] * 2
+    assert len(sent) == 2
+
+
+def test_deferred_posting_materializes_exact_balances(db_session, test_new_user, monkeypatch):
+    monkeypatch.setattr(settings, "LEDGER_POSTING_MODE", "deferred")
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    items = [ChargeCreate(amount=Decimal('100.00'), currency="NGN", description=f"c{i}") for i in range(3)]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    pending = db_session.query(Account).filter_by(merchant_id=merchant.merchant_id, account_type=AccountType.MERCHANT_PENDING).one()
+    assert pending.balance == 0
+    assert MerchantService.get_merchant_balance(db=db_session, user_id=user.id).pending_balance == Decimal('294.00')
+    assert PlatformAccountService.get_balance(db_session, AccountType.PLATFORM_REVENUE, "NGN") == Decimal('6.00')
+
+    assert LedgerService.materialize(db_session, batch_size=4) == 4
+    assert LedgerService.materialize(db_session) == 2
+    assert LedgerService.materialize(db_session) == 0
+    db_session.expire_all()
+    assert pending.balance == Decimal('294.00')
+    assert db_session.get(type(merchant), merchant.id).pending_balance == Decimal('294.00')
+    assert PlatformAccountService.get_balance(db_session, AccountType.PLATFORM_REVENUE, "NGN") == Decimal('6.00')
+    assert MerchantService.get_merchant_balance(db=db_session, user_id=user.id).pending_balance == Decimal('294.00')
+    assert db_session.query(LedgerCheckpoint).one().last_entry_id == db_session.query(func.max(LedgerTransaction.id)).scalar()
+
+
+def test_settlement_honors_delay_and_schedule(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="weekly")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    items = [ChargeCreate(amount=Decimal('100.00'), currency="NGN", description=f"c{i}") for i in range(3)]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    monday = datetime.now(timezone.utc) + timedelta(days=7 - datetime.now(timezone.utc).weekday())
+    assert SettlementService.settle_pending_funds(db_session, now=monday - timedelta(days=1)) == (0, [])
+    assert SettlementService.settle_pending_funds(db_session, now=monday + timedelta(days=-7)) == (0, [])
+    assert SettlementService.settle_pending_funds(db_session, now=monday, chunk_size=1) == (1, [])
+    # The day's run is complete, so running it again settles nothing more.
+    assert SettlementService.settle_pending_funds(db_session, now=monday) == (1, [])
+
+    db_session.expire_all()
+    merchant = db_session.get(type(merchant), merchant.id)
+    assert merchant.pending_balance == 0
+    assert merchant.available_balance == Decimal('294.00')
+    balances = MerchantService.get_merchant_balance(db=db_session, user_id=user.id)
+    assert balances.pending_balance == 0
+    assert balances.available_balance == Decimal('294.00')
+    assert db_session.query(AuditLog).filter_by(action="FUNDS_SETTLED", merchant_id=merchant.merchant_id).count() == 1
+    assert db_session.query(Notification).filter_by(type="settlement.succeeded").count() == 1
+
+
+def test_settlement_shards_resume_from_checkpoint(db_session):
+    merchants = []
+    for i in range(3):
+        user = UserService.create_user(db=db_session, user_data=User(name="dhee", email=f"m{i}@example.com", password="hashed_password", country="London"))
+        create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+        merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+        merchant.settlement_delay_days = 0
+        db_session.commit()
+        ChargeService.create_charges_batch(db=db_session, user=user, charges=[ChargeCreate(amount=Decimal('100.00'), currency="NGN", description="c")])
+        merchants.append(merchant)
+
+    run = SettlementService.start_run(db_session, shard_count=2)
+    assert SettlementService.start_run(db_session).id == run.id
+    SettlementService.settle_shard(db_session, run.id, 1, chunk_size=1)
+    # A re-delivered shard resumes from its checkpoint and settles nothing twice.
+    SettlementService.settle_shard(db_session, run.id, 1)
+    run = SettlementService.finish_run(db_session, run.id)
+    assert run.status == "running"
+    assert run.merchants_settled == 2
+    assert SettlementService.pending_shards(db_session, run.id) == [0]
+
+    tasks_module.settle_pending_funds_task.run()
+    db_session.expire_all()
+    run = db_session.get(SettlementRun, run.id)
+    assert run.status == "completed"
+    assert run.merchants_settled == 3
+    assert json.loads(run.totals) == {"NGN": "294.0000"}
+    for merchant in merchants:
+        assert db_session.get(type(merchant), merchant.id).available_balance == Decimal('98.00')
+    assert db_session.query(LedgerTransaction).filter_by(description="settlement").count() == 3
+
+
+def test_failed_shard_hands_off_committed_deliveries_and_fails_the_run(db_session, monkeypatch):
+    for i in range(2):
+        user = UserService.create_user(db=db_session, user_data=User(name="dhee", email=f"f{i}@example.com", password="hashed_password", country="London"))
+        create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+        merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+        merchant.settlement_delay_days = 0
+        db_session.commit()
+        WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": f"https://{i}.example.com/hook", "events": "settlement.*", "secret": "s"})
+        ChargeService.create_charges_batch(db=db_session, user=user, charges=[ChargeCreate(amount=Decimal('100.00'), currency="NGN", description="c")])
+
+    run = SettlementService.start_run(db_session, shard_count=1)
+    settle_chunk = SettlementService._settle_chunk
+    chunks = []
+
+    def second_chunk_fails(db, merchant_ids, cutoffs):
+        chunks.append(merchant_ids)
+        if len(chunks) == 2:
+            raise RuntimeError("worker lost")
+        return settle_chunk(db, merchant_ids, cutoffs)
+
+    monkeypatch.setattr(SettlementService, "_settle_chunk", staticmethod(second_chunk_fails))
+    handed_off = []
+    with pytest.raises(RuntimeError):
+        SettlementService.settle_shard(db_session, run.id, 0, chunk_size=1, on_chunk=handed_off.append)
+    db_session.rollback()
+    # The first chunk's delivery was handed off as soon as its chunk committed.
+    assert handed_off == [[db_session.query(WebhookDelivery.id).scalar()]]
+
+    dispatched = []
+    monkeypatch.setattr(tasks_module, "chord", lambda header: lambda callback: dispatched.append(callback))
+    tasks_module.settle_pending_funds_task.run()
+    [callback] = dispatched
+    assert [errback["task"] for errback in callback.options["link_error"]] == ["app.tasks.fail_settlement_run_task"]
+
+    # A shard failing for good runs the chord's error callback instead of finish_settlement_run_task.
+    tasks_module.fail_settlement_run_task(None, RuntimeError("worker lost"), None, run_id=run.id)
+    db_session.expire_all()
+    run = db_session.get(SettlementRun, run.id)
+    assert (run.status, run.error) == ("failed", "RuntimeError: worker lost")
+
+    # The next run for the day resumes it.
+    monkeypatch.setattr(SettlementService, "_settle_chunk", staticmethod(settle_chunk))
+    assert SettlementService.settle_pending_funds(db_session, now=run.as_of)[0] == 2
+    db_session.expire_all()
+    assert (run.status, run.error) == ("completed", None)
+
+
+def test_balance_recompute_reports_and_corrects_drift(db_session):
+    merchants = []
+    for i in range(3):
+        user = UserService.create_user(db=db_session, user_data=User(name="dhee", email=f"r{i}@example.com", password="hashed_password", country="London"))
+        create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+        merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+        ChargeService.create_charges_batch(db=db_session, user=user, charges=[ChargeCreate(amount=Decimal('100.00'), currency="NGN", description="c")])
+        merchants.append(merchant)
+    assert BalanceService.recalculate_merchant_balance(db_session, merchants[0].merchant_id) == []
+
+    drifted = merchants[1]
+    pending = db_session.query(Account).filter_by(merchant_id=drifted.merchant_id, account_type=AccountType.MERCHANT_PENDING).one()
+    pending.balance = Decimal('1.00')
+    drifted.available_balance = Decimal('5.00')
+    db_session.commit()
+
+    Session = sessionmaker(bind=db_session.get_bind())
+    report = list(BalanceService.recalculate_all(Session, chunk_size=2))
+    assert {row["account_type"]: (row["stored"], row["mirrored"], row["recomputed"]) for row in report} == {
+        AccountType.MERCHANT_PENDING: (Decimal('1.00'), Decimal('98.00'), Decimal('98.00')),
+        AccountType.MERCHANT_AVAILABLE: (0, Decimal('5.00'), 0),
+    }
+    # A dry run changes nothing.
+    assert len(BalanceService.recalculate_merchant_balance(db_session, drifted.merchant_id, apply=False)) == 2
+
+    assert len(list(BalanceService.recalculate_all(Session, apply=True, chunk_size=2))) == 2
+    assert list(BalanceService.recalculate_all(Session)) == []
+    db_session.expire_all()
+    assert pending.balance == Decimal('98.00')
+    assert (drifted.pending_balance, drifted.available_balance) == (Decimal('98.00'), 0)
+
+
+def test_admin_sync_balances_corrects_drift(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=[ChargeCreate(amount=Decimal('100.00'), currency="NGN", description="c")])
+    merchant.pending_balance = Decimal('1.00')
+    merchant.available_balance = Decimal('5.00')
+    db_session.commit()
+
+    admin = UserService.create_user(db=db_session, user_data=User(name="admin", email="admin@example.com", password="hashed_password", country="London"))
+    admin.is_superadmin = True
+    db_session.commit()
+    request = Request({"type": "http", "method": "POST", "headers": [], "client": ("testclient", 0)})
+
+    def sync(merchant_id):
+        return asyncio.run(admin_router.sync_merchant_balances(merchant_id=merchant_id, request=request, db=db_session, current_user=admin))
+
+    result = sync(merchant.merchant_id)
+    assert {row["account_type"]: row["recomputed"] for row in result["drift"]} == {
+        AccountType.MERCHANT_PENDING: Decimal('98.00'),
+        AccountType.MERCHANT_AVAILABLE: 0,
+    }
+    db_session.expire_all()
+    assert (merchant.pending_balance, merchant.available_balance) == (Decimal('98.00'), 0)
+    assert sync(merchant.merchant_id)["drift"] == []
+
+    with pytest.raises(HTTPException) as missing:
+        sync("merch_missing")
+    assert missing.value.status_code == 404
+
+
+def test_balance_reads_are_cached_until_a_posting_bumps_the_version(db_session, test_new_user, fake_redis, monkeypatch):
+    monkeypatch.setattr(balance_cache, "_cache", TwoTierCache("balance", ttl=60, local_ttl=60))
+    balance_cache.reset_stats()
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    charge = [ChargeCreate(amount=Decimal('100.00'), currency="NGN", description="c")]
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=charge)
+
+    assert MerchantService.get_merchant_balance(db=db_session, user_id=user.id).pending_balance == Decimal('98.00')
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert MerchantService.get_merchant_balance(db=db_session, user_id=user.id).pending_balance == Decimal('98.00')
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert statements == []
+
+    # The charge task's posting bumps the version once it commits.
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=charge)
+    assert MerchantService.get_merchant_balance(db=db_session, user_id=user.id).pending_balance == Decimal('196.00')
+    assert balance_cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_merchant_daily_stats_roll_up_and_backfill_alike(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    items = [ChargeCreate(amount=Decimal('100.00'), currency="NGN", description=f"c{i}") for i in range(3)]
+    items.append(ChargeCreate(amount=Decimal('5.00'), currency="USD", description="mismatch"))
+    ChargeService.create_charges_batch(db=db_session, user=user, charges=items)
+
+    entry = db_session.query(LedgerTransaction).filter_by(transaction_type=TransactionType.CHARGE).first()
+
+    def refund(entry_id):
+        db_session.add(LedgerTransaction(
+            id=entry_id, merchant_id=merchant.merchant_id, transaction_type=TransactionType.REFUND,
+            amount=Decimal('10.00'), currency="NGN",
+            debit_account_id=entry.credit_account_id, credit_account_id=entry.debit_account_id,
+        ))
+        db_session.commit()
+
+    last_id = db_session.query(func.max(LedgerTransaction.id)).scalar()
+    refund(last_id + 10)
+    assert MerchantStatsService.rollup(db_session, batch_size=2) == 2
+    assert MerchantStatsService.rollup(db_session) > 0
+    assert MerchantStatsService.rollup(db_session) == 0
+    # An entry that commits after a higher id was rolled up is still picked up.
+    refund(last_id + 5)
+    assert MerchantStatsService.rollup(db_session) == 1
+    assert MerchantStatsService.rollup(db_session) == 0
+
+    today = datetime.now(timezone.utc).date()
+    report = MerchantStatsService.series(db_session, today - timedelta(days=6), today, "week", merchant.merchant_id)
+    totals = {t["currency"]: t for t in report["totals"]}
+    assert totals["NGN"]["charge_count"] == 3
+    assert totals["NGN"]["gross_volume"] == Decimal('300.00')
+    assert totals["NGN"]["fees"] == Decimal('6.00')
+    assert totals["NGN"]["net_volume"] == Decimal('294.00')
+    assert totals["USD"]["failed_charge_count"] == 1
+    assert totals["NGN"]["refund_count"] == 2
+    assert totals["NGN"]["refund_volume"] == Decimal('20.00')
+    assert len(report["series"]) <= 4
+
+    rolled_up = MerchantStatsService.series(db_session, today - timedelta(days=1), today, merchant_id=merchant.merchant_id)
+    assert MerchantStatsService.backfill(db_session, today - timedelta(days=1), today) == 2
+    assert MerchantStatsService.series(db_session, today - timedelta(days=1), today, merchant_id=merchant.merchant_id) == rolled_up
+
+
+def test_settlement_reports_are_paged_aggregated_and_cached(db_session, test_new_user, monkeypatch):
+    monkeypatch.setattr(payout_service, "_report_cache", TwoTierCache("settlement_report", ttl=60, local_ttl=60))
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    start = datetime(2026, 3, 2, 12)
+    statuses = [PayoutStatus.SUCCEEDED] * 4 + [PayoutStatus.PENDING]
+    db_session.execute(insert(Payout), [
+        {"id": i + 1, "merchant_id": merchant.merchant_id, "payout_account_id": 1, "amount": Decimal(100 * (i + 1)),
+         "currency": "NGN", "status": status, "created_at": start + timedelta(days=i)}
+        for i, status in enumerate(statuses)
+    ])
+    entries = []
+    for payout_id in range(1, 6):
+        for transaction_type, amount in ((TransactionType.PAYOUT, Decimal(100 * payout_id)), (TransactionType.FEE, Decimal('0.50')), (TransactionType.REFUND, Decimal('1.00'))):
+            entries.append({"payout_id": payout_id, "merchant_id": merchant.merchant_id, "transaction_type": transaction_type, "amount": amount,
+                            "currency": "NGN", "debit_account_id": 1, "credit_account_id": 2})
+    db_session.execute(insert(LedgerTransaction), entries)
+    db_session.commit()
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = PayoutService.list_settlement_reports(db_session, user.id, limit=2, cursor=cursor)
+        pages.append([r["payout_id"] for r in page])
+        if cursor is None:
+            break
+    assert pages == [[5, 4], [3, 2], [1]]
+    report = PayoutService.get_settlement_report(db_session, user.id, 3)
+    assert (report["total_transactions"], report["total_amount"], report["total_fees"], report["total_refunds"]) == (3, Decimal('300'), Decimal('0.50'), Decimal('1.00'))
+    assert report["net_settlement"] == Decimal('298.50')
+
+    # Settled payouts come from the cache; only the pending one is aggregated again.
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        reports, _ = PayoutService.list_settlement_reports(db_session, user.id, limit=10)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert [r["net_settlement"] for r in reports] == [Decimal(100 * i) - Decimal('1.50') for i in range(5, 0, -1)]
+    aggregates = [s for s in statements if "GROUP BY" in s]
+    assert len(aggregates) == 1 and "ledger_transactions.payout_id IN" in aggregates[0]
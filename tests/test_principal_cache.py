@@ -0,0 +1,75 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.schemas import merchant as mer_schema
+from app.services.merchant_service import MerchantService
+from app.services.payout_service import PayoutService
+from app.services.user_service import UserService
+from app.utilities import principal_cache
+from app.utilities.Oauth2 import create_access_token, get_current_user
+
+
+def test_cached_principal_attaches_without_queries(db_session, test_user):
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    key = principal_cache.jwt_cache_key("token-for-test")
+    principal_cache.put(key, test_user)
+
+    engine = db_session.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    other = Session(bind=engine)
+    try:
+        user = principal_cache.attach(other, principal_cache.get(key))
+        assert user.email == test_user.email
+        assert user.merchant_info.merchant_id == merchant.merchant_id
+        assert statements == []
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+        other.close()
+        principal_cache.invalidate_user(test_user.id)
+
+
+def test_password_change_invalidates_cached_principal(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    key = principal_cache.jwt_cache_key("token-for-password-test")
+    principal_cache.put(key, user)
+    assert principal_cache.get(key) is not None
+
+    UserService.change_user_password(
+        db=db_session,
+        user=user,
+        old_password="hashed_password",
+        new_password="new_secure_password",
+        confirm_password="new_secure_password",
+    )
+    db_session.commit()
+    assert principal_cache.get(key) is None
+
+
+def test_repeated_jwt_requests_use_the_cached_principal(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    token = create_access_token({"sub": str(user.id)})
+    try:
+        assert get_current_user(token=token, db=db_session).id == user.id
+        assert principal_cache.get(principal_cache.jwt_cache_key(token)) is not None
+        assert get_current_user(token=token, db=db_session).id == user.id
+    finally:
+        principal_cache.invalidate_user(user.id)
+
+
+def test_merchant_changes_invalidate_cached_principal(db_session, test_user):
+    key = principal_cache.jwt_cache_key("token-for-merchant-test")
+    principal_cache.put(key, test_user)
+    assert principal_cache.get(key)["merchant"] is None
+
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=test_user.id)
+    assert principal_cache.get(key) is None
+
+    db_session.refresh(test_user)
+    principal_cache.put(key, test_user)
+    assert principal_cache.get(key)["merchant"]["settlement_schedule"] == "daily"
+    PayoutService.update_settlement_schedule(db=db_session, user_id=test_user.id, schedule={"schedule": "weekly", "delay_days": 3})
+    assert principal_cache.get(key) is None
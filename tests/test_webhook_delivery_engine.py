@@ -0,0 +1,180 @@
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models import db_models
+from app.schemas import merchant as mer_schema
+from app.services.merchant_service import MerchantService
+from app.services.user_service import UserService
+from app.services.webhook_delivery_engine import WebhookDeliveryEngine
+from app.services.webhook_service import WebhookService
+from app.utilities import webhook_circuit
+from app.utilities.config import settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_circuits(monkeypatch):
+    monkeypatch.setattr(webhook_circuit, "_local", {})
+    monkeypatch.setattr(webhook_circuit, "_local_probes", {})
+
+
+def test_engine_delivers_with_per_endpoint_limit(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    fast = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://fast.example.com/hook", "events": "*", "secret": "s"})
+    slow = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://slow.example.com/hook", "events": "*", "secret": "s"})
+    failing = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://down.example.com/hook", "events": "*", "secret": "s"})
+    deliveries = [
+        WebhookService.record_delivery(db_session, hook.id, "charge.succeeded", {"n": i})
+        for i in range(6) for hook in (fast, slow)
+    ] + [WebhookService.record_delivery(db_session, failing.id, "charge.succeeded", {"n": 0})]
+
+    active = defaultdict(int)
+    peak = defaultdict(int)
+    received = []
+
+    async def handler(request: httpx.Request):
+        host = request.url.host
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.05 if host.startswith("slow") else 0.001)
+        active[host] -= 1
+        received.append(json.loads(request.content))
+        return httpx.Response(500 if host.startswith("down") else 200, text="ok")
+
+    async def run():
+        engine = WebhookDeliveryEngine(sessionmaker(bind=db_session.get_bind()), max_in_flight=8, per_endpoint_concurrency=2, transport=httpx.MockTransport(handler))
+        while True:
+            # Stop only once a claim made with nothing in flight finds no work.
+            idle = not engine.in_flight
+            if not await engine.run_once() and idle:
+                break
+            await asyncio.sleep(0.01)
+        await engine.drain()
+        await engine.close()
+
+    asyncio.run(run())
+
+    assert len(received) == len(deliveries)
+    assert peak["slow.example.com"] <= 2
+    db_session.expire_all()
+    statuses = {d.id: (d.status, d.http_status, d.attempts) for d in db_session.query(db_models.WebhookDelivery).all()}
+    assert statuses[deliveries[-1].id] == ("retrying", 500, 1)
+    assert all(statuses[d.id] == ("success", 200, 1) for d in deliveries[:-1])
+    assert db_session.query(db_models.Notification).filter_by(type="webhook.delivery").count() == len(deliveries)
+
+
+def test_failed_deliveries_back_off_and_dead_letter(db_session, test_new_user, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_ATTEMPTS", 3)
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    hook = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://down.example.com/hook", "events": "*", "secret": "s"})
+    delivery = WebhookService.record_delivery(db_session, hook.id, "charge.succeeded", {"n": 0})
+    not_due = WebhookService.record_delivery(db_session, hook.id, "charge.succeeded", {"n": 1})
+    not_due.status, not_due.next_attempt_at = "retrying", datetime.now(timezone.utc) + timedelta(hours=1)
+    db_session.commit()
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content)["n"])
+        return httpx.Response(503)
+
+    def engine():
+        return WebhookDeliveryEngine(sessionmaker(bind=db_session.get_bind()), transport=httpx.MockTransport(handler))
+
+    async def send_fresh():
+        e = engine()
+        await e.run_once()
+        await e.drain()
+        await e.close()
+
+    asyncio.run(send_fresh())
+    db_session.refresh(delivery)
+    assert delivery.status == "retrying"
+    first_delay = (delivery.next_attempt_at.replace(tzinfo=None) - delivery.last_attempt_at.replace(tzinfo=None)).total_seconds()
+    assert settings.WEBHOOK_RETRY_BASE_SECONDS / 2 <= first_delay <= settings.WEBHOOK_RETRY_BASE_SECONDS
+
+    # Nothing is due yet.
+    assert asyncio.run(engine().run_retries(max_batches=5)) == 0
+    for expected_status, attempts in (("retrying", 2), ("dead", 3)):
+        delivery.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db_session.commit()
+        assert asyncio.run(engine().run_retries(max_batches=5)) == 1
+        db_session.refresh(delivery)
+        assert (delivery.status, delivery.attempts) == (expected_status, attempts)
+    assert delivery.next_attempt_at is None
+    assert calls == [0, 0, 0]
+    db_session.refresh(not_due)
+    assert (not_due.status, not_due.attempts) == ("retrying", 0)
+
+
+def test_circuit_opens_parks_deliveries_and_closes_after_probe(db_session, test_new_user, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(webhook_circuit, "_clock", lambda: now[0])
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    down = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://down.example.com/hook", "events": "*", "secret": "s"})
+    healthy = WebhookService.create_webhook(db_session, merchant.merchant_id, {"url": "https://ok.example.com/hook", "events": "*", "secret": "s"})
+    failing = [WebhookService.record_delivery(db_session, down.id, "charge.succeeded", {"n": i}) for i in range(settings.WEBHOOK_CIRCUIT_MIN_SAMPLES)]
+    calls = []
+    recovered = [False]
+
+    def handler(request):
+        calls.append(request.url.host)
+        ok = request.url.host.startswith("ok") or recovered[0]
+        return httpx.Response(200 if ok else 503)
+
+    def send():
+        async def run():
+            engine = WebhookDeliveryEngine(sessionmaker(bind=db_session.get_bind()), per_endpoint_concurrency=8, transport=httpx.MockTransport(handler))
+            while True:
+                # Stop only once a claim made with nothing in flight finds no work.
+                idle = not engine.in_flight
+                if not await engine.run_once() and idle:
+                    break
+                await asyncio.sleep(0.001)
+            await engine.drain()
+            await engine.close()
+        asyncio.run(run())
+
+    send()
+    assert webhook_circuit.admit([down.id], 8)[down.id][0] == 0
+    # The healthy endpoint keeps its full share of concurrency.
+    assert webhook_circuit.admit([healthy.id], 8)[healthy.id] == (8, None)
+
+    # While open, new deliveries to the dead endpoint are parked without an attempt.
+    calls.clear()
+    parked = WebhookService.record_delivery(db_session, down.id, "charge.succeeded", {"n": 99})
+    fine = WebhookService.record_delivery(db_session, healthy.id, "charge.succeeded", {"n": 100})
+    send()
+    assert calls == ["ok.example.com"]
+    db_session.refresh(parked)
+    db_session.refresh(fine)
+    assert (parked.status, parked.attempts) == ("retrying", 0)
+    assert parked.next_attempt_at.replace(tzinfo=timezone.utc).timestamp() == now[0] + settings.WEBHOOK_CIRCUIT_OPEN_SECONDS
+    assert fine.status == "success"
+
+    # Once open_until passes the circuit is half-open: exactly one probe gets through.
+    now[0] += settings.WEBHOOK_CIRCUIT_OPEN_SECONDS
+    assert webhook_circuit.admit([down.id], 8)[down.id] == (1, None)
+    assert webhook_circuit.admit([down.id], 8)[down.id][0] == 0
+    webhook_circuit._release_probe(down.id)
+
+    recovered[0] = True
+    parked.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    for delivery in failing:
+        delivery.next_attempt_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    db_session.commit()
+    engine = WebhookDeliveryEngine(sessionmaker(bind=db_session.get_bind()), transport=httpx.MockTransport(handler))
+    assert asyncio.run(engine.run_retries(max_batches=5)) == 1
+    db_session.refresh(parked)
+    assert (parked.status, parked.attempts) == ("success", 1)
+    assert webhook_circuit.admit([down.id], 8)[down.id] == (8, None)
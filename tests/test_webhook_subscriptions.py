@@ -0,0 +1,35 @@
+from sqlalchemy import event
+
+from app.schemas import merchant as mer_schema
+from app.services.merchant_service import MerchantService
+from app.services.user_service import UserService
+from app.services.webhook_service import WebhookService
+from app.utilities import webhook_subscriptions
+
+
+def test_fan_out_uses_cached_subscriptions_and_skips_unsubscribed(db_session, test_new_user):
+    user = UserService.create_user(db=db_session, user_data=test_new_user)
+    create_data = mer_schema.MerchantAccountCreate(currency="NGN", settlement_schedule="daily")
+    merchant = MerchantService.create_merchant_account(db=db_session, data=create_data, user_id=user.id)
+    merchant_id = merchant.merchant_id
+    everything = WebhookService.create_webhook(db_session, merchant_id, {"url": "https://a.example.com/hook", "events": "*", "secret": "s"})
+    charges = WebhookService.create_webhook(db_session, merchant_id, {"url": "https://b.example.com/hook", "events": "charge.*", "secret": "s"})
+    payouts = WebhookService.create_webhook(db_session, merchant_id, {"url": "https://c.example.com/hook", "events": '["payout.succeeded"]', "secret": "s"})
+
+    assert webhook_subscriptions.subscribers(db_session, [merchant_id], "charge.succeeded") == {merchant_id: [everything.id, charges.id]}
+
+    engine = db_session.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert webhook_subscriptions.subscribers(db_session, [merchant_id], "payout.succeeded") == {merchant_id: [everything.id, payouts.id]}
+        assert webhook_subscriptions.subscribers(db_session, [merchant_id], "refund.created") == {merchant_id: [everything.id]}
+        assert not any("webhook_endpoints" in statement for statement in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # Changing an endpoint invalidates the merchant's entry.
+    WebhookService.update_webhook(db_session, merchant_id, everything.id, {"enabled": False})
+    WebhookService.delete_webhook(db_session, merchant_id, payouts.id)
+    assert webhook_subscriptions.subscribers(db_session, [merchant_id], "payout.succeeded") == {}